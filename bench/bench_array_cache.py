@@ -0,0 +1,83 @@
+"""Обращения к элементам массива в циклах: ссылка на массив из статического поля при каждом обращении
+(ldsfld Program::t) и из локальной переменной, в которую она загружается один раз перед циклом.
+Оба варианта MSIL выполняются в msil_sim.py: выводятся выполненные инструкции, загрузки ссылки на массив
+(ldsfld/ldloc по профилю симулятора) и время симуляции, вывод должен совпасть. Кол-во инструкций почти
+не меняется (ldsfld заменяется на ldloc), а выигрыш в CLR - ссылка в регистре после JIT, поэтому время
+симуляции его не показывает; CLR в окружении бенчмарков нет. По умолчанию - миллион обращений к элементам."""
+import argparse
+import io
+import re
+import time
+
+from corpus import array_program, checked_program
+import code_gen
+import msil_sim
+
+
+def executed(code, trips, pattern) -> int:
+    """Сколько раз выполняются строки, подходящие под pattern: строка внутри n-го по порядку цикла (от метки
+    до обратного перехода на нее) выполняется trips[n] раз за каждое выполнение объемлющего цикла"""
+    starts = {}
+    loops = []
+    for i, line in enumerate(code):
+        m = re.match(r'(IL_\d+):', line)
+        if m:
+            starts[m.group(1)] = i
+        m = re.match(r'\s*br (IL_\d+)$', line)
+        if m and m.group(1) in starts:
+            loops.append((starts[m.group(1)], i))
+    loops.sort()
+    count = 0
+    for i, line in enumerate(code):
+        if re.search(pattern, line):
+            times = 1
+            for (start, end), n in zip(loops, trips):
+                if start <= i <= end:
+                    times *= n
+            count += times
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--outer', type=int, default=31250)
+    parser.add_argument('--size', type=int, default=16)
+    args = parser.parse_args()
+
+    # вывод суммы - чтобы сравнить результат вариантов
+    prog = checked_program(array_program(args.outer, args.size) + '\nwriteline(s);')
+    pattern = r'ldsfld int32\[\] Program::t'
+    plan = code_gen.CodeGenerator.array_cache_plan
+    code_gen.CodeGenerator.array_cache_plan = lambda self, body, first_slot: {}
+    try:
+        base = code_gen.CodeGenerator()
+        base.msil_gen_program(prog)
+        before = executed(base.code, (args.outer, args.size), pattern)
+    finally:
+        code_gen.CodeGenerator.array_cache_plan = plan
+
+    start = time.perf_counter()
+    gen = code_gen.CodeGenerator()
+    gen.msil_gen_program(prog)
+    elapsed = time.perf_counter() - start
+    after = executed(gen.code, (args.outer, args.size), pattern)
+    accesses = executed(gen.code, (args.outer, args.size), r'(ld|st)elem')
+    print(f'array element accesses per run: {accesses}')
+    print(f'static array field loads per run: {before} -> {after}')
+    print(f'codegen: {elapsed * 1000:.1f} ms')
+
+    outputs = []
+    for name, lines in (('before', base.code_lines), ('after', gen.code_lines)):
+        assembly = msil_sim.load(lines)
+        out = io.StringIO()
+        start = time.perf_counter()
+        profile = assembly.run(io.StringIO(), out)
+        elapsed = time.perf_counter() - start
+        outputs.append(out.getvalue())
+        print(f'msil_sim {name}: {profile.total} executed ({profile.instructions["ldsfld"]} ldsfld, '
+              f'{profile.instructions["ldloc"]} ldloc), simulated in {elapsed * 1000:.0f} ms')
+    assert outputs[0] == outputs[1], 'разный вывод'
+
+
+if __name__ == '__main__':
+    main()
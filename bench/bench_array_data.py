@@ -0,0 +1,42 @@
+"""Инициализация константных массивов: поэлементно (dup; ldc.i4 i; значение; stelem) и из блока .data
+(один вызов RuntimeHelpers::InitializeArray). CLR в окружении бенчмарков нет, поэтому сравнивается размер
+метода Main, который приходится JIT-компилировать: кол-во инструкций после peephole-оптимизации."""
+import argparse
+import time
+
+from corpus import tables_program, checked_program
+import code_gen
+import peephole
+
+
+def main_instructions(prog) -> int:
+    """Кол-во инструкций метода Main"""
+    gen = code_gen.CodeGenerator()
+    gen.msil_gen_program(prog)
+    lines = peephole.optimize(gen.code_lines)
+    start = next(i for i, line in enumerate(lines) if line.code.strip() == '.method public static void Main()')
+    return peephole.instruction_count(lines[start:])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tables', type=int, default=8)
+    parser.add_argument('--size', type=int, default=256)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    prog = checked_program(tables_program(args.tables, args.size))
+    print(f'parse and check: {(time.perf_counter() - start) * 1000:.0f} ms')
+
+    min_elements = code_gen.ARRAY_DATA_MIN_ELEMENTS
+    code_gen.ARRAY_DATA_MIN_ELEMENTS = args.size + 1
+    try:
+        before = main_instructions(prog)
+    finally:
+        code_gen.ARRAY_DATA_MIN_ELEMENTS = min_elements
+    after = main_instructions(prog)
+    print(f'Main instructions: {before} -> {after} ({before / after:.0f}x less)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Выполнение набора небольших программ в процессе (closure_exec.py): время разбора и проверки, компиляции
+в замыкания и выполнения на программу. Для сравнения выводится время генерации MSIL, с которой начинается
+выполнение через ilasm и CLR (самих ilasm и CLR в окружении бенчмарков нет)."""
+import argparse
+import io
+import time
+
+from corpus import program, array_program, checked_program
+from code_gen import CodeGenerator
+import closure_exec
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--programs', type=int, default=200)
+    parser.add_argument('--funcs', type=int, default=10)
+    parser.add_argument('--loops', type=int, default=5)
+    args = parser.parse_args()
+
+    sources = [program(args.funcs + i % 5, args.loops + i % 3) if i % 4 else array_program(50 + i, 8)
+               for i in range(args.programs)]
+    check = compile_ = run = gen = 0.0
+    output = 0
+    for src in sources:
+        start = time.perf_counter()
+        prog = checked_program(src)
+        check += time.perf_counter() - start
+
+        start = time.perf_counter()
+        compiled = closure_exec.compile_program(prog)
+        compile_ += time.perf_counter() - start
+
+        out = io.StringIO()
+        start = time.perf_counter()
+        compiled.run(io.StringIO(), out)
+        run += time.perf_counter() - start
+        output += len(out.getvalue())
+
+        start = time.perf_counter()
+        CodeGenerator(None, True).msil_gen_program(prog)
+        gen += time.perf_counter() - start
+
+    per = 1000 / len(sources)
+    print(f'{len(sources)} programs, {output} chars of output')
+    print(f'parse + check: {check * per:.2f} ms/program')
+    print(f'closure compile: {compile_ * per:.2f} ms/program, run: {run * per:.2f} ms/program')
+    print(f'msil generation (before ilasm and CLR): {gen * per:.2f} ms/program')
+
+
+if __name__ == '__main__':
+    main()
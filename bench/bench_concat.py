@@ -0,0 +1,76 @@
+"""Конкатенация строк на программе, которая в основном пишет лог: цепочка Runtime::concat(string, string)
+до объединения цепочек и один System.String::Concat после. Оба варианта MSIL выполняются в msil_sim.py:
+выводятся выполненные инструкции и время симуляции (вывод должен совпасть). CLR в окружении бенчмарков нет,
+а строки в симуляторе - строки Python, поэтому копирование символов в CLR только оценивается по длинам
+слагаемых: для литералов - точная длина, для остальных значений - --value-len символов."""
+import argparse
+import io
+import time
+
+from corpus import logging_program, checked_program
+import code_gen
+import msil_sim
+from code_gen import CodeGenerator, find_concat_parts
+from mel_ast import BinOpNode, LiteralNode, FuncCallNode
+from my_semantic_baza import BinOp, TypeDesc
+
+
+def chains(prog):
+    """Слагаемые всех цепочек сложения строк в аргументах writeline"""
+    for stmt in prog.exprs:
+        if isinstance(stmt, FuncCallNode):
+            for param in stmt.params.params:
+                if isinstance(param, BinOpNode) and param.op == BinOp.ADD and param.arg1.node_type == TypeDesc.STR:
+                    yield find_concat_parts(param)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--fields', type=int, default=6)
+    parser.add_argument('--value-len', type=int, default=6)
+    args = parser.parse_args()
+
+    prog = checked_program(logging_program(args.messages, args.fields))
+    calls_before = calls_after = copied_before = copied_after = 0
+    for parts in chains(prog):
+        lens = [len(p.value) if isinstance(p, LiteralNode) else args.value_len for p in parts]
+        calls_before += len(parts) - 1
+        calls_after += 1
+        # каждый промежуточный concat копирует весь накопленный префикс
+        prefix = lens[0]
+        for n in lens[1:]:
+            prefix += n
+            copied_before += prefix
+        copied_after += sum(lens)
+    print(f'concat calls per run: {calls_before} -> {calls_after}')
+    print(f'chars copied per run: {copied_before} -> {copied_after} ({copied_before / copied_after:.1f}x less)')
+
+    start = time.perf_counter()
+    gen = CodeGenerator()
+    gen.msil_gen_program(prog)
+    print(f'codegen: {(time.perf_counter() - start) * 1000:.0f} ms, {len(gen.code_lines)} lines')
+
+    # вариант до объединения цепочек: каждое сложение - отдельный вызов concat
+    find = code_gen.find_concat_parts
+    code_gen.find_concat_parts = lambda node: [node.arg1, node.arg2]
+    try:
+        before = CodeGenerator()
+        before.msil_gen_program(prog)
+    finally:
+        code_gen.find_concat_parts = find
+    outputs = []
+    for name, lines in (('before', before.code_lines), ('after', gen.code_lines)):
+        assembly = msil_sim.load(lines)
+        out = io.StringIO()
+        start = time.perf_counter()
+        profile = assembly.run(io.StringIO(), out)
+        elapsed = time.perf_counter() - start
+        outputs.append(out.getvalue())
+        print(f'msil_sim {name}: {profile.total} executed, {profile.instructions["call"]} calls, '
+              f'simulated in {elapsed * 1000:.1f} ms')
+    assert outputs[0] == outputs[1], 'разный вывод'
+
+
+if __name__ == '__main__':
+    main()
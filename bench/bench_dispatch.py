@@ -0,0 +1,96 @@
+"""Накладные расходы диспетчеризации visitor на полном прогоне CodeGenerator
+
+Сравнивается текущий Dispatcher (кэш по MRO, один переход) с прежней схемой:
+точное совпадение класса по словарю, иначе перебор всех обработчиков с issubclass,
+плюс промежуточная обертка ff.
+"""
+import argparse
+import gc
+import time
+import timeit
+
+from corpus import program, checked_program
+from code_gen import CodeGenerator
+from mel_ast import LiteralNode
+from my_semantic_baza import TypeDesc
+
+
+def legacy_msil_gen(dispatcher):
+    """Обертка с прежним путем вызова поверх тех же обработчиков"""
+    targets = dispatcher.targets
+    param_index = dispatcher.param_index
+
+    def call(*args, **kw):
+        typ = args[param_index].__class__
+        d = targets.get(typ)
+        if d is not None:
+            return d(*args, **kw)
+        return [t(*args, **kw) for k, t in targets.items() if issubclass(typ, k)]
+
+    def ff(*args, **kw):
+        return call(*args, **kw)
+
+    return ff
+
+
+def run(prog, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        start = time.perf_counter()
+        gen = CodeGenerator()
+        gen.msil_gen_program(prog)
+        best = min(best, time.perf_counter() - start)
+        gc.enable()
+    return best
+
+
+def per_call(fn, number: int = 200000) -> float:
+    """Время одного вызова fn(gen, литерал) в нс"""
+    node = LiteralNode('1')
+    node.node_type = TypeDesc.INT
+    gen = CodeGenerator()
+
+    def call():
+        fn(gen, node)
+        gen.code_lines.clear()
+
+    return min(timeit.repeat(call, number=number, repeat=5)) / number * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--funcs', type=int, default=300)
+    parser.add_argument('--loops', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=7)
+    args = parser.parse_args()
+
+    prog = checked_program(program(args.funcs, args.loops))
+    current = CodeGenerator.msil_gen
+    calls = 0
+
+    def counting(*a, **kw):
+        nonlocal calls
+        calls += 1
+        return current(*a, **kw)
+
+    CodeGenerator.msil_gen = counting
+    run(prog, 1)
+    CodeGenerator.msil_gen = legacy_msil_gen(current.dispatcher)
+    legacy = run(prog, args.repeat)
+    CodeGenerator.msil_gen = current
+    cached = run(prog, args.repeat)
+
+    direct = per_call(current.dispatcher.targets[LiteralNode])
+    legacy_call = per_call(legacy_msil_gen(current.dispatcher)) - direct
+    cached_call = per_call(current) - direct
+
+    print(f'msil_gen calls per run: {calls}')
+    print(f'full run, legacy dispatch: {legacy * 1000:.1f} ms')
+    print(f'full run, cached dispatch: {cached * 1000:.1f} ms')
+    print(f'dispatch overhead per call: legacy {legacy_call:.0f} ns, cached {cached_call:.0f} ns')
+
+
+if __name__ == '__main__':
+    main()
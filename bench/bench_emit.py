@@ -0,0 +1,52 @@
+"""Пиковая память и время вывода MSIL: список code_lines + print(*gen.code) против потокового вывода"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from corpus import program, checked_program
+from code_gen import CodeGenerator
+
+
+def in_memory(prog, path: str) -> None:
+    gen = CodeGenerator()
+    gen.msil_gen_program(prog)
+    with open(path, mode='w') as f:
+        print(*gen.code, sep=os.linesep, file=f)
+
+
+def streaming(prog, path: str) -> None:
+    with open(path, mode='w') as f:
+        gen = CodeGenerator(f)
+        gen.msil_gen_program(prog)
+
+
+def measure(fn, prog, path: str):
+    start = time.perf_counter()
+    fn(prog, path)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn(prog, path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--funcs', type=int, default=1000)
+    parser.add_argument('--loops', type=int, default=300)
+    args = parser.parse_args()
+
+    prog = checked_program(program(args.funcs, args.loops))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'program.msil')
+        for name, fn in (('in-memory', in_memory), ('streaming', streaming)):
+            elapsed, peak = measure(fn, prog, path)
+            print(f'{name}: {elapsed * 1000:.0f} ms, peak {peak / 1024:.0f} KiB, {os.path.getsize(path)} bytes')
+
+
+if __name__ == '__main__':
+    main()
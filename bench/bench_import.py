@@ -0,0 +1,124 @@
+"""Время импорта code_gen и my_checker: регистрация @on/@when без обращения к кадрам стека
+
+В отдельных процессах сравнивается текущий visitor с прежней реализацией (поиск диспетчера через
+inspect.currentframe().f_back.f_locals и inspect.getfullargspec в Dispatcher.__init__).
+Модули, от которых зависят code_gen и my_checker (pyparsing, my_parser, mel_ast), импортируются
+до начала замера, так что измеряется выполнение тел самих модулей.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import timeit
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH = os.path.dirname(os.path.abspath(__file__))
+
+LEGACY_SOURCE = '''
+import inspect
+
+
+def on(param_name):
+    def f(fn):
+        dispatcher = Dispatcher(param_name, fn)
+        return dispatcher
+
+    return f
+
+
+def when(param_type):
+    def f(fn):
+        frame = inspect.currentframe().f_back
+        func_name = fn.func_name if 'func_name' in dir(fn) else fn.__name__
+        dispatcher = frame.f_locals[func_name]
+        if not isinstance(dispatcher, Dispatcher):
+            dispatcher = dispatcher.dispatcher
+        dispatcher.add_target(param_type, fn)
+
+        def ff(*args, **kw):
+            return dispatcher(*args, **kw)
+
+        ff.dispatcher = dispatcher
+        return ff
+
+    return f
+
+
+class Dispatcher(object):
+    def __init__(self, param_name, fn):
+        frame = inspect.currentframe().f_back.f_back
+        top_level = frame.f_locals == frame.f_globals
+        self.param_index = inspect.getfullargspec(fn).args.index(param_name)
+        self.param_name = param_name
+        self.targets = {}
+
+    def __call__(self, *args, **kw):
+        typ = args[self.param_index].__class__
+        d = self.targets.get(typ)
+        if d is not None:
+            return d(*args, **kw)
+        return [t(*args, **kw) for k, t in self.targets.items() if issubclass(typ, k)]
+
+    def add_target(self, typ, target):
+        self.targets[typ] = target
+'''
+
+CHILD = '''
+import sys, time
+sys.path[:0] = [{root!r}, {bench!r}]
+if {legacy!r}:
+    import bench_import
+    bench_import.install_legacy()
+import pyparsing, my_parser, mel_ast, my_semantic_baza, visitor
+start = time.perf_counter()
+import code_gen, my_checker
+print(time.perf_counter() - start)
+'''
+
+
+def install_legacy() -> None:
+    """Подменить модуль visitor прежней реализацией"""
+    module = types.ModuleType('visitor')
+    exec(LEGACY_SOURCE, module.__dict__)
+    sys.modules['visitor'] = module
+
+
+def registration(visitor, targets: int = 50) -> float:
+    """Время определения класса с одним @on и targets методами @when"""
+    kinds = [type('T{}'.format(i), (), {}) for i in range(targets)]
+    namespace = {'visitor': visitor, 'kinds': kinds}
+    body = ['class Visitor:', '    @visitor.on("node")', '    def visit(self, node):', '        pass']
+    for i in range(targets):
+        body += ['    @visitor.when(kinds[{}])'.format(i), '    def visit(self, node):', '        pass']
+    code = compile('\n'.join(body), 'registration', 'exec')
+    return min(timeit.repeat(lambda: exec(code, dict(namespace)), number=100, repeat=5)) / 100
+
+
+def measure(legacy: bool, repeat: int) -> float:
+    code = CHILD.format(root=ROOT, bench=BENCH, legacy=legacy)
+    times = [float(subprocess.check_output([sys.executable, '-c', code])) for _ in range(repeat)]
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=15)
+    args = parser.parse_args()
+
+    legacy = measure(True, args.repeat)
+    current = measure(False, args.repeat)
+    print(f'import code_gen, my_checker (legacy visitor): {legacy * 1000:.2f} ms')
+    print(f'import code_gen, my_checker (current):        {current * 1000:.2f} ms')
+
+    sys.path.insert(0, ROOT)
+    import visitor
+    install_legacy()
+    legacy_visitor = sys.modules['visitor']
+    print(f'class with 50 @when targets (legacy visitor): {registration(legacy_visitor) * 1e6:.0f} us')
+    print(f'class with 50 @when targets (current):        {registration(visitor) * 1e6:.0f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Кол-во выполненных инструкций MSIL (msil_sim.py) без оптимизаций, только с peephole.py и с -O (inline, licm,
+promote, split_main и peephole): оптимизации кодогенерации измеряются без ilasm и CLR. Выводятся также
+размер кода (инструкций в методах) и время симуляции."""
+import argparse
+import io
+import time
+
+from corpus import program, array_program, checked_program
+import inline
+import licm
+import msil_sim
+import peephole
+import promote
+import split_main
+from code_gen import CodeGenerator
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--funcs', type=int, default=50)
+    parser.add_argument('--loops', type=int, default=400)
+    parser.add_argument('--outer', type=int, default=5000)
+    parser.add_argument('--profile', default=False, action='store_true', help='подробный отчет для -O')
+    args = parser.parse_args()
+
+    sources = {'program': program(args.funcs, args.loops), 'array_program': array_program(args.outer)}
+    for name, src in sources.items():
+        outputs = []
+        for config in ('base', 'peephole', '-O'):
+            prog = checked_program(src)
+            if config == '-O':
+                inline.inline_calls(prog)
+                licm.hoist_invariants(prog)
+                promote.promote_globals(prog)
+                split_main.split_main(prog)
+            gen = CodeGenerator(None, config != 'base')
+            gen.msil_gen_program(prog)
+            assembly = msil_sim.load(gen.code_lines)
+            out = io.StringIO()
+            start = time.perf_counter()
+            profile = assembly.run(io.StringIO(), out)
+            elapsed = time.perf_counter() - start
+            outputs.append(out.getvalue())
+            print(f'{name} {config}: {profile.total} executed, {peephole.instruction_count(gen.code_lines)} '
+                  f'in code, simulated in {elapsed * 1000:.1f} ms')
+            if args.profile and config == '-O':
+                profile.report()
+        assert len(set(outputs)) == 1, 'разный вывод'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""Время генерации MSIL: последовательно и с функциями в пуле процессов (результат должен совпадать,
+в том числе строки исходного кода у CodeLine)"""
+import argparse
+import io
+import os
+import time
+
+from corpus import program, checked_program
+from code_gen import CodeGenerator
+import parallel_gen
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--funcs', type=int, default=2000)
+    parser.add_argument('--loops', type=int, default=50)
+    parser.add_argument('-j', '--jobs', type=int, default=0, help='processes (0 - all cpus)')
+    args = parser.parse_args()
+
+    prog = checked_program(program(args.funcs, args.loops))
+    start = time.perf_counter()
+    serial = io.StringIO()
+    CodeGenerator(serial).msil_gen_program(prog)
+    print(f'serial: {(time.perf_counter() - start) * 1000:.0f} ms')
+
+    start = time.perf_counter()
+    pooled = io.StringIO()
+    parallel_gen.msil_gen_program(prog, pooled, workers=args.jobs or None)
+    print(f'pooled ({args.jobs or os.cpu_count()} processes): {(time.perf_counter() - start) * 1000:.0f} ms, '
+          f'identical: {serial.getvalue() == pooled.getvalue()}')
+
+    # строки исходного кода (CodeLine.row) передаются из процессов вместе с кодом
+    serial_gen = CodeGenerator()
+    serial_gen.msil_gen_program(prog)
+    pooled_gen = parallel_gen.msil_gen_program(prog, workers=args.jobs or None)
+    serial_rows = [(str(cl), cl.row) for cl in serial_gen.code_lines]
+    pooled_rows = [(str(cl), cl.row) for cl in pooled_gen.code_lines]
+    assert serial_rows == pooled_rows, 'строки исходного кода не совпадают'
+    print(f'rows identical: {len(serial_rows)} lines')
+
+
+if __name__ == '__main__':
+    main()
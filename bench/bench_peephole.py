@@ -0,0 +1,39 @@
+"""Кол-во инструкций MSIL до и после peephole-оптимизации (program.txt и сгенерированный корпус)"""
+import argparse
+import os
+import time
+
+from corpus import program, checked_program
+from code_gen import CodeGenerator
+import peephole
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def report(name: str, src: str) -> None:
+    prog = checked_program(src)
+    gen = CodeGenerator()
+    gen.msil_gen_program(prog)
+    before = peephole.instruction_count(gen.code_lines)
+    start = time.perf_counter()
+    lines = peephole.optimize(gen.code_lines)
+    elapsed = time.perf_counter() - start
+    after = peephole.instruction_count(lines)
+    print(f'{name}: {before} -> {after} instructions ({(before - after) / before:.1%} less), '
+          f'optimize {elapsed * 1000:.0f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--funcs', type=int, default=200)
+    parser.add_argument('--loops', type=int, default=50)
+    args = parser.parse_args()
+
+    with open(os.path.join(ROOT, 'program.txt'), mode='r') as f:
+        report('program.txt', f.read())
+    report('corpus', program(args.funcs, args.loops))
+
+
+if __name__ == '__main__':
+    main()
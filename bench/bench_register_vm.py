@@ -0,0 +1,55 @@
+"""Выполнение программ на регистровой виртуальной машине (register_vm.py) и в замыканиях (closure_exec.py):
+время компиляции и выполнения, размер байт-кода. Программы проверяются без оптимизаций и после -O
+(inline, licm, promote: переменные Main - регистры кадра вместо глобальных)."""
+import argparse
+import io
+import time
+
+from corpus import program, array_program, checked_program
+import closure_exec
+import inline
+import licm
+import promote
+import register_vm
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--funcs', type=int, default=50)
+    parser.add_argument('--loops', type=int, default=400)
+    parser.add_argument('--outer', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    sources = {'program': program(args.funcs, args.loops), 'array_program': array_program(args.outer)}
+    for name, src in sources.items():
+        for optimize in (False, True):
+            prog = checked_program(src)
+            if optimize:
+                inline.inline_calls(prog)
+                licm.hoist_invariants(prog)
+                promote.promote_globals(prog)
+            outputs = []
+            for engine in (closure_exec, register_vm):
+                start = time.perf_counter()
+                compiled = engine.compile_program(prog)
+                compile_time = time.perf_counter() - start
+                best = None
+                for _ in range(args.repeat):
+                    out = io.StringIO()
+                    start = time.perf_counter()
+                    if engine is register_vm:
+                        register_vm.execute(compiled, io.StringIO(), out)
+                    else:
+                        compiled.run(io.StringIO(), out)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                outputs.append(out.getvalue())
+                size = f', {len(compiled.code) // 4} instructions' if engine is register_vm else ''
+                print(f'{name}{" -O" if optimize else ""} {engine.__name__}: compile {compile_time * 1000:.1f} ms, '
+                      f'run {best * 1000:.1f} ms{size}')
+            assert outputs[0] == outputs[1], 'разный вывод'
+
+
+if __name__ == '__main__':
+    main()
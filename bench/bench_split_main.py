@@ -0,0 +1,56 @@
+"""Размер методов программы с большим кодом верхнего уровня до и после разбиения Main на части
+(split_main.py). CLR в окружении бенчмарков нет, поэтому вместо времени JIT-компиляции выводится
+размер самого большого метода (кол-во инструкций после peephole-оптимизации)."""
+import argparse
+import time
+
+from corpus import program, checked_program
+from code_gen import CodeGenerator
+import inline
+import licm
+import peephole
+import promote
+import split_main
+
+
+def method_sizes(prog):
+    """Кол-во инструкций в каждом методе: {имя: размер}"""
+    gen = CodeGenerator(None, True)
+    gen.msil_gen_program(prog)
+    sizes, name, lines = {}, None, []
+    for line in gen.code_lines + [None]:
+        if line is None or line.code.strip().startswith('.method'):
+            if name is not None:
+                sizes[name] = peephole.instruction_count(lines)
+            if line is not None:
+                name, lines = line.code.split('(')[0].split()[-1], []
+        else:
+            lines.append(line)
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--funcs', type=int, default=1000)
+    parser.add_argument('--loops', type=int, default=50)
+    parser.add_argument('--max-size', type=int, default=split_main.MAIN_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    src = program(args.funcs, args.loops)
+    for split in (False, True):
+        prog = checked_program(src)
+        inline.inline_calls(prog)
+        licm.hoist_invariants(prog)
+        promote.promote_globals(prog)
+        start = time.perf_counter()
+        helpers = split_main.split_main(prog, args.max_size) if split else 0
+        elapsed = time.perf_counter() - start
+        sizes = method_sizes(prog)
+        main_sizes = [size for name, size in sizes.items() if name == 'Main' or name.startswith('_main')]
+        print(f'{"split" if split else "single Main"}: {helpers} helpers, largest method {max(sizes.values())} '
+              f'instructions, top-level code {sum(main_sizes)} instructions in {len(main_sizes)} methods'
+              + (f', split in {elapsed * 1000:.0f} ms' if split else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Генератор тестовых программ для бенчмарков (bench_*.py)"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import my_parser
+from mel_ast import StatementListNode
+from my_semantic_baza import prepare_global_scope
+
+
+def program(funcs: int = 200, loops: int = 20) -> str:
+    """Программа из funcs функций (каждая вызывает предыдущую) и loops циклов в глобальном коде"""
+    lines = [
+        'int total = 0;',
+        'float scale = 1.5;',
+        'string name = "bench";',
+    ]
+    for i in range(funcs):
+        lines.append(f'int f{i}(int a, int b) {{')
+        lines.append(f'    if (a > b) {{')
+        lines.append(f'        a = a - b;')
+        lines.append(f'    }} else {{')
+        lines.append(f'        a = a + b * 2;')
+        lines.append(f'    }}')
+        lines.append(f'    while (a > {i + 10}) {{')
+        lines.append(f'        a = a / 2;')
+        lines.append(f'    }}')
+        if i > 0:
+            lines.append(f'    a = a + f{i - 1}(b, {i % 7});')
+        lines.append(f'    return 2 * a + b;')
+        lines.append(f'}}')
+        lines.append(f'int v{i} = f{i}({i % 13}, {i % 5});')
+    for i in range(loops):
+        lines.append(f'for (int i{i} = 0; i{i} < {10 + i}; i{i} = i{i} + 1) {{')
+        lines.append(f'    total = total + i{i} * {i + 1} - v{i % funcs if funcs else 0};')
+        lines.append(f'    if (total > 1000 && i{i} != 3) {{')
+        lines.append(f'        total = total - 1000;')
+        lines.append(f'    }}')
+        lines.append(f'}}')
+        lines.append(f'writeline("loop {i}: total = " + total + ", " + name);')
+    return '\n'.join(lines)
+
+
+def logging_program(messages: int = 500, fields: int = 6) -> str:
+    """Программа, которая в основном пишет лог: messages строк вида "k0 = " + x + ", k1 = " + y + ..."""
+    lines = [
+        'int n = 42;',
+        'float ratio = 0.75;',
+        'string name = "bench";',
+    ]
+    values = ('n', 'ratio', 'name')
+    for i in range(messages):
+        parts = [f'"msg {i}: k0 = " + {values[i % 3]}']
+        for k in range(1, fields):
+            parts.append(f'", k{k} = " + {values[(i + k) % 3]}')
+        lines.append(f'writeline({" + ".join(parts)});')
+    return '\n'.join(lines)
+
+
+def tables_program(tables: int = 8, size: int = 256) -> str:
+    """Программа с tables константными таблицами (int, char, float по очереди) по size элементов"""
+    lines = []
+    for t in range(tables):
+        kind = t % 3
+        if kind == 0:
+            values = [str((i * 2654435761 + t) % 100000) for i in range(size)]
+            lines.append(f'int tab{t}[{size}] = {{{", ".join(values)}}};')
+        elif kind == 1:
+            values = ["'{}'".format(chr(ord('a') + (i + t) % 26)) for i in range(size)]
+            lines.append(f'char tab{t}[{size}] = {{{", ".join(values)}}};')
+        else:
+            values = [f'{i * 0.5 + t}' for i in range(size)]
+            lines.append(f'float tab{t}[{size}] = {{{", ".join(values)}}};')
+    lines.append('int total = tab0[1];')
+    return '\n'.join(lines)
+
+
+def array_program(outer: int = 62500, size: int = 16) -> str:
+    """Программа, которая outer раз суммирует и переписывает массив из size элементов (outer * size * 2 обращений)"""
+    values = ', '.join(str(i * 7 % 31) for i in range(size))
+    return '\n'.join([
+        f'int t[{size}] = {{{values}}};',
+        'int s = 0;',
+        f'for (int i = 0; i < {outer}; i = i + 1) {{',
+        f'    for (int k = 0; k < {size}; k = k + 1) {{',
+        '        s = s + t[k];',
+        '        t[k] = s - i;',
+        '    }',
+        '}',
+    ])
+
+
+def checked_program(src: str) -> StatementListNode:
+    """Разобрать и проверить программу"""
+    prog = my_parser.parse(src)
+    prog.semantic_check(prepare_global_scope())
+    return prog
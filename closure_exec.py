@@ -0,0 +1,624 @@
+"""Выполнение программы без .NET: проверенное дерево компилируется во вложенные замыкания Python
+
+Каждый узел заранее превращается в функцию от кадра (списка слотов метода): слоты переменных, операции
+и вызываемые функции определяются один раз при компиляции, а не при каждом выполнении узла.
+Поведение повторяет сгенерированный MSIL-код:
+    - int - 32-битный со знаком (переполнение по модулю 2**32), деление и остаток - с отбрасыванием дробной части;
+    - переменные без инициализатора обнуляются только при входе в метод (и в переиспользованном слоте,
+      см. IdentDesc.reused), глобальные переменные и массивы - статические поля (массивы - по имени);
+    - строки по умолчанию null (при выводе и конкатенации - пустая строка), сравнение строк - посимвольное.
+Встроенные функции (input, write, writeline, to_int, to_float) работают с буферизованным вводом-выводом
+(Runtime). Выполнять можно и дерево после оптимизаций (inline.py, licm.py, promote.py, split_main.py).
+"""
+import math
+import sys
+from typing import Callable, Dict, List, Optional, TextIO
+
+from mel_ast import AstNode, LiteralNode, IdentNode, BinOpNode, TypeConvertNode, FuncCallNode, AssignNode, DeclNode, \
+    ArrNode, ArrItemNode, StatementListNode, IfOpNode, WhileOpNode, ForOpNode, ReturnOpNode, FuncDeclNode, \
+    InlineCallNode, iter_nodes
+from my_semantic_baza import BaseType, BinOp, IdentDesc, ScopeType
+
+# Наибольшая глубина вызовов функций программы - одна и та же во всех исполнителях (closure_exec.py,
+# register_vm.py, py_backend.py, msil_sim.py); хвостовой вызов функцией самой себя выполняется циклом
+# и глубину не увеличивает
+CALL_DEPTH_LIMIT = 10000
+
+# Глубина рекурсии Python при выполнении (вызов функции программы занимает несколько кадров Python)
+RECURSION_LIMIT = CALL_DEPTH_LIMIT * 40
+
+# Значения по умолчанию (как после .locals init и у статических полей)
+DEFAULTS = {
+    BaseType.INT: 0,
+    BaseType.FLOAT: 0.0,
+    BaseType.CHAR: '\0',
+    BaseType.STR: None,
+}
+
+Frame = List
+Expr = Callable[[Frame], object]
+# Оператор возвращает None или (значение, ) при выполнении return
+Stmt = Callable[[Frame], Optional[tuple]]
+
+# Маркер хвостового вызова функцией самой себя: (_TAIL, аргументы) - новые значения параметров и повтор тела
+_TAIL = object()
+
+
+class ExecutionError(Exception):
+    """Ошибка во время выполнения программы (аналог исключения CLR)"""
+
+    def __init__(self, message: str, row: Optional[int] = None) -> None:
+        if row:
+            message += " (строка: {})".format(row)
+        super().__init__(message)
+        self.message = message
+        self.row = row
+
+
+class StackOverflowError(ExecutionError):
+    """Глубина вызовов больше CALL_DEPTH_LIMIT (аналог StackOverflowException, строка не указывается)"""
+
+    def __init__(self) -> None:
+        super().__init__('Переполнение стека: глубина вызовов больше {}'.format(CALL_DEPTH_LIMIT))
+
+
+def int32(value: int) -> int:
+    return (value + 0x80000000 & 0xFFFFFFFF) - 0x80000000
+
+
+def float_str(value: float) -> str:
+    """Строка для float, как Convert.ToString(double): целые значения без дробной части, экспонента - E
+    (кратчайшие цифры, как у repr, но .NET записывает экспоненту с порядка 17, а не 16)"""
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '∞' if value > 0 else '-∞'
+    s = repr(value)
+    if s.endswith('.0'):
+        s = s[:-2]
+    if s.endswith('e+16'):
+        mantissa = s[:-4]
+        sign = '-' if mantissa.startswith('-') else ''
+        return sign + mantissa.lstrip('-').replace('.', '').ljust(17, '0')
+    return s.replace('e', 'E')
+
+
+class Runtime:
+    """Встроенные функции языка (CompilerDemo.Runtime) над буферизованным вводом-выводом
+    Вывод копится в буфере и записывается в поток при flush: перед чтением ввода и в конце программы.
+    """
+
+    def __init__(self, stdin: Optional[TextIO] = None, stdout: Optional[TextIO] = None) -> None:
+        self.stdin = stdin
+        self.stdout = stdout
+        self.buffer: List[str] = []
+
+    def flush(self) -> None:
+        if self.buffer:
+            (self.stdout or sys.stdout).write(''.join(self.buffer))
+            self.buffer.clear()
+
+    def input(self) -> Optional[str]:
+        self.flush()
+        line = (self.stdin or sys.stdin).readline()
+        if not line:
+            return None  # Console.ReadLine в конце ввода
+        return line[:-1] if line.endswith('\n') else line
+
+    def write(self, s: Optional[str]) -> None:
+        if s is not None:
+            self.buffer.append(s)
+
+    def writeline(self, s: Optional[str]) -> None:
+        if s is not None:
+            self.buffer.append(s)
+        self.buffer.append('\n')
+
+    @staticmethod
+    def to_int(s: Optional[str]) -> int:
+        if s is None:
+            return 0
+        try:
+            value = int(s.strip())
+        except ValueError:
+            raise ExecutionError('Неверный формат числа: "{}"'.format(s))
+        if value != int32(value):
+            raise ExecutionError('Число {} вне диапазона int'.format(s))
+        return value
+
+    @staticmethod
+    def to_float(s: Optional[str]) -> float:
+        if s is None:
+            return 0.0
+        try:
+            return float(s.strip())
+        except ValueError:
+            raise ExecutionError('Неверный формат числа: "{}"'.format(s))
+
+
+def divide(a, b, row: Optional[int] = None):
+    """Деление, как div в MSIL: для int - с отбрасыванием дробной части и исключением при делении на ноль"""
+    if type(a) is int:
+        if b == 0:
+            raise ExecutionError('Деление на ноль', row)
+        q = abs(a) // abs(b)
+        return int32(q if (a < 0) == (b < 0) else -q)
+    if b == 0:
+        return math.nan if a == 0 or math.isnan(a) else math.copysign(math.inf, a) * math.copysign(1, b)
+    return a / b
+
+
+def remainder(a, b, row: Optional[int] = None):
+    """Остаток, как rem в MSIL (знак - как у делимого)"""
+    if type(a) is int:
+        if b == 0:
+            raise ExecutionError('Деление на ноль', row)
+        return int32(a - b * int(divide(a, b, row)))
+    if b == 0:
+        return math.nan
+    return math.fmod(a, b)
+
+
+def compare_str(a: Optional[str], b: Optional[str]) -> int:
+    """Сравнение строк, как compare в CompilerDemo.Runtime: -1, 0 или 1 (null меньше любой строки)"""
+    if a is None or b is None:
+        return (a is not None) - (b is not None)
+    return (a > b) - (a < b)
+
+
+def _concat(a, b):
+    return (a or '') + (b or '')
+
+
+# Операции по типу результата (сравнения и логические - отдельно)
+_INT_OPS = {
+    BinOp.ADD: lambda a, b, row: int32(a + b),
+    BinOp.SUB: lambda a, b, row: int32(a - b),
+    BinOp.MUL: lambda a, b, row: int32(a * b),
+    BinOp.DIV: divide,
+    BinOp.MOD: remainder,
+}
+_FLOAT_OPS = {
+    BinOp.ADD: lambda a, b, row: a + b,
+    BinOp.SUB: lambda a, b, row: a - b,
+    BinOp.MUL: lambda a, b, row: a * b,
+    BinOp.DIV: divide,
+    BinOp.MOD: remainder,
+}
+
+
+class _Compiler:
+    def __init__(self, prog: StatementListNode, runtime: Runtime) -> None:
+        self.runtime = runtime
+        self.globals: List = []
+        self.global_defaults: List = []
+        self.arrays: Dict[str, list] = {}
+        # ячейки функций: тела компилируются после создания всех ячеек (вызов может быть раньше объявления)
+        self.funcs: Dict[str, list] = {}
+        self.params = 0  # кол-во параметров компилируемого метода (локальные переменные - после них в кадре)
+        self.method: Optional[FuncDeclNode] = None  # компилируемая функция
+        self.func_loop = False  # функция вызывает себя в return (тело выполняется в цикле, как в CodeGenerator)
+        self.inline_depth = 0
+        self.depth = [0]  # глубина вызовов функций программы при выполнении
+        self.returns = 0  # кол-во скомпилированных return (блок без return не проверяет результат операторов)
+        for decl in prog.var_decls or ():
+            ident = decl.ident.node_ident
+            if ident.scope == ScopeType.GLOBAL:
+                self.global_slot(ident)
+
+    def global_slot(self, ident: IdentDesc) -> int:
+        while len(self.global_defaults) <= ident.index:
+            self.global_defaults.append(0)
+        self.global_defaults[ident.index] = DEFAULTS.get(ident.type.base_type)
+        return ident.index
+
+    # Кадр метода: параметры, затем локальные переменные
+    # (как .locals init в CodeGenerator.locals_msil_gen, пропуски - слоты имен массивов, которые хранятся по имени)
+    @staticmethod
+    def frame_defaults(var_decls: List[DeclNode], params: int) -> List:
+        slots: Dict[int, object] = {}
+        for decl in var_decls or ():
+            ident = decl.ident.node_ident
+            if ident.scope == ScopeType.LOCAL:
+                slots[ident.index] = DEFAULTS.get(ident.type.base_type)
+        size = max(slots, default=-1) + 1
+        return [0] * params + [slots.get(i, 0) for i in range(size)]
+
+    def slot(self, ident: IdentDesc) -> int:
+        return ident.index if ident.scope == ScopeType.PARAM else self.params + ident.index
+
+    # Выражения
+    def expr(self, node: AstNode) -> Expr:
+        if isinstance(node, LiteralNode):
+            value = node.value
+            if node.node_type.base_type == BaseType.INT:
+                value = int32(value)
+            elif node.node_type.base_type == BaseType.FLOAT:
+                value = float(value)
+            return lambda f: value
+        if isinstance(node, IdentNode):
+            ident = node.node_ident
+            if ident.scope == ScopeType.GLOBAL:
+                g, k = self.globals, self.global_slot(ident)
+                return lambda f: g[k]
+            k = self.slot(ident)
+            return lambda f: f[k]
+        if isinstance(node, BinOpNode):
+            return self.bin_op(node)
+        if isinstance(node, TypeConvertNode):
+            return self.convert(node)
+        if isinstance(node, ArrItemNode):
+            return self.arr_item(node)
+        if isinstance(node, FuncCallNode):
+            return self.call(node)
+        if isinstance(node, InlineCallNode):
+            return self.inline_call(node)
+        raise ExecutionError('Неподдерживаемое выражение {}'.format(type(node).__name__), node.row)
+
+    def bin_op(self, node: BinOpNode) -> Expr:
+        a, b, op, row = self.expr(node.arg1), self.expr(node.arg2), node.op, node.row
+        if op == BinOp.AND:
+            return lambda f: 1 if a(f) and b(f) else 0
+        if op == BinOp.OR:
+            return lambda f: 1 if a(f) or b(f) else 0
+        if op == BinOp.EQ:
+            return lambda f: 1 if a(f) == b(f) else 0
+        if op == BinOp.NE:
+            return lambda f: 1 if a(f) != b(f) else 0
+        if op in (BinOp.LT, BinOp.GT, BinOp.LE, BinOp.GE):
+            if node.arg1.node_type.base_type == BaseType.STR:
+                # null меньше любой строки
+                a_, b_ = a, b
+                a = lambda f: (a_(f) is not None, a_(f) or '')
+                b = lambda f: (b_(f) is not None, b_(f) or '')
+            if op == BinOp.LT:
+                return lambda f: 1 if a(f) < b(f) else 0
+            if op == BinOp.GT:
+                return lambda f: 1 if a(f) > b(f) else 0
+            if op == BinOp.LE:
+                return lambda f: 1 if a(f) <= b(f) else 0
+            return lambda f: 1 if a(f) >= b(f) else 0
+        base_type = node.node_type.base_type
+        if base_type == BaseType.STR:
+            return lambda f: _concat(a(f), b(f))
+        if base_type == BaseType.INT:
+            if op == BinOp.ADD:
+                return lambda f: (a(f) + b(f) + 0x80000000 & 0xFFFFFFFF) - 0x80000000
+            if op == BinOp.SUB:
+                return lambda f: (a(f) - b(f) + 0x80000000 & 0xFFFFFFFF) - 0x80000000
+            fn = _INT_OPS[op]
+        else:
+            if op == BinOp.ADD:
+                return lambda f: a(f) + b(f)
+            if op == BinOp.SUB:
+                return lambda f: a(f) - b(f)
+            if op == BinOp.MUL:
+                return lambda f: a(f) * b(f)
+            fn = _FLOAT_OPS[op]
+        return lambda f: fn(a(f), b(f), row)
+
+    def convert(self, node: TypeConvertNode) -> Expr:
+        e = self.expr(node.expr)
+        src, dst = node.expr.node_type.base_type, node.node_type.base_type
+        if dst == BaseType.FLOAT and src == BaseType.INT:
+            return lambda f: float(e(f))
+        if dst == BaseType.STR:
+            if src == BaseType.FLOAT:
+                return lambda f: float_str(e(f))
+            if src == BaseType.CHAR:
+                return e
+            return lambda f: str(e(f))
+        if dst == BaseType.CHAR and src == BaseType.INT:
+            return lambda f: chr(e(f) & 0xFFFF)
+        return e
+
+    def index(self, node: ArrItemNode) -> Expr:
+        i, row = self.expr(node.index), node.row
+
+        def index(f) -> int:
+            k = i(f)
+            if k < 0:
+                raise ExecutionError('Индекс {} вне границ массива {}'.format(k, node.ident.name), row)
+            return k
+        return index
+
+    def arr_item(self, node: ArrItemNode) -> Expr:
+        arrays, name, i, row = self.arrays, node.ident.name, self.index(node), node.row
+
+        def get(f):
+            k = i(f)
+            try:
+                return arrays[name][k]
+            except IndexError:
+                raise ExecutionError('Индекс {} вне границ массива {}'.format(k, name), row)
+            except KeyError:
+                raise ExecutionError('Массив {} не создан'.format(name), row)
+        return get
+
+    def args(self, node: FuncCallNode) -> List[Expr]:
+        return [self.expr(param) for param in node.params.params]
+
+    def call(self, node: FuncCallNode) -> Expr:
+        args = self.args(node)
+        name = node.name.name
+        if node.name.node_ident.built_in:
+            fn = getattr(self.runtime, name)
+        else:
+            cell = self.funcs[name]
+            if len(args) == 0:
+                return lambda f: cell[0]()
+            if len(args) == 1:
+                a, = args
+                return lambda f: cell[0](a(f))
+            if len(args) == 2:
+                a, b = args
+                return lambda f: cell[0](a(f), b(f))
+            return lambda f: cell[0](*[a(f) for a in args])
+        if len(args) == 0:
+            return lambda f: fn()
+        if len(args) == 1:
+            a, = args
+            return lambda f: fn(a(f))
+        return lambda f: fn(*[a(f) for a in args])
+
+    def inline_call(self, node: InlineCallNode) -> Expr:
+        params = [self.stmt(param) for param in node.params]
+        self.inline_depth += 1
+        returns = self.returns
+        body = self.stmt(node.body)
+        self.inline_depth -= 1
+        self.returns = returns  # return подстановки завершает только ее
+
+        def inline(f):
+            for param in params:
+                param(f)
+            r = body(f)
+            return r[0] if r is not None else None
+        return inline
+
+    # Присваивание в переменную (функция от кадра и значения)
+    def store(self, ident: IdentDesc) -> Callable[[Frame, object], None]:
+        if ident.scope == ScopeType.GLOBAL:
+            g, k = self.globals, self.global_slot(ident)
+
+            def store(f, value):
+                g[k] = value
+            return store
+        k = self.slot(ident)
+
+        def store(f, value):
+            f[k] = value
+        return store
+
+    # Операторы
+    def stmt(self, node: AstNode) -> Stmt:
+        if isinstance(node, StatementListNode):
+            return self.block(node.exprs)
+        if isinstance(node, AssignNode):
+            return self.assign(node)
+        if isinstance(node, DeclNode):
+            return self.decl(node)
+        if isinstance(node, ArrNode):
+            return self.arr(node)
+        if isinstance(node, IfOpNode):
+            return self.if_op(node)
+        if isinstance(node, WhileOpNode):
+            return self.while_op(node)
+        if isinstance(node, ForOpNode):
+            return self.for_op(node)
+        if isinstance(node, ReturnOpNode):
+            self.returns += 1
+            value = node.value
+            if self.func_loop and not self.inline_depth and isinstance(value, FuncCallNode) \
+                    and value.name.name == self.method.name.name:
+                args = self.args(value)
+                return lambda f: (_TAIL, [a(f) for a in args])
+            value = self.expr(value)
+            return lambda f: (value(f), )
+        if isinstance(node, FuncDeclNode):
+            return lambda f: None
+        # вызов функции как оператор: значение отбрасывается
+        e = self.expr(node)
+
+        def call(f):
+            e(f)
+        return call
+
+    def block(self, exprs) -> Stmt:
+        stmts = []
+        returns = self.returns
+        for expr in exprs:
+            if not isinstance(expr, FuncDeclNode):
+                stmts.append(self.stmt(expr))
+            if isinstance(expr, ReturnOpNode):
+                break  # дальше код недостижим
+        if len(stmts) == 1:
+            return stmts[0]
+        if self.returns == returns:
+            def block(f):
+                for s in stmts:
+                    s(f)
+            return block
+
+        def block(f):
+            for s in stmts:
+                r = s(f)
+                if r is not None:
+                    return r
+        return block
+
+    def assign(self, node: AssignNode) -> Stmt:
+        value = self.expr(node.val)
+        if isinstance(node.var, ArrItemNode):
+            arrays, name, i, row = self.arrays, node.var.ident.name, self.index(node.var), node.row
+            if node.var.node_type.base_type == BaseType.FLOAT and node.val.node_type.base_type == BaseType.INT:
+                value_ = value
+                value = lambda f: float(value_(f))
+
+            def set_item(f):
+                k = i(f)
+                v = value(f)
+                try:
+                    arrays[name][k] = v
+                except IndexError:
+                    raise ExecutionError('Индекс {} вне границ массива {}'.format(k, name), row)
+                except KeyError:
+                    raise ExecutionError('Массив {} не создан'.format(name), row)
+            return set_item
+        store = self.store(node.var.node_ident)
+        return lambda f: store(f, value(f))
+
+    def decl(self, node: DeclNode) -> Stmt:
+        ident = node.ident.node_ident
+        store = self.store(ident)
+        if node.init_value is None:
+            if not ident.reused and not (self.func_loop and ident.scope == ScopeType.LOCAL):
+                return lambda f: None
+            # слот мог остаться занятым значением переменной из прошлого блока
+            default = DEFAULTS.get(ident.type.base_type)
+            return lambda f: store(f, default)
+        value = self.expr(node.init_value)
+        if ident.type.base_type == BaseType.FLOAT and node.init_value.node_type.base_type == BaseType.INT:
+            value_ = value
+            value = lambda f: float(value_(f))
+        return lambda f: store(f, value(f))
+
+    def arr(self, node: ArrNode) -> Stmt:
+        arrays, name, length = self.arrays, node.name.name, node.length.value
+        base_type = node.node_type.base_type
+        default = DEFAULTS.get(base_type)
+        elements = [self.expr(element) for element in node.elements]
+        if base_type == BaseType.FLOAT:
+            elements = [(lambda e: lambda f: float(e(f)))(e) for e in elements]
+
+        def arr(f):
+            values = [e(f) for e in elements]
+            values.extend([default] * (length - len(values)))
+            arrays[name] = values
+        return arr
+
+    def if_op(self, node: IfOpNode) -> Stmt:
+        cond, then = self.expr(node.cond), self.stmt(node.thenStmts)
+        if node.elseStmts is None:
+            def if_op(f):
+                if cond(f):
+                    return then(f)
+            return if_op
+        else_ = self.stmt(node.elseStmts)
+
+        def if_else(f):
+            if cond(f):
+                return then(f)
+            return else_(f)
+        return if_else
+
+    def while_op(self, node: WhileOpNode) -> Stmt:
+        cond, body = self.expr(node.cond), self.stmt(node.stmts)
+
+        def while_op(f):
+            while cond(f):
+                r = body(f)
+                if r is not None:
+                    return r
+        return while_op
+
+    def for_op(self, node: ForOpNode) -> Stmt:
+        decl, cond, step, body = self.stmt(node.decl), self.expr(node.cond), self.stmt(node.stmt), self.stmt(node.body)
+
+        def for_op(f):
+            decl(f)
+            while cond(f):
+                r = body(f)
+                if r is not None:
+                    return r
+                step(f)
+        return for_op
+
+    # Методы
+    def func(self, func: FuncDeclNode) -> None:
+        self.params = len(func.params.params)
+        self.method = func
+        self.func_loop = any(isinstance(node, ReturnOpNode) and isinstance(node.value, FuncCallNode)
+                             and node.value.name.name == func.name.name for node in iter_nodes(func.body))
+        defaults = self.frame_defaults(func.var_decls, self.params)
+        locals_ = defaults[self.params:]
+        body = self.stmt(func.body)
+        params = self.params
+        depth = self.depth
+
+        # ошибка завершает программу, поэтому глубина уменьшается только при возврате (run обнуляет ее)
+        def call(*args):
+            if depth[0] >= CALL_DEPTH_LIMIT:
+                raise StackOverflowError()
+            depth[0] += 1
+            f = list(args)
+            f.extend(locals_)
+            r = body(f)
+            depth[0] -= 1
+            return r[0] if r is not None else None
+
+        def call_loop(*args):
+            if depth[0] >= CALL_DEPTH_LIMIT:
+                raise StackOverflowError()
+            depth[0] += 1
+            f = list(args)
+            f.extend(locals_)
+            r = body(f)
+            while r is not None and r[0] is _TAIL:
+                f[:params] = r[1]
+                r = body(f)
+            depth[0] -= 1
+            return r[0] if r is not None else None
+        self.funcs[func.name.name][0] = call_loop if self.func_loop else call
+        self.method, self.func_loop = None, False
+
+    def program(self, prog: StatementListNode) -> Callable[[], None]:
+        funcs = [stmt for stmt in prog.exprs if isinstance(stmt, FuncDeclNode)]
+        for func in funcs:
+            self.funcs[func.name.name] = [None]
+        for func in funcs:
+            self.func(func)
+        self.params = 0
+        defaults = self.frame_defaults(prog.var_decls, 0)
+        main = self.block(prog.exprs)
+        g, global_defaults, arrays, depth = self.globals, self.global_defaults, self.arrays, self.depth
+
+        def run():
+            g[:] = global_defaults
+            arrays.clear()
+            depth[0] = 0
+            main(list(defaults))
+        return run
+
+
+class CompiledProgram:
+    """Программа, скомпилированная в замыкания (можно выполнять многократно, но не одновременно)"""
+
+    def __init__(self, prog: StatementListNode) -> None:
+        self.runtime = Runtime()
+        self._main = _Compiler(prog, self.runtime).program(prog)
+
+    def run(self, stdin: Optional[TextIO] = None, stdout: Optional[TextIO] = None) -> None:
+        """Выполнить программу
+        :raise ExecutionError: ошибка во время выполнения (вывод до ошибки записывается в stdout)
+        """
+        self.runtime.stdin, self.runtime.stdout = stdin, stdout
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, RECURSION_LIMIT))
+        try:
+            self._main()
+        except RecursionError:
+            raise StackOverflowError()
+        finally:
+            sys.setrecursionlimit(limit)
+            self.runtime.flush()
+
+
+def compile_program(prog: StatementListNode) -> CompiledProgram:
+    """Скомпилировать проверенную программу"""
+    return CompiledProgram(prog)
+
+
+def run(prog: StatementListNode, stdin: Optional[TextIO] = None, stdout: Optional[TextIO] = None) -> None:
+    """Скомпилировать и выполнить проверенную программу"""
+    compile_program(prog).run(stdin, stdout)
@@ -1,9 +1,12 @@
-from typing import List, Union, Any
+import struct
+from typing import Dict, List, Optional, Set, TextIO, Union, Any
 
+import peephole
 import visitor
-from my_semantic_baza import BaseType, TypeDesc, ScopeType, BinOp
+from my_semantic_baza import BaseType, TypeDesc, ScopeType, BinOp, IdentDesc
 from mel_ast import AstNode, DeclNode, LiteralNode, IdentNode, BinOpNode, TypeConvertNode, FuncCallNode, \
-    FuncDeclNode, AssignNode, ReturnOpNode, IfOpNode, ForOpNode, StatementListNode, WhileOpNode, ArrNode, ArrItemNode
+    FuncDeclNode, AssignNode, ReturnOpNode, IfOpNode, ForOpNode, StatementListNode, WhileOpNode, ArrNode, ArrItemNode, \
+    InlineCallNode, iter_nodes
 
 RUNTIME_CLASS_NAME = 'CompilerDemo.Runtime'
 PROGRAM_CLASS_NAME = 'Program'
@@ -18,77 +21,152 @@ MSIL_TYPE_NAMES = {
 }
 
 
+# Суффиксы инструкций чтения (ldelem) и записи (stelem) элемента массива по типу элемента
+ARRAY_ELEM_SUFFIXES = {
+    BaseType.INT: ('i4', 'i4'),
+    BaseType.CHAR: ('u2', 'i2'),
+    BaseType.FLOAT: ('r8', 'r8'),
+    BaseType.STR: ('ref', 'ref'),
+}
+
+# Упаковка элементов массива в блок .data (little-endian, как в памяти массива): формат struct, размер элемента
+ARRAY_DATA_FORMATS = {
+    BaseType.INT: ('<i', 4),
+    BaseType.CHAR: ('<H', 2),
+    BaseType.FLOAT: ('<d', 8),
+}
+
+# Минимальное кол-во константных элементов, при котором массив инициализируется из блока .data
+ARRAY_DATA_MIN_ELEMENTS = 4
+
+
+# Отступы по уровню вложенности (строка отступа не собирается заново при каждом add)
+INDENTS = ['  ' * i for i in range(32)]
+
+
+# Условные переходы по результату сравнения: (переход, если сравнение истинно; переход, если ложно).
+# Для float переход по ложному сравнению делается беззнаковым (.un), чтобы он срабатывал и на NaN
+COMPARE_BRANCHES = {
+    BinOp.EQ: ('beq', 'bne.un'),
+    BinOp.NE: ('bne.un', 'beq'),
+    BinOp.LT: ('blt', 'bge'),
+    BinOp.GT: ('bgt', 'ble'),
+    BinOp.LE: ('ble', 'bgt'),
+    BinOp.GE: ('bge', 'blt'),
+}
+
+
 # Класс метки (типичная метка в ассемблере для переходов, обращений и тд)
+# Номер метки известен сразу при создании (см. CodeGenerator.label), поэтому переход
+# на метку можно записать до того, как она будет поставлена
 class CodeLabel:
-    def __init__(self):
-        self.index = None
+    def __init__(self, index: Optional[int] = None):
+        self.index = index
 
     def __str__(self):
         return f'IL_{self.index}'
 
 
-# Строчка кода, помеченная меткой
+def format_line(code: str, params, label: Optional[CodeLabel] = None) -> str:
+    line = ''
+    if label:
+        line += str(label) + ': '
+    line += code
+    for p in params:
+        line += ' ' + str(p)
+    return line
+
+
+# Строчка кода, помеченная меткой (row - строка исходного кода, из которой она сгенерирована, в текст не выводится)
 class CodeLine:
-    def __init__(self, code: str, *params: Union[str, CodeLabel], label: CodeLabel = None):
+    def __init__(self, code: str, *params: Union[str, CodeLabel], label: CodeLabel = None, row: Optional[int] = None):
         self.code = code
         self.label = label
         self.params = params
+        self.row = row
 
     def __str__(self):
-        line = ''
-        if self.label:
-            line += str(self.label) + ': '
-        line += self.code
-        for p in self.params:
-            line += ' ' + str(p)
-        return line
+        return format_line(self.code, self.params, self.label)
+
 
+# Максимальное кол-во аргументов у перегрузок System.String::Concat(string, ...)
+CONCAT_MAX_ARGS = 4
 
-# Пока что найти все объявления переменных в указанной ноде
-def find_vars_decls(node: AstNode) -> List[DeclNode]:
-    vars_nodes: List[DeclNode] = []
+
+# Разворачивает цепочку сложения строк ("a = " + a + ", b = " + b) в список слагаемых
+# (слагаемые уже приведены к строке, например TypeConvertNode)
+def find_concat_parts(node: AstNode) -> List[AstNode]:
+    parts: List[AstNode] = []
 
     def find(node: AstNode) -> None:
-        for n in (node.childs or []):
-            if isinstance(n, DeclNode):
-                vars_nodes.append(n)
-            else:
-                find(n)
+        if isinstance(node, BinOpNode) and node.op == BinOp.ADD and node.arg1.node_type == TypeDesc.STR:
+            find(node.arg1)
+            find(node.arg2)
+        else:
+            parts.append(node)
 
     find(node)
-    return vars_nodes
+    return parts
 
 
 # Сам класс кодогенерации
 class CodeGenerator:
-    def __init__(self):
+    def __init__(self, out: Optional[TextIO] = None, optimize: bool = False):
+        """
+        :param out: поток для вывода кода: строки пишутся в него сразу при генерации, а code_lines
+                    не заполняется (память не растет с размером программы)
+        :param optimize: применять peephole-оптимизацию (в потоковом режиме код копится до конца метода)
+        """
         self.code_lines: List[CodeLine] = []
-        self.indent = ''
+        self.out = out
+        self.optimize = optimize
+        self.depth = 0          # уровень вложенности фигурных скобок (для отступов)
+        self.label_index = 0    # номер следующей метки (метки нумеруются заново в каждом методе)
+        self.inline_ends: List[CodeLabel] = []  # метки концов подставленных функций, в которые переходит return
+        self.func: Optional[FuncDeclNode] = None     # генерируемая функция (None - Main)
+        self.func_start: Optional[CodeLabel] = None  # начало тела функции, если она вызывает себя в return
+        self.data_blocks: List[tuple] = []  # блоки .data текущего метода: (имя, байты), объявляются после метода
+        self.array_plan: Dict[int, List[IdentDesc]] = {}  # id(цикла) -> массивы, ссылки на которые кешируются в нем
+        self.array_slots: Dict[IdentDesc, int] = {}       # массив -> слот локальной переменной со ссылкой на него
+        self.cached_arrays: Set[IdentDesc] = set()        # массивы, ссылки на которые сейчас в локальных переменных
+        self.row: Optional[int] = None  # строка исходного кода генерируемого оператора (для CodeLine.row)
+
+    @property
+    def indent(self) -> str:
+        return INDENTS[self.depth]
+
+    def label(self) -> CodeLabel:
+        # Новая метка текущего метода
+        label = CodeLabel(self.label_index)
+        self.label_index += 1
+        return label
 
     def add(self, code: str, *params: Union[str, int, CodeLabel], label: CodeLabel = None):
         # Тут происходит какая то магия с добавлением строчек кода
         if len(code) > 0 and code[-1] == '}':
-            self.indent = self.indent[2:]
-        self.code_lines.append(CodeLine(self.indent + str(code), *params, label=label))
+            self.depth -= 1
+        if self.out is None or self.optimize:
+            self.code_lines.append(CodeLine(INDENTS[self.depth] + str(code), *params, label=label, row=self.row))
+        else:
+            self.out.write(format_line(INDENTS[self.depth] + str(code), params, label))
+            self.out.write('\n')
         if len(code) > 0 and code[-1] == '{':
-            self.indent = self.indent + '  '
+            self.depth += 1
+        # конец метода (или класса)
+        elif self.out is not None and self.optimize and code == '}' and self.depth <= 1:
+            self.flush()
+
+    def flush(self) -> None:
+        # Оптимизировать накопленный код и вывести его в поток
+        for cl in peephole.optimize(self.code_lines):
+            self.out.write(str(cl))
+            self.out.write('\n')
+        self.code_lines.clear()
 
     @property
     def code(self) -> [str, ...]:
-        index = 0
-        # Берем построчно весь код
-        for cl in self.code_lines:
-            line = cl.code
-            # Раскидываем индексы для всех меток 
-            if cl.label:
-                cl.label.index = index
-                index += 1
-        # Делаем пустой список строк
-        code: List[str] = []
-        # и после того, как раскидали индексы меток, собираем все в одну кучу
-        for cl in self.code_lines:
-            code.append(str(cl))
-        return code
+        # номера меток уже известны, остается только собрать строки
+        return [str(cl) for cl in self.code_lines]
 
     # Добавление директивы начала сборки и указания класса, где будет находиться наш код
     def start(self) -> None:
@@ -159,6 +237,19 @@ class CodeGenerator:
     # Тут тупо если для переменной заготовлено значение, то генерируем инструкции присваивания
     @visitor.when(DeclNode)
     def msil_gen(self, node: DeclNode) -> None:
+        ident = node.ident.node_ident
+        # в функции с рекурсией, превращенной в цикл, тело выполняется повторно без обнуления переменных
+        if node.init_value is None and ident.scope == ScopeType.LOCAL and (ident.reused or self.func_start):
+            # слот мог остаться занятым значением переменной из прошлого блока, а .locals init обнуляет его только
+            # при входе в метод
+            base_type = ident.type.base_type
+            if base_type == BaseType.FLOAT:
+                self.add('ldc.r8', '0.0')
+            elif base_type == BaseType.STR:
+                self.add('ldnull')
+            else:
+                self.add('ldc.i4.0')
+            self.add('stloc', ident.index)
         if node.init_value != None:
             if isinstance(node.init_value, ArrItemNode):
                 self.arr_item_get_msil_gen(node.init_value)
@@ -176,6 +267,22 @@ class CodeGenerator:
     # Оп, генерация кода для бинарной операции
     @visitor.when(BinOpNode)
     def msil_gen(self, node: BinOpNode) -> None:
+        # && и || вычисляются сокращенно: правый аргумент - только если от него зависит результат (0 или 1)
+        if node.op == BinOp.AND or node.op == BinOp.OR:
+            false_label = self.label()
+            end_label = self.label()
+            self.cond_jump_msil_gen(node, false_label, False)
+            self.add('ldc.i4.1')
+            self.add('br', end_label)
+            self.add('ldc.i4.0', label=false_label)
+            self.add('', label=end_label)
+            return
+        # цепочка сложения строк - один вызов String::Concat вместо n - 1 вызовов concat с копированием
+        if node.op == BinOp.ADD and node.arg1.node_type == TypeDesc.STR:
+            parts = find_concat_parts(node)
+            if len(parts) > 2:
+                self.concat_msil_gen(parts)
+                return
         # Генерируем инструкции для аргументов нашего действия (укладываем в стек)
         if isinstance(node.arg1, ArrItemNode):
             self.arr_item_get_msil_gen(node.arg1)
@@ -245,17 +352,31 @@ class CodeGenerator:
             self.add('div')
         elif node.op == BinOp.MOD:
             self.add('rem')
-        elif node.op == BinOp.AND:
-            self.add('and')
-        elif node.op == BinOp.OR:
-            self.add('or')
         else:
             pass
 
+    # Генерация конкатенации нескольких строк
+    def concat_msil_gen(self, parts: List[AstNode]) -> None:
+        str_type = MSIL_TYPE_NAMES[BaseType.STR]
+        if len(parts) <= CONCAT_MAX_ARGS:
+            for part in parts:
+                self.value_msil_gen(part)
+            self.add(f'call {str_type} [mscorlib]System.String::Concat({", ".join([str_type] * len(parts))})')
+            return
+        # длинная цепочка: массив строк (Concat сразу выделяет строку итоговой длины, поэтому StringBuilder не нужен)
+        self.add('ldc.i4', len(parts))
+        self.add(f'newarr {str_type}')
+        for i, part in enumerate(parts):
+            self.add('dup')
+            self.add('ldc.i4', i)
+            self.value_msil_gen(part)
+            self.add('stelem.ref')
+        self.add(f'call {str_type} [mscorlib]System.String::Concat({str_type}[])')
+
     # Генерация кода для преобразования типов
     @visitor.when(TypeConvertNode)
     def msil_gen(self, node: TypeConvertNode) -> None:
-        self.msil_gen(node.expr)
+        self.value_msil_gen(node.expr)
 
         # определяем конвертирование целочисленного типа в плавующую точку
         if node.node_type.base_type == BaseType.FLOAT and node.expr.node_type.base_type == BaseType.INT:
@@ -276,6 +397,10 @@ class CodeGenerator:
     # Генерация кода для вызова функции
     @visitor.when(FuncCallNode)
     def msil_gen(self, node: FuncCallNode) -> None:
+        self.call_msil_gen(node)
+
+    # Генерация вызова функции, tail - хвостовой вызов (сразу за ним ret)
+    def call_msil_gen(self, node: FuncCallNode, tail: bool = False) -> None:
         # Сначала надо сгенерить код и поместить все параметры в стек
         for param in node.params.params:
             if isinstance(param, ArrItemNode):
@@ -288,6 +413,9 @@ class CodeGenerator:
         param_types = ', '.join(MSIL_TYPE_NAMES[param.node_type.base_type] for param in node.params.params)
         # Просто инструкция вызова функции
         cmd = f'call {MSIL_TYPE_NAMES[node.node_type.base_type]} class {class_name}::{node.name.name}({param_types})'
+        if tail:
+            # кадр вызывающей функции освобождается до вызова (стек не растет при взаимной рекурсии)
+            self.add('tail.')
         self.add(cmd)
 
     # Генерация кода для оператора возврата
@@ -295,27 +423,104 @@ class CodeGenerator:
     def msil_gen(self, node: ReturnOpNode) -> None:
         # тут ничего сверхъестественного: сначала помещаем то, что мы возвращаем, в стек, 
         # а потом делаем return через местную инструкцию ret
+        value = node.value
+        if not self.inline_ends and isinstance(value, FuncCallNode) and not value.name.node_ident.built_in:
+            if self.func is not None and value.name.name == self.func.name.name:
+                # рекурсия в return превращается в цикл: новые значения параметров и переход в начало тела
+                # (все аргументы вычисляются до присваивания, т.к. могут зависеть от старых значений)
+                for param in value.params.params:
+                    self.value_msil_gen(param)
+                for index in reversed(range(len(value.params.params))):
+                    self.add('starg', index)
+                self.add('br', self.func_start)
+            else:
+                self.call_msil_gen(value, tail=True)
+                self.add('ret')
+            return
         if isinstance(node.value, ArrItemNode):
             self.arr_item_get_msil_gen(node.value)
         else:
             self.msil_gen(node.value)
-        self.add('ret')
+        if self.inline_ends:
+            # return подставленной функции: значение остается в стеке, переходим в конец подстановки
+            self.add('br', self.inline_ends[-1])
+        else:
+            self.add('ret')
+
+    # Генерация кода подставленной функции (см. inline.py)
+    @visitor.when(InlineCallNode)
+    def msil_gen(self, node: InlineCallNode) -> None:
+        # аргументы записываются в переменные, заменившие параметры
+        for param in node.params:
+            self.msil_gen(param)
+        end_label = self.label()
+        self.inline_ends.append(end_label)
+        self.msil_gen(node.body)
+        self.inline_ends.pop()
+        self.add('', label=end_label)
+
+    # Загрузить в стек значение выражения (элементы массива генерируются отдельно)
+    def value_msil_gen(self, node: AstNode) -> None:
+        if isinstance(node, ArrItemNode):
+            self.arr_item_get_msil_gen(node)
+        else:
+            self.msil_gen(node)
+
+    # Генерация условного перехода: переход на label, если значение условия cond равно jump_if
+    # Сравнения сразу превращаются в blt, bge, bne.un и т.д. (без промежуточного int),
+    # && и || - в цепочки переходов (правый аргумент вычисляется, только если от него зависит результат)
+    def cond_jump_msil_gen(self, cond: AstNode, label: CodeLabel, jump_if: bool) -> None:
+        if isinstance(cond, BinOpNode) and cond.op in (BinOp.AND, BinOp.OR):
+            if (cond.op == BinOp.AND) != jump_if:
+                # a && b ложно, если ложен любой аргумент; a || b истинно, если истинен любой
+                self.cond_jump_msil_gen(cond.arg1, label, jump_if)
+                self.cond_jump_msil_gen(cond.arg2, label, jump_if)
+            else:
+                # второй аргумент проверяем, только если первый не определил результат
+                skip_label = self.label()
+                self.cond_jump_msil_gen(cond.arg1, skip_label, not jump_if)
+                self.cond_jump_msil_gen(cond.arg2, label, jump_if)
+                self.add('', label=skip_label)
+        elif isinstance(cond, BinOpNode) and cond.op in COMPARE_BRANCHES:
+            self.value_msil_gen(cond.arg1)
+            self.value_msil_gen(cond.arg2)
+            arg_type = cond.arg1.node_type
+            if arg_type == TypeDesc.STR and cond.op in (BinOp.EQ, BinOp.NE):
+                self.add('call bool [mscorlib]System.String::op_Equality(string, string)')
+                self.add('brtrue' if (cond.op == BinOp.EQ) == jump_if else 'brfalse', label)
+                return
+            if arg_type == TypeDesc.STR:
+                # строки сравниваются через результат compare (-1, 0, 1) и 0
+                self.add(f'call {MSIL_TYPE_NAMES[BaseType.INT]} class {RUNTIME_CLASS_NAME}::compare({MSIL_TYPE_NAMES[BaseType.STR]}, {MSIL_TYPE_NAMES[BaseType.STR]})')
+                self.add('ldc.i4.0')
+            branch = COMPARE_BRANCHES[cond.op][0 if jump_if else 1]
+            if not jump_if and arg_type == TypeDesc.FLOAT and branch in ('blt', 'bgt', 'ble', 'bge'):
+                branch += '.un'
+            self.add(branch, label)
+        elif isinstance(cond, LiteralNode) and cond.node_type == TypeDesc.INT:
+            # условие известно заранее (например, for без условия)
+            if (int(cond.value) != 0) == jump_if:
+                self.add('br', label)
+        else:
+            self.value_msil_gen(cond)
+            self.add('brtrue' if jump_if else 'brfalse', label)
 
     # Генерация кода для if (вот он, условный переход)
     @visitor.when(IfOpNode)
     def msil_gen(self, node: IfOpNode) -> None:
         # создаем метки для блока else и для обозначения конца блока if
-        else_label = CodeLabel()
-        end_label = CodeLabel()
+        else_label = self.label()
+        end_label = self.label()
 
-        # генерим условие перехода (вписываем результат вычисления условия в стек)
-        self.msil_gen(node.cond)
-        # инструкция, с помощью которой если if не сработал, нас перебрасывает на метку с else
-        self.add('brfalse', else_label)
+        # генерим условный переход: если if не сработал, нас перебрасывает на метку с else
+        self.cond_jump_msil_gen(node.cond, else_label, False)
         # генерим тело if
         self.msil_gen(node.thenStmts)
-        # здесь выполняется тупо безусловный переход в конец if
-        self.add('br', end_label)
+        self.row = node.row or self.row
+        # здесь выполняется тупо безусловный переход в конец if (не нужен, если тело закончилось return)
+        then_stmts = node.thenStmts.exprs if isinstance(node.thenStmts, StatementListNode) else (node.thenStmts, )
+        if not (then_stmts and isinstance(then_stmts[-1], ReturnOpNode)):
+            self.add('br', end_label)
         # ставим метку конца if
         self.add('', label=else_label)
         if node.elseStmts:
@@ -326,35 +531,38 @@ class CodeGenerator:
     # Генерация кода для цикла while (похожа на if)
     @visitor.when(WhileOpNode)
     def msil_gen(self, node: WhileOpNode) -> None:
-        start_label = CodeLabel()
-        end_label = CodeLabel()
+        cached = self.array_cache_msil_gen(node)
+        start_label = self.label()
+        end_label = self.label()
 
         self.add('', label=start_label)
-        self.msil_gen(node.cond)
-        end_label = CodeLabel()
-        self.add('brfalse', end_label)
+        self.cond_jump_msil_gen(node.cond, end_label, False)
         self.msil_gen(node.stmts)
+        self.row = node.row or self.row
         self.add('br', start_label)
         self.add('', label=end_label)
+        self.cached_arrays = cached
 
     # Генерация кода для for
     @visitor.when(ForOpNode)
     def msil_gen(self, node: ForOpNode) -> None:
-        start_label = CodeLabel()
-        end_label = CodeLabel()
+        cached = self.array_cache_msil_gen(node)
+        start_label = self.label()
+        end_label = self.label()
 
         # генерируем инициализирующий блок
         self.msil_gen(node.decl)
         self.add('', label=start_label)
         # потом создаем условие, согласно которому будет выполняться цикл или нет
-        self.msil_gen(node.cond)
-        self.add('brfalse', end_label)
+        self.cond_jump_msil_gen(node.cond, end_label, False)
         # генерируем тело цикла
         self.msil_gen(node.body)
+        self.row = node.row or self.row
         # ну и инструкции при продвижении цикла вперед
         self.msil_gen(node.stmt)
         self.add('br', start_label)
         self.add('', label=end_label)
+        self.cached_arrays = cached
 
     # Возможная генерация кода для массива
     @visitor.when(ArrNode)
@@ -362,51 +570,157 @@ class CodeGenerator:
         # обычный вариант создания массива
         self.add(f'.field public static {MSIL_TYPE_NAMES[arr.node_type.base_type]}[] {arr.name.name}')
         # Загружаем в стек размер массива
-        self.add('ldc.i4.{}'.format(arr.length.value))
+        self.add('ldc.i4', arr.length.value)
         # Теперь инициализируем массив в памяти
         self.add(f'newarr {MSIL_TYPE_NAMES[arr.node_type.base_type]}')
-        self.add(f'stsfld {MSIL_TYPE_NAMES[arr.node_type.base_type]}[] Program::{arr.name.name}')
 
         # После этого, если есть какие то начальные значения, то заполняем массив ими
-        if arr.arr_type.node_type.base_type == BaseType.INT or arr.arr_type.node_type.base_type == BaseType.CHAR:
-            init_arr_str = 'stelem.i4'
-        elif arr.arr_type.node_type.base_type == BaseType.FLOAT:
-            init_arr_str = 'stelem.r8'
-        else:
-            init_arr_str = 'stelem.ref'  # Для строк
-
-        for i in range(0, arr.length.value):
+        init_arr_str = 'stelem.' + ARRAY_ELEM_SUFFIXES[arr.node_type.base_type][1]
+
+        # константные элементы копируются одним вызовом из блока .data, поэлементно заполняются только остальные
+        elements = list(enumerate(arr.elements))
+        data = self.array_data(arr)
+        if data is not None:
+            name = self.data_block(data)
+            self.add('dup')
+            self.add(f'ldtoken field valuetype {PROGRAM_CLASS_NAME}/__Data{name} {PROGRAM_CLASS_NAME}::__data{name}')
+            self.add('call void [mscorlib]System.Runtime.CompilerServices.RuntimeHelpers::InitializeArray('
+                     'class [mscorlib]System.Array, valuetype [mscorlib]System.RuntimeFieldHandle)')
+            elements = [(i, element) for i, element in elements
+                        if self.array_element_value(arr, element) is None]
+
+        for i, element in elements:
+            self.add('dup')
             # Загружаем в стек индекс массива
-            self.add(f'ldc.i4.{i}')
+            self.add('ldc.i4', i)
             # И затем само значение
-            self.msil_gen(arr.elements[i])
+            self.value_msil_gen(element)
             # После этого инициализируем определенную ячейку памяти массива этим значением
             self.add(init_arr_str)
+        self.add(f'stsfld {MSIL_TYPE_NAMES[arr.node_type.base_type]}[] Program::{arr.name.name}')
+
+    # Значение элемента массива, которое можно записать в блок .data (None - элемент вычисляется)
+    @staticmethod
+    def array_element_value(arr: ArrNode, element: AstNode) -> Union[int, float, None]:
+        if not isinstance(element, LiteralNode):
+            return None
+        base_type = arr.node_type.base_type
+        value = element.value
+        if base_type == BaseType.CHAR and isinstance(value, str) and len(value) == 1:
+            return ord(value)
+        if base_type == BaseType.INT and type(value) is int and -2 ** 31 <= value < 2 ** 31:
+            return value
+        if base_type == BaseType.FLOAT and type(value) in (int, float):
+            return float(value)
+        return None
+
+    # Содержимое блока .data для всего массива (None, если константных элементов мало)
+    def array_data(self, arr: ArrNode) -> Optional[bytes]:
+        fmt = ARRAY_DATA_FORMATS.get(arr.node_type.base_type)
+        if fmt is None:
+            return None
+        values = [self.array_element_value(arr, element) for element in arr.elements]
+        if sum(value is not None for value in values) < ARRAY_DATA_MIN_ELEMENTS:
+            return None
+        values += [0] * (arr.length.value - len(values))
+        return b''.join(struct.pack(fmt[0], value or 0) for value in values)
+
+    # Новый блок .data текущего метода (имя уникально в программе: функции генерируются независимо друг от друга).
+    # Блоки функции - _{имя}_{номер} (номер отделяется последним '_'), блоки Main - $main_{номер}: '$' не бывает
+    # в идентификаторах языка, поэтому они не совпадут с блоками функции Main или вспомогательной _main0
+    def data_block(self, data: bytes) -> str:
+        if self.func is not None:
+            name = '_{}_{}'.format(self.func.name.name, len(self.data_blocks))
+        else:
+            name = '$main_{}'.format(len(self.data_blocks))
+        self.data_blocks.append((name, data))
+        return name
+
+    # Объявления блоков .data метода (в классе Program после метода): тип нужного размера, данные и поле на них
+    def data_msil_gen(self) -> None:
+        for name, data in self.data_blocks:
+            self.add(f'.class nested private explicit ansi sealed __Data{name} extends [mscorlib]System.ValueType')
+            self.add('{')
+            self.add('.pack 1')
+            self.add(f'.size {len(data)}')
+            self.add('}')
+            self.add('.data D{} = bytearray ({})'.format(name, ' '.join('{:02X}'.format(b) for b in data)))
+            self.add(f'.field private static valuetype {PROGRAM_CLASS_NAME}/__Data{name} __data{name} at D{name}')
+        self.data_blocks = []
 
     # Вариант генерации кода для получения элемента массива по индексу
     def arr_item_get_msil_gen(self, item: ArrItemNode):
-        # Сначала загружаем индекс в стек
-        self.add(f'ldc.i4.{item.index.value}')
-        if item.node_type.base_type == BaseType.INT or item.node_type.base_type == BaseType.CHAR:
-            get_arr_str = 'ldelem.i4'
-        elif item.node_type.base_type == BaseType.FLOAT:
-            get_arr_str = 'ldelem.r8'
-        else:
-            get_arr_str = 'ldelem.ref'      # Для строк
-        self.add(get_arr_str + f' Program::{item.ident.name}')
+        # Сначала ссылка на массив, потом индекс
+        self.array_ref_msil_gen(item)
+        self.value_msil_gen(item.index)
+        self.add('ldelem.' + ARRAY_ELEM_SUFFIXES[item.node_type.base_type][0])
 
     # Вариант генерации кода для установки значения элемента массива по индексу
     def arr_item_set_msil_gen(self, item: ArrItemNode, value):
-        # Сначала загружаем индекс в стек
-        self.add(f'ldc.i4.{item.index.value}')
-        self.msil_gen(value)
-        if item.node_type.base_type == BaseType.INT or item.node_type.base_type == BaseType.CHAR:
-            set_arr_str = 'stelem.i4'
-        elif item.node_type.base_type == BaseType.FLOAT:
-            set_arr_str = 'stelem.r8'
+        self.array_ref_msil_gen(item)
+        self.value_msil_gen(item.index)
+        self.value_msil_gen(value)
+        self.add('stelem.' + ARRAY_ELEM_SUFFIXES[item.node_type.base_type][1])
+
+    # Загрузить в стек ссылку на массив: из локальной переменной, если она закеширована в цикле, иначе из поля
+    def array_ref_msil_gen(self, item: ArrItemNode):
+        ident = item.ident.node_ident
+        if ident in self.cached_arrays:
+            self.add('ldloc', self.array_slots[ident])
         else:
-            set_arr_str = 'stelem.ref'  # Для строк
-        self.add(set_arr_str + f' Program::{item.ident.name}')
+            self.add(f'ldsfld {MSIL_TYPE_NAMES[item.node_type.base_type]}[] {PROGRAM_CLASS_NAME}::{item.ident.name}')
+
+    # Какие массивы кешировать в локальных переменных в циклах метода (ссылка загружается из поля один раз
+    # перед циклом, а не при каждом обращении к элементу)
+    # :param first_slot: первый свободный слот локальных переменных
+    # :return: типы элементов массивов по слотам (для .locals init)
+    def array_cache_plan(self, body: AstNode, first_slot: int) -> Dict[int, TypeDesc]:
+        self.array_plan, self.array_slots, self.cached_arrays = {}, {}, set()
+        slot_types: Dict[int, TypeDesc] = {}
+
+        def visit(node: AstNode, cached: Set[IdentDesc]) -> None:
+            if isinstance(node, (WhileOpNode, ForOpNode)):
+                nodes = list(iter_nodes(node))
+                # объявление массива в цикле создает новый массив; массив функции создается заново
+                # и при рекурсивном вызове
+                declared = {n.name.node_ident for n in nodes if isinstance(n, ArrNode)}
+                calls = any(isinstance(n, FuncCallNode) and not n.name.node_ident.built_in for n in nodes)
+                arrays = []
+                for n in nodes:
+                    if isinstance(n, ArrItemNode):
+                        ident = n.ident.node_ident
+                        if ident not in cached and ident not in declared and ident not in arrays \
+                                and not (calls and ident.scope == ScopeType.LOCAL):
+                            arrays.append(ident)
+                if arrays:
+                    self.array_plan[id(node)] = arrays
+                    for ident in arrays:
+                        if ident not in self.array_slots:
+                            self.array_slots[ident] = slot = first_slot + len(slot_types)
+                            slot_types[slot] = ident.type
+                    cached = cached | set(arrays)
+            for value in vars(node).values():
+                if hasattr(value, 'node_ident'):
+                    visit(value, cached)
+                elif isinstance(value, (tuple, list)):
+                    for v in value:
+                        if hasattr(v, 'node_ident') and not isinstance(v, FuncDeclNode):
+                            visit(v, cached)
+
+        visit(body, set())
+        return slot_types
+
+    # Загрузить перед циклом ссылки на массивы, которые в нем кешируются
+    # :return: прежний набор закешированных массивов (восстанавливается после цикла)
+    def array_cache_msil_gen(self, loop: AstNode) -> Set[IdentDesc]:
+        cached = self.cached_arrays
+        arrays = self.array_plan.get(id(loop))
+        if arrays:
+            for ident in arrays:
+                self.add(f'ldsfld {MSIL_TYPE_NAMES[ident.type.base_type]}[] {PROGRAM_CLASS_NAME}::{ident.name}')
+                self.add('stloc', self.array_slots[ident])
+            self.cached_arrays = cached | set(arrays)
+        return cached
 
     # Генерация кода описания функции
     @visitor.when(FuncDeclNode)
@@ -415,6 +729,7 @@ class CodeGenerator:
         # в результате генерации сигнатуры должна получиться такая басня
         # .method public static int32 Add(int32 a, int32 b) cil managed (как пример)
 
+        self.row = func.row
         # итак, тут мы приводим параметры в нужный нам вид
         params = ''
         for p in func.params.params:
@@ -423,21 +738,18 @@ class CodeGenerator:
             params += f'{MSIL_TYPE_NAMES[p.decl_type.node_type.base_type]} {str(p.ident.name)}'
         self.add(f'.method public static {MSIL_TYPE_NAMES[func.func_type.node_type.base_type]} {func.name}({params}) cil managed')
         self.add('{')
+        self.label_index = 0
 
         # Тут мы ищем все локальные переменные и заносим их в специальный блок (ну тупо как в Паскале или первые стандарты написания кода в Си)
         # чтобы получилась такая дичь     .locals init (int32 result, int32 i)   (как пример)
-        local_vars_decls = find_vars_decls(func)
-        decl = '.locals init ('
-        count = 0
-        for var in local_vars_decls:
-            if var.ident.node_ident.scope == ScopeType.LOCAL:
-                    if count > 0:
-                        decl += ', '
-                    decl += f'{MSIL_TYPE_NAMES[var.node_type.base_type]} _v{var.node_ident.index}'
-                    count += 1
-        decl += ')'
-        if count > 0:
-            self.add(decl)
+        # объявления собраны при семантической проверке (FuncDeclNode.var_decls)
+        self.locals_msil_gen(func.var_decls, func.body)
+        self.func = func
+        self.func_start = None
+        if any(isinstance(node, ReturnOpNode) and isinstance(node.value, FuncCallNode)
+               and node.value.name.name == func.name.name for node in iter_nodes(func.body)):
+            self.func_start = self.label()
+            self.add('', label=self.func_start)
 
         # и осталось сгенерировать набор инструкция тела функции
         self.msil_gen(func.body)
@@ -447,42 +759,75 @@ class CodeGenerator:
                 len(func.body.childs) > 0 and isinstance(func.body.childs[-1], ReturnOpNode)):
             self.add('ret')
         self.add('}')
+        self.data_msil_gen()
+
+    # Объявление слотов локальных переменных метода (и слотов для ссылок на массивы, кешируемых в циклах body)
+    def locals_msil_gen(self, var_decls: List[DeclNode], body: AstNode) -> None:
+        # переменные из непересекающихся блоков могут занимать один слот (см. IdentScope.release_locals)
+        slots = {}
+        for var in var_decls:
+            if var.ident.node_ident.scope == ScopeType.LOCAL:
+                slots[var.ident.node_ident.index] = MSIL_TYPE_NAMES[var.ident.node_ident.type.base_type]
+        for index, type_ in self.array_cache_plan(body, max(slots, default=-1) + 1).items():
+            slots[index] = MSIL_TYPE_NAMES[type_.base_type] + '[]'
+        if slots:
+            # слоты нумеруются по порядку объявления, поэтому пропуски (слоты имен массивов, которые хранятся
+            # в полях) тоже объявляются
+            self.add('.locals init (' + ', '.join(
+                f'{slots.get(index, MSIL_TYPE_NAMES[BaseType.INT])} _v{index}' for index in range(max(slots) + 1)
+            ) + ')')
 
     # Генерация списка выражений
     @visitor.when(StatementListNode)
     def msil_gen(self, node: StatementListNode) -> None:
         # ну здесь тупо проходимся по всему списку и делаем с каждым выражением грязь
         for stmt in node.exprs:
+            self.row = stmt.row or self.row
             self.msil_gen(stmt)
+            # после return код недостижим (а в подстановке стек в нем был бы не пуст)
+            if isinstance(stmt, ReturnOpNode):
+                break
+
+    # Генерация кода функции верхнего уровня (переопределяется, например, в incremental.py)
+    def msil_gen_func(self, func: FuncDeclNode) -> None:
+        self.msil_gen(func)
 
     # Самая вишенка: генерация всей программы
     def msil_gen_program(self, prog: StatementListNode):
         # ставим метку начала
         self.start()
-        # находим все глобальные переменные и делаем их статическими полями базового класса Program
-        global_vars_decls = find_vars_decls(prog)
-        for var in global_vars_decls:
+        # все глобальные переменные (собраны при семантической проверке) делаем статическими полями базового класса Program
+        for var in prog.var_decls:
             if var.ident.node_ident.scope == ScopeType.GLOBAL:
                 self.add(f'.field public static {MSIL_TYPE_NAMES[var.decl_type.node_type.base_type]} _gv{var.ident.node_ident.index}')
         # Тут генерируем все описания функций
         for stmt in prog.exprs:
             if isinstance(stmt, FuncDeclNode):
-                self.msil_gen(stmt)
+                self.msil_gen_func(stmt)
 
         # главное: точка входа в программу
+        self.row = None
         self.add('')
         self.add('.method public static void Main()')
         self.add('{')
+        self.label_index = 0
+        self.func = self.func_start = None
         self.add('.entrypoint')
+        # локальные переменные Main (например, вынесенные из циклов инварианты, см. licm.py)
+        self.locals_msil_gen(prog.var_decls, prog)
 
         # здесь генерируем код функции main
         for stmt in prog.childs:
             # а здесь уже все объявления функций выкидываем, никому не нужны функции в функции
             if not isinstance(stmt, FuncDeclNode):
+                self.row = stmt.row or self.row
                 self.msil_gen(stmt)
 
         # т.к. "глобальный" код будет функцией, обязательно надо добавить ret
         self.add('ret')
 
         self.add('}')
+        self.data_msil_gen()
         self.end()
+        if self.optimize and self.out is None:
+            self.code_lines = peephole.optimize(self.code_lines)
@@ -0,0 +1,144 @@
+"""Статистика размера сгенерированного MSIL-кода (строк gen.code или gen.code_lines)
+
+По методам: инструкции, метки, слоты локальных переменных (.locals init), вызовы методов CompilerDemo.Runtime
+(по имени), методов Program и библиотечных методов (System.String::Concat и т.п.). По программе: статические
+поля (глобальные переменные и массивы) и блоки .data. Размер кода метода определяет время JIT-компиляции,
+поэтому рост кол-ва инструкций проверяется на эталонном наборе программ (consistency/code_size.py).
+"""
+import re
+import sys
+from collections import Counter
+from typing import Dict, Iterable, Optional, TextIO, Union
+
+from code_gen import CodeGenerator, CodeLine, RUNTIME_CLASS_NAME, PROGRAM_CLASS_NAME
+from mel_ast import StatementListNode
+
+_LABEL_RE = re.compile(r'(IL_\d+):\s*(.*)$')
+_METHOD_RE = re.compile(r'\.method .*?(\w+)\(')
+_CALL_RE = re.compile(r'(\S+)::(\w+)\(')
+
+
+class MethodStats:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.instructions = 0
+        self.labels = 0
+        self.locals = 0
+        self.runtime_calls: Dict[str, int] = Counter()  # имя метода Runtime -> кол-во вызовов
+        self.calls = 0        # вызовы методов Program
+        self.other_calls = 0  # вызовы библиотечных методов
+
+    def as_dict(self) -> dict:
+        return {
+            'instructions': self.instructions,
+            'labels': self.labels,
+            'locals': self.locals,
+            'runtime_calls': dict(sorted(self.runtime_calls.items())),
+            'calls': self.calls,
+            'other_calls': self.other_calls,
+        }
+
+
+class CodeStats:
+    def __init__(self) -> None:
+        self.methods: Dict[str, MethodStats] = {}
+        self.fields = 0
+        self.data_blocks = 0
+
+    @property
+    def instructions(self) -> int:
+        return sum(m.instructions for m in self.methods.values())
+
+    @property
+    def labels(self) -> int:
+        return sum(m.labels for m in self.methods.values())
+
+    @property
+    def locals(self) -> int:
+        return sum(m.locals for m in self.methods.values())
+
+    @property
+    def runtime_calls(self) -> Dict[str, int]:
+        calls = Counter()
+        for m in self.methods.values():
+            calls.update(m.runtime_calls)
+        return calls
+
+    def as_dict(self) -> dict:
+        return {
+            'instructions': self.instructions,
+            'labels': self.labels,
+            'locals': self.locals,
+            'fields': self.fields,
+            'data_blocks': self.data_blocks,
+            'runtime_calls': dict(sorted(self.runtime_calls.items())),
+            'methods': {name: m.as_dict() for name, m in self.methods.items()},
+        }
+
+    def report(self, out: Optional[TextIO] = None) -> None:
+        out = out or sys.stdout
+        print(f'{"метод":<24} {"инструкции":>10} {"метки":>6} {"locals":>6} {"Runtime":>8} {"Program":>8} '
+              f'{"другие":>6}', file=out)
+        for m in sorted(self.methods.values(), key=lambda m: -m.instructions):
+            print(f'{m.name:<24} {m.instructions:>10} {m.labels:>6} {m.locals:>6} '
+                  f'{sum(m.runtime_calls.values()):>8} {m.calls:>8} {m.other_calls:>6}', file=out)
+        print(f'{"всего":<24} {self.instructions:>10} {self.labels:>6} {self.locals:>6} '
+              f'{sum(self.runtime_calls.values()):>8} {sum(m.calls for m in self.methods.values()):>8} '
+              f'{sum(m.other_calls for m in self.methods.values()):>6}', file=out)
+        print(f'статических полей: {self.fields}, блоков .data: {self.data_blocks}', file=out)
+        if self.runtime_calls:
+            print('вызовы Runtime: ' + ', '.join(f'{name} {count}' for name, count
+                                                 in sorted(self.runtime_calls.items())), file=out)
+
+
+def code_stats(lines: Iterable[Union[str, CodeLine]]) -> CodeStats:
+    """Посчитать статистику по строкам MSIL-кода"""
+    stats = CodeStats()
+    method: Optional[MethodStats] = None
+    method_depth = depth = 0
+    for line in lines:
+        text = str(line).strip()
+        match = _LABEL_RE.match(text)
+        if match:
+            if method is not None:
+                method.labels += 1
+            text = match.group(2)
+        if not text:
+            continue
+        instr = text.split(' ', 1)[0]
+        if text == '{':
+            depth += 1
+        elif text == '}':
+            depth -= 1
+            if method is not None and depth == method_depth:
+                method = None
+        elif instr == '.method':
+            method = MethodStats(_METHOD_RE.match(text).group(1))
+            stats.methods[method.name] = method
+            method_depth = depth
+        elif instr == '.locals':
+            method.locals += text.count(',') + 1
+        elif instr == '.field':
+            # поля __data... - не переменные, а данные блоков .data
+            if ' at ' not in text:
+                stats.fields += 1
+        elif instr == '.data':
+            stats.data_blocks += 1
+        elif not instr.startswith('.') and method is not None:
+            method.instructions += 1
+            if instr == 'call':
+                owner, name = _CALL_RE.search(text).groups()
+                if owner == RUNTIME_CLASS_NAME:
+                    method.runtime_calls[name] += 1
+                elif owner == PROGRAM_CLASS_NAME:
+                    method.calls += 1
+                else:
+                    method.other_calls += 1
+    return stats
+
+
+def program_stats(prog: StatementListNode, optimize: bool = False) -> CodeStats:
+    """Сгенерировать MSIL для проверенной программы (с optimize - с peephole-оптимизацией) и посчитать статистику"""
+    gen = CodeGenerator(None, optimize)
+    gen.msil_gen_program(prog)
+    return code_stats(gen.code_lines)
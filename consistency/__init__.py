@@ -0,0 +1 @@
+"""Наборы программ для проверки исполнителей (consistency.py) и размера кода (code_size.py)"""
@@ -0,0 +1,90 @@
+"""Проверка размера сгенерированного кода: статистика MSIL (code_stats.py) для эталонного набора программ
+сравнивается с записанной в code_size.json. Набор - программы consistency/*.txt, program.txt и программы
+генератора bench/corpus.py; каждая генерируется без оптимизаций и с -O.
+
+Проверка не проходит (код возврата 1), если кол-во инструкций программы выросло больше, чем на --threshold
+процентов; для таких программ выводится рост по методам. --update записывает текущую статистику
+в code_size.json (после намеренного изменения code_gen.py)."""
+import argparse
+import glob
+import json
+import os
+import sys
+from typing import Dict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+import code_stats
+from consistency.consistency import prepare
+from corpus import program, logging_program, tables_program, array_program
+
+GOLDEN = os.path.join(HERE, 'code_size.json')
+
+
+def sources() -> Dict[str, str]:
+    """Эталонный набор: имя -> исходный код"""
+    result = {}
+    for path in sorted(glob.glob(os.path.join(HERE, '*.txt'))) + [os.path.join(ROOT, 'program.txt')]:
+        with open(path) as f:
+            result[os.path.basename(path)] = f.read()
+    result['corpus.program'] = program(20, 5)
+    result['corpus.logging_program'] = logging_program(20)
+    result['corpus.tables_program'] = tables_program(3, 16)
+    result['corpus.array_program'] = array_program(10)
+    return result
+
+
+def collect() -> dict:
+    """Статистика набора: имя программы -> {'base': ..., '-O': ...}"""
+    result = {}
+    for name, src in sources().items():
+        result[name] = {}
+        for optimize in (False, True):
+            stats = code_stats.program_stats(prepare(src, optimize), optimize)
+            result[name]['-O' if optimize else 'base'] = stats.as_dict()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threshold', type=float, default=2.0, help='допустимый рост кол-ва инструкций, %%')
+    parser.add_argument('--update', default=False, action='store_true', help='записать текущую статистику')
+    args = parser.parse_args()
+
+    current = collect()
+    if args.update:
+        with open(GOLDEN, 'w') as f:
+            json.dump(current, f, indent=1, ensure_ascii=False)
+            f.write('\n')
+        print(f'{GOLDEN}: {len(current)} programs')
+        return
+
+    with open(GOLDEN) as f:
+        golden = json.load(f)
+    failures = 0
+    for name, configs in current.items():
+        if name not in golden:
+            print(f'new  {name} (нет в {os.path.basename(GOLDEN)}, запустите --update)')
+            continue
+        for config, stats in configs.items():
+            old = golden[name][config]
+            before, after = old['instructions'], stats['instructions']
+            change = f'{before} -> {after} ({(after - before) * 100 / max(before, 1):+.1f}%)'
+            if after > before * (1 + args.threshold / 100):
+                failures += 1
+                print(f'FAIL {name} {config}: {change}')
+                for method, m in stats['methods'].items():
+                    was = old['methods'].get(method, {}).get('instructions', 0)
+                    if m['instructions'] > was:
+                        print(f'  {method}: {was} -> {m["instructions"]}')
+            elif after != before:
+                print(f'     {name} {config}: {change}')
+    print(f'{len(current)} programs, {failures} failures')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Проверка согласованности исполнителей в процессе (closure_exec.py, register_vm.py, py_backend.py, msil_sim.py)
+между собой. Для каждой программы name.txt из этого каталога ввод берется из name.in (если есть), ожидаемый
+вывод - из name.out; каждый исполнитель запускается без оптимизаций и с -O, сравнивается только stdout (текст
+ошибок выполнения у исполнителей разный, вывод до ошибки - одинаковый). Исключение - переполнение стека
+(глубина вызовов больше closure_exec.CALL_DEPTH_LIMIT): диагностика у всех исполнителей одна и та же, поэтому
+она дописывается к выводу строкой "! сообщение" и тоже сравнивается (в CLR глубина стека другая, поэтому
+recursion.txt через MSIL не проверяется и не записывается).
+
+С --msil программы дополнительно компилируются в MSIL, собираются ilasm вместе с runtime.net/runtime.msil
+и выполняются в CLR (ilasm и CLR нужны в окружении). runtime.msil (и runtime.cs, из которого он получается) -
+ровно те методы CompilerDemo.Runtime, которые вызывает code_gen.py, с тем же поведением, что у closure_exec.Runtime
+(числа - без учета культуры); msil_sim.py выполняет сгенерированный MSIL, но встроенные функции в нем - те же,
+что у остальных исполнителей, поэтому расхождение кодогенерации и runtime.msil с ними находит только --msil.
+--record перезаписывает name.out выводом MSIL в CLR, и name.out становится эталоном пути через MSIL.
+
+Файлы name.out сейчас записаны по выводу исполнителей в процессе (и проверены вручную): без --msil --record
+набор проверяет, что исполнители согласованы друг с другом."""
+import argparse
+import glob
+import io
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import closure_exec
+import code_gen
+import inline
+import licm
+import msil_sim
+import my_parser
+import promote
+import py_backend
+import register_vm
+import split_main
+from mel_ast import StatementListNode
+from my_semantic_baza import prepare_global_scope
+
+ENGINES = {'closure': closure_exec, 'vm': register_vm, 'python': py_backend, 'msil-sim': msil_sim}
+RUNTIME_MSIL = os.path.join(ROOT, 'runtime.net', 'runtime.msil')
+
+
+def prepare(src: str, optimize: bool) -> StatementListNode:
+    """Разобрать, проверить и (с optimize) оптимизировать программу так же, как main.py -O"""
+    prog = my_parser.parse(src)
+    prog.semantic_check(prepare_global_scope())
+    if optimize:
+        inline.inline_calls(prog)
+        licm.hoist_invariants(prog)
+        promote.promote_globals(prog)
+        split_main.split_main(prog)
+    return prog
+
+
+def run_engine(engine, src: str, optimize: bool, stdin: str) -> str:
+    out = io.StringIO()
+    try:
+        if engine is msil_sim:
+            # сгенерированный MSIL в симуляторе (с -O - и после peephole.py)
+            msil_sim.run(prepare(src, optimize), io.StringIO(stdin), out, optimize)
+        else:
+            engine.run(prepare(src, optimize), io.StringIO(stdin), out)
+    except closure_exec.StackOverflowError as e:
+        out.write('! {}\n'.format(e.message))
+    except closure_exec.ExecutionError:
+        pass
+    return out.getvalue()
+
+
+def run_msil(src: str, optimize: bool, stdin: str, ilasm: str, clr: str) -> str:
+    with tempfile.TemporaryDirectory() as tmp:
+        msil = os.path.join(tmp, 'program.msil')
+        exe = os.path.join(tmp, 'program.exe')
+        with open(msil, 'w') as f:
+            code_gen.CodeGenerator(f, optimize).msil_gen_program(prepare(src, optimize))
+        subprocess.run([ilasm, '/out:' + exe, msil, RUNTIME_MSIL], check=True, stdout=subprocess.DEVNULL)
+        # числа runtime.msil форматирует без учета культуры, LC_ALL=C - на случай других зависимостей от нее
+        env = dict(os.environ, LC_ALL='C')
+        result = subprocess.run(clr.split() + [exe], input=stdin, capture_output=True, text=True, env=env)
+        return result.stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('programs', nargs='*', help='программы (по умолчанию - все *.txt этого каталога)')
+    parser.add_argument('--engine', action='append', choices=sorted(ENGINES), help='только эти исполнители')
+    parser.add_argument('--msil', default=False, action='store_true', help='проверять и путь через ilasm и CLR')
+    parser.add_argument('--record', default=False, action='store_true', help='записать name.out по выводу MSIL')
+    parser.add_argument('--ilasm', default=os.path.join(ROOT, 'bin', 'ilasm'))
+    parser.add_argument('--clr', default='mono', help='команда запуска .exe')
+    args = parser.parse_args()
+
+    programs = args.programs or sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.txt')))
+    engines = {name: ENGINES[name] for name in args.engine or ENGINES}
+    failures = 0
+    for path in programs:
+        base = os.path.splitext(path)[0]
+        with open(path) as f:
+            src = f.read()
+        stdin = ''
+        if os.path.exists(base + '.in'):
+            with open(base + '.in') as f:
+                stdin = f.read()
+        # в CLR глубина стека другая (см. выше)
+        via_clr = (args.msil or args.record) and os.path.basename(base) != 'recursion'
+        if args.record and via_clr:
+            with open(base + '.out', 'w') as f:
+                f.write(run_msil(src, False, stdin, args.ilasm, args.clr))
+        with open(base + '.out') as f:
+            expected = f.read()
+
+        runs = [(name, lambda optimize, engine=engine: run_engine(engine, src, optimize, stdin))
+                for name, engine in engines.items()]
+        if args.msil and via_clr:
+            runs.append(('msil', lambda optimize: run_msil(src, optimize, stdin, args.ilasm, args.clr)))
+        failed = 0
+        for name, run in runs:
+            for optimize in (False, True):
+                actual = run(optimize)
+                if actual != expected:
+                    failed += 1
+                    print(f'FAIL {os.path.basename(path)} {name}{" -O" if optimize else ""}')
+                    print(f'  ожидалось: {expected!r}')
+                    print(f'  получено:  {actual!r}')
+        print(f'{"FAIL" if failed else "ok  "} {os.path.basename(path)}')
+        failures += failed
+    print(f'{len(programs)} programs, {failures} failures')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+import hashlib
+import os
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pyparsing as plt
+
+import my_parser
+import parallel_check
+from code_gen import CodeGenerator, CodeLine
+from mel_ast import FuncDeclNode, iter_nodes
+from my_semantic_baza import IdentScope, SemanticException, prepare_global_scope
+
+
+# Сигнатура глобального имени, от которой зависят проверка и код функции: (тип, индекс, встроенное)
+# или None, если имя функции не видно
+DepSig = Optional[Tuple[str, int, bool]]
+
+
+def fingerprint(node) -> str:
+    """Отпечаток текста узла: структура дерева до семантической проверки (без номеров строк)"""
+    parts: List[str] = []
+
+    def dump(value) -> None:
+        if hasattr(value, 'node_ident'):
+            parts.append(type(value).__name__ + '(')
+            for k, v in vars(value).items():
+                if k not in ('row', 'node_type', 'node_ident', 'deps'):
+                    parts.append(k + '=')
+                    dump(v)
+            parts.append(')')
+        elif isinstance(value, (tuple, list)):
+            parts.append('[')
+            for v in value:
+                dump(v)
+            parts.append(']')
+        else:
+            parts.append(repr(str(value)))
+
+    dump(node)
+    return hashlib.sha1(' '.join(parts).encode()).hexdigest()
+
+
+def _dep_sigs(names: Iterable[str], scope: IdentScope, order: Dict[str, int], visible: int) -> Dict[str, DepSig]:
+    """Текущие сигнатуры глобальных имен, какими их видит функция
+    :param order: порядковый номер имени в глобальной области
+    :param visible: кол-во видимых функции глобальных имен (сама функция - следующая)
+    """
+    sigs: Dict[str, DepSig] = {}
+    for name in names:
+        if order.get(name, visible + 1) <= visible:
+            ident = scope.idents[name]
+            sigs[name] = (str(ident.type), ident.index, ident.built_in)
+        else:
+            sigs[name] = None
+    return sigs
+
+
+class _FuncEntry:
+    """Результат сборки функции: проверенный узел, сигнатуры зависимостей и сгенерированный код"""
+
+    def __init__(self, func: FuncDeclNode, deps: Dict[str, DepSig], code_lines: List[CodeLine]) -> None:
+        self.func = func
+        self.deps = deps
+        self.code_lines = code_lines
+
+    def move(self, row: int) -> None:
+        """Сдвинуть номера строк (узлов дерева и CodeLine.row) так, чтобы функция начиналась в строке row
+        (отпечаток не зависит от номеров строк, а над функцией могли добавиться или удалиться строки)"""
+        delta = row - self.func.row
+        if not delta:
+            return
+        for node in {id(node): node for node in iter_nodes(self.func)}.values():
+            if node.row is not None:
+                node.row += delta
+        for line in self.code_lines:
+            if line.row is not None:
+                line.row += delta
+
+
+class _CachingCodeGenerator(CodeGenerator):
+    """Генератор, подставляющий вместо функций уже сгенерированный код
+    (метки нумеруются в пределах метода, поэтому код функции не зависит от остальной программы)"""
+
+    def __init__(self, funcs_code: Dict[int, List[CodeLine]]) -> None:
+        super().__init__()
+        self.funcs_code = funcs_code
+
+    def msil_gen_func(self, func: FuncDeclNode) -> None:
+        self.code_lines.extend(self.funcs_code[id(func)])
+
+
+class IncrementalBuild:
+    """Инкрементальная сборка программы
+    При каждом update глобальный код проверяется и генерируется заново, а функции - только если изменился
+    их текст или сигнатура какого-либо глобального имени, которое они используют (FuncDeclNode.deps).
+    Результат совпадает с полной сборкой.
+    """
+
+    def __init__(self) -> None:
+        self._cache: Dict[str, _FuncEntry] = {}
+        self.checked: List[str] = []  # функции, проверенные при последнем update
+        self.reused: List[str] = []   # функции, взятые из предыдущей сборки
+
+    def update(self, src: str) -> List[str]:
+        """Собрать новую версию программы
+        :return: строки MSIL-кода (как CodeGenerator.code)
+        """
+        prog = my_parser.parse(src)
+        fingerprints = {i: fingerprint(stmt) for i, stmt in enumerate(prog.exprs) if isinstance(stmt, FuncDeclNode)}
+        scope = prepare_global_scope()
+        tasks, _, error = parallel_check.check_globals(prog, scope)
+        global_items = list(scope.idents.items())
+        order = {name: n for n, (name, _) in enumerate(global_items)}
+
+        self.checked, self.reused = [], []
+        cache: Dict[str, _FuncEntry] = {}
+        funcs_code: Dict[int, List[CodeLine]] = {}
+        exprs = list(prog.exprs)
+        for index, func, visible in tasks:
+            entry = self._cache.get(fingerprints[index])
+            if entry is not None and entry.deps == _dep_sigs(entry.deps, scope, order, visible):
+                parallel_check.merge_idents(entry.func, scope.idents)
+                entry.move(func.row)
+                self.reused.append(func.name.name)
+            else:
+                func, errors = parallel_check.check_func_body(func, global_items, visible)
+                if errors:
+                    raise errors[0]
+                gen = CodeGenerator()
+                gen.depth = 1  # функции находятся внутри класса Program
+                gen.msil_gen(func)
+                entry = _FuncEntry(func, _dep_sigs(func.deps, scope, order, visible), gen.code_lines)
+                self.checked.append(func.name.name)
+            cache[fingerprints[index]] = entry
+            exprs[index] = entry.func
+            funcs_code[id(entry.func)] = entry.code_lines
+        if error is not None:
+            raise error
+        prog.exprs = tuple(exprs)
+        self._cache = cache
+
+        gen = _CachingCodeGenerator(funcs_code)
+        gen.msil_gen_program(prog)
+        return gen.code
+
+
+def watch(src_path: str, out_path: str, interval: float = 0.5) -> None:
+    """Пересобирать программу при каждом изменении файла (до прерывания)"""
+    build = IncrementalBuild()
+    mtime = None
+    while True:
+        curr_mtime = os.stat(src_path).st_mtime_ns
+        if curr_mtime != mtime:
+            mtime = curr_mtime
+            with open(src_path, mode='r') as f:
+                src = f.read()
+            start = time.perf_counter()
+            try:
+                code = build.update(src)
+            except SemanticException as e:
+                print('Ошибка: {}'.format(e.message), file=sys.stderr)
+            except plt.ParseBaseException as e:
+                print('Ошибка: {}'.format(e), file=sys.stderr)
+            else:
+                with open(out_path, mode='w') as f:
+                    print(*code, sep=os.linesep, file=f)
+                print('{}: функций проверено {}, без изменений {} ({:.3f} с)'.format(
+                    out_path, len(build.checked), len(build.reused), time.perf_counter() - start
+                ), file=sys.stderr)
+        time.sleep(interval)
@@ -0,0 +1,169 @@
+"""Подстановка (inlining) небольших пользовательских функций на место вызова
+
+Выполняется над проверенным деревом перед кодогенерацией. Вызов FuncCallNode заменяется на InlineCallNode:
+аргументы записываются в новые локальные переменные, а тело функции копируется, причем параметры и локальные
+переменные функции заменяются новыми локальными переменными вызывающего метода. return в копии тела
+генерируется как переход в конец подстановки (см. CodeGenerator.msil_gen(InlineCallNode)).
+
+Подставляются функции, которые:
+    - не рекурсивны (в том числе через другие функции);
+    - не больше max_size узлов вместе с подставленными в них вызовами;
+    - не содержат return внутри циклов и объявлений массивов;
+    - (если возвращают значение) заканчиваются return.
+"""
+import copy
+from typing import Dict, List, Optional, Set
+
+from mel_ast import AstNode, IdentNode, FuncCallNode, FuncDeclNode, ReturnOpNode, DeclNode, DeclTypeNode, ArrNode, \
+    StatementListNode, WhileOpNode, ForOpNode, InlineCallNode, iter_nodes
+from my_semantic_baza import IdentDesc, ScopeType, TypeDesc
+
+# Максимальный размер подставляемой функции (кол-во узлов тела)
+INLINE_MAX_SIZE = 48
+
+
+def _calls(node: AstNode) -> List[FuncCallNode]:
+    return [n for n in iter_nodes(node) if isinstance(n, FuncCallNode) and not n.name.node_ident.built_in]
+
+
+def _structured(func: FuncDeclNode) -> bool:
+    """Тело функции можно подставить: return только вне циклов, нет массивов, функция со значением
+    заканчивается return"""
+    for node in iter_nodes(func.body):
+        if isinstance(node, ArrNode):
+            return False
+        if isinstance(node, (WhileOpNode, ForOpNode)) and any(isinstance(n, ReturnOpNode) for n in iter_nodes(node)):
+            return False
+    if func.func_type.type == TypeDesc.VOID:
+        return True
+    body = func.body
+    if isinstance(body, StatementListNode):
+        body = body.exprs[-1] if body.exprs else None
+    return isinstance(body, ReturnOpNode)
+
+
+class _Inliner:
+    def __init__(self, prog: StatementListNode, max_size: int) -> None:
+        self.funcs: Dict[str, FuncDeclNode] = {
+            stmt.name.name: stmt for stmt in prog.exprs if isinstance(stmt, FuncDeclNode)
+        }
+        self.max_size = max_size
+        self.inlined = 0
+        # размеры считаются до изменения тел
+        calls = {name: {call.name.name for call in _calls(func.body)} for name, func in self.funcs.items()}
+        recursive = set()
+        for name in self.funcs:
+            reachable, stack = set(), list(calls[name])
+            while stack:
+                callee = stack.pop()
+                if callee not in reachable:
+                    reachable.add(callee)
+                    stack.extend(calls[callee])
+            if name in reachable:
+                recursive.add(name)
+        self.sizes: Dict[str, Optional[int]] = {}  # размер функции с подстановками (None - не подставляется)
+        for name in self.funcs:
+            self.size(name, recursive)
+
+    def size(self, name: str, recursive: Set[str]) -> Optional[int]:
+        """Размер функции вместе с подставленными в нее вызовами, None - функцию нельзя подставить"""
+        if name not in self.sizes:
+            func = self.funcs[name]
+            size = None
+            if name not in recursive and _structured(func):
+                size = sum(1 for _ in iter_nodes(func.body))
+                # граф вызовов нерекурсивных функций ацикличен
+                for call in _calls(func.body):
+                    size += self.size(call.name.name, recursive) or 0
+                if size > self.max_size:
+                    size = None
+            self.sizes[name] = size
+        return self.sizes[name]
+
+    def method(self, var_decls: List[DeclNode], body: AstNode) -> None:
+        """Подставить вызовы в теле метода
+        :param var_decls: объявления переменных метода (сюда добавляются новые локальные переменные)
+        """
+        self.var_decls = var_decls
+        self.next_index = max((decl.ident.node_ident.index + 1 for decl in var_decls
+                               if decl.ident.node_ident.scope == ScopeType.LOCAL), default=0)
+        self.visit(body)
+
+    def replace(self, value, statement: bool = False):
+        if isinstance(value, FuncCallNode) and not value.name.node_ident.built_in \
+                and self.sizes[value.name.name] is not None \
+                and not (statement and value.node_type != TypeDesc.VOID):  # значение вызова-оператора не снимается со стека
+            return self.inline(value)
+        if isinstance(value, FuncDeclNode):
+            return value
+        if hasattr(value, 'node_ident'):
+            self.visit(value)
+        elif isinstance(value, (tuple, list)):
+            return type(value)(self.replace(v, statement) for v in value)
+        return value
+
+    def visit(self, node: AstNode) -> None:
+        for attr, value in list(vars(node).items()):
+            if attr != 'node_ident':
+                new = self.replace(value, isinstance(node, StatementListNode) and attr == 'exprs')
+                if new is not value:
+                    setattr(node, attr, new)
+
+    def local(self, name: str, type_: TypeDesc, index: int) -> IdentDesc:
+        ident = IdentDesc(name, type_, ScopeType.LOCAL, index)
+        # .locals init обнуляет переменные только при входе в метод, а подстановка может выполняться многократно
+        ident.reused = True
+        return ident
+
+    def inline(self, call: FuncCallNode) -> InlineCallNode:
+        func = self.funcs[call.name.name]
+        # сначала вызовы в аргументах: они тоже занимают новые переменные
+        args = [self.replace(arg) for arg in call.params.params]
+        base = self.next_index
+        memo = {}
+        # глобальные имена в копии тела остаются теми же объектами
+        for node in iter_nodes(func.body):
+            ident = node.node_ident
+            if ident is not None and ident.scope == ScopeType.GLOBAL:
+                memo[id(ident)] = ident
+
+        params = []
+        for param, arg in zip(func.params.params, args):
+            old = param.ident.node_ident
+            new = memo[id(old)] = self.local('{}.{}'.format(func.name.name, old.name), old.type, base + old.index)
+            decl = DeclNode(DeclTypeNode(str(old.type)), IdentNode(new.name), arg, row=call.row)
+            decl.decl_type.node_type = old.type
+            decl.ident.node_type, decl.ident.node_ident = old.type, new
+            decl.node_type = TypeDesc.VOID
+            params.append(decl)
+        base += len(params)
+        size = 0
+        for decl in func.var_decls:
+            old = decl.ident.node_ident
+            if old.scope == ScopeType.LOCAL and id(old) not in memo:
+                memo[id(old)] = self.local('{}.{}'.format(func.name.name, old.name), old.type, base + old.index)
+                size = max(size, old.index + 1)
+        self.next_index = base + size
+
+        body = copy.deepcopy(func.body, memo)
+        self.var_decls.extend(params)
+        self.var_decls.extend(memo[id(decl)] for decl in func.var_decls if id(decl) in memo)
+        # вызовы в подставленном теле тоже подставляются (функции не рекурсивны, поэтому это конечно)
+        self.visit(body)
+
+        node = InlineCallNode(call.name, tuple(params), body, row=call.row)
+        node.node_type = call.node_type
+        self.inlined += 1
+        return node
+
+
+def inline_calls(prog: StatementListNode, max_size: int = INLINE_MAX_SIZE) -> int:
+    """Подставить небольшие функции на место вызовов во всей программе (дерево изменяется на месте)
+    :return: кол-во подставленных вызовов
+    """
+    inliner = _Inliner(prog, max_size)
+    for stmt in prog.exprs:
+        if isinstance(stmt, FuncDeclNode):
+            inliner.method(stmt.var_decls, stmt.body)
+    inliner.method(prog.var_decls, prog)
+    return inliner.inlined
@@ -0,0 +1,183 @@
+"""Вынос инвариантных вычислений из циклов (loop-invariant code motion)
+
+Выполняется над проверенным деревом перед кодогенерацией. В условии, теле и шаге цикла while/for ищутся
+максимальные подвыражения (BinOpNode, TypeConvertNode), которые не меняются в цикле: в них нет вызовов функций
+и элементов массивов, а переменные не присваиваются и не объявляются в цикле (с учетом глобальных переменных,
+которые присваивают вызываемые в цикле функции). Такие выражения вычисляются один раз перед циклом
+в новые локальные переменные. Деление и остаток выносятся, только если делитель - ненулевая константа
+(цикл может не выполниться ни разу, а исключение появиться не должно).
+"""
+from typing import Dict, List, Set, Tuple
+
+from mel_ast import AstNode, LiteralNode, IdentNode, BinOpNode, TypeConvertNode, FuncCallNode, AssignNode, DeclNode, \
+    DeclTypeNode, ArrNode, ArrItemNode, StatementListNode, WhileOpNode, ForOpNode, FuncDeclNode, iter_nodes
+from my_semantic_baza import BinOp, IdentDesc, ScopeType, TypeDesc
+
+
+def _effects(node: AstNode) -> Tuple[Set[IdentDesc], Set[str]]:
+    """Переменные, которые присваиваются или объявляются в поддереве, и вызываемые пользовательские функции"""
+    assigned: Set[IdentDesc] = set()
+    calls: Set[str] = set()
+    for n in iter_nodes(node):
+        if isinstance(n, AssignNode):
+            var = n.var.ident if isinstance(n.var, ArrItemNode) else n.var
+            assigned.add(var.node_ident)
+        elif isinstance(n, DeclNode):
+            assigned.add(n.ident.node_ident)
+        elif isinstance(n, ArrNode):
+            assigned.add(n.name.node_ident)
+        elif isinstance(n, FuncCallNode) and not n.name.node_ident.built_in:
+            calls.add(n.name.name)
+    return assigned, calls
+
+
+def func_effects(prog: StatementListNode) -> Dict[str, Set[IdentDesc]]:
+    """Глобальные переменные, которые может изменить каждая функция (в том числе через вызовы других функций)"""
+    assigned: Dict[str, Set[IdentDesc]] = {}
+    calls: Dict[str, Set[str]] = {}
+    for stmt in prog.exprs:
+        if isinstance(stmt, FuncDeclNode):
+            idents, calls[stmt.name.name] = _effects(stmt.body)
+            assigned[stmt.name.name] = {ident for ident in idents if ident.scope == ScopeType.GLOBAL}
+    changed = True
+    while changed:
+        changed = False
+        for name, idents in assigned.items():
+            for callee in calls[name]:
+                new = assigned.get(callee, set()) - idents
+                if new:
+                    idents |= new
+                    changed = True
+    return assigned
+
+
+def _key(node: AstNode):
+    """Ключ для поиска одинаковых выражений (выносится только одно из них)"""
+    if isinstance(node, LiteralNode):
+        return 'literal', str(node.node_type), repr(node.value)
+    if isinstance(node, IdentNode):
+        return 'ident', id(node.node_ident)
+    if isinstance(node, BinOpNode):
+        return 'binop', node.op, _key(node.arg1), _key(node.arg2)
+    return 'convert', str(node.node_type), _key(node.expr)
+
+
+class _Hoister:
+    """Вынос инвариантов из циклов одного метода (функции или Main)"""
+
+    def __init__(self, effects: Dict[str, Set[IdentDesc]], var_decls: List[DeclNode]) -> None:
+        """
+        :param effects: результат func_effects
+        :param var_decls: объявления переменных метода (сюда добавляются новые локальные переменные)
+        """
+        self.effects = effects
+        self.var_decls = var_decls
+        self.next_index = max((decl.ident.node_ident.index + 1 for decl in var_decls
+                               if decl.ident.node_ident.scope == ScopeType.LOCAL), default=0)
+        self.hoisted = 0
+
+    def block(self, block: StatementListNode) -> None:
+        exprs = []
+        for stmt in block.exprs:
+            if isinstance(stmt, FuncDeclNode):
+                exprs.append(stmt)
+                continue
+            if isinstance(stmt, (WhileOpNode, ForOpNode)):
+                exprs.extend(self.loop(stmt))
+            exprs.append(stmt)
+            # вложенные блоки (в том числе тело цикла: вложенные циклы обрабатываются после внешнего)
+            for value in vars(stmt).values():
+                if isinstance(value, StatementListNode):
+                    self.block(value)
+        block.exprs = tuple(exprs)
+
+    def loop(self, loop: AstNode) -> List[DeclNode]:
+        """Вынести инварианты цикла
+        :return: объявления новых переменных, которые надо поставить перед циклом
+        """
+        if isinstance(loop, WhileOpNode):
+            attrs = ('cond', 'stmts')
+            assigned: Set[IdentDesc] = set()
+        else:
+            attrs = ('cond', 'body', 'stmt')
+            # переменные заголовка for еще не объявлены перед циклом
+            assigned, _ = _effects(loop.decl)
+        calls: Set[str] = set()
+        for attr in attrs:
+            part_assigned, part_calls = _effects(getattr(loop, attr))
+            assigned |= part_assigned
+            calls |= part_calls
+        for name in calls:
+            assigned |= self.effects.get(name, set())
+
+        def invariant(node: AstNode) -> bool:
+            if isinstance(node, LiteralNode):
+                return True
+            if isinstance(node, IdentNode):
+                return node.node_ident is not None and node.node_ident not in assigned and node.node_type.is_simple
+            if isinstance(node, BinOpNode):
+                if node.op in (BinOp.DIV, BinOp.MOD) and not (isinstance(node.arg2, LiteralNode) and node.arg2.value):
+                    return False
+                return invariant(node.arg1) and invariant(node.arg2)
+            if isinstance(node, TypeConvertNode):
+                return invariant(node.expr)
+            return False
+
+        temps: Dict[tuple, IdentDesc] = {}
+        decls: List[DeclNode] = []
+
+        def replace(value):
+            if isinstance(value, (BinOpNode, TypeConvertNode)) and invariant(value):
+                return self.temp(value, temps, decls)
+            if hasattr(value, 'node_ident'):
+                visit(value)
+            elif isinstance(value, (tuple, list)):
+                return type(value)(replace(v) for v in value)
+            return value
+
+        def visit(node: AstNode) -> None:
+            for attr, value in list(vars(node).items()):
+                if attr != 'node_ident':
+                    new = replace(value)
+                    if new is not value:
+                        setattr(node, attr, new)
+
+        for attr in attrs:
+            setattr(loop, attr, replace(getattr(loop, attr)))
+        return decls
+
+    def temp(self, expr: AstNode, temps: Dict[tuple, IdentDesc], decls: List[DeclNode]) -> IdentNode:
+        """Переменная, в которую перед циклом записывается значение выражения"""
+        key = _key(expr)
+        ident = temps.get(key)
+        if ident is None:
+            ident = temps[key] = IdentDesc('_inv{}'.format(self.next_index), expr.node_type, ScopeType.LOCAL,
+                                           self.next_index)
+            self.next_index += 1
+            decl = DeclNode(DeclTypeNode(str(expr.node_type)), IdentNode(ident.name), expr, row=expr.row)
+            decl.decl_type.node_type = expr.node_type
+            decl.ident.node_type, decl.ident.node_ident = expr.node_type, ident
+            decl.node_type = TypeDesc.VOID
+            self.var_decls.append(decl)
+            decls.append(decl)
+            self.hoisted += 1
+        node = IdentNode(ident.name, row=expr.row)
+        node.node_type, node.node_ident = ident.type, ident
+        return node
+
+
+def hoist_invariants(prog: StatementListNode) -> int:
+    """Вынести инварианты из всех циклов программы (дерево изменяется на месте)
+    :return: кол-во вынесенных выражений
+    """
+    effects = func_effects(prog)
+    hoisted = 0
+    for stmt in prog.exprs:
+        if isinstance(stmt, FuncDeclNode):
+            hoister = _Hoister(effects, stmt.var_decls)
+            if isinstance(stmt.body, StatementListNode):
+                hoister.block(stmt.body)
+            hoisted += hoister.hoisted
+    hoister = _Hoister(effects, prog.var_decls)
+    hoister.block(prog)
+    return hoisted + hoister.hoisted
@@ -5,36 +5,95 @@ import code_gen
 import argparse
 
 import my_semantic_baza
+import parallel_check
+import parallel_gen
+import incremental
+import licm
+import inline
+import promote
+import split_main
+import closure_exec
+import register_vm
+import py_backend
+import msil_sim
+import code_stats
 
 
 def main1():
     parser = argparse.ArgumentParser(description='Compiler demo program (msil)')
     parser.add_argument('src', type=str, help='source code file')
     parser.add_argument('--msil-only', default=False, action='store_true', help='print only msil code (no ast)')
+    parser.add_argument('-O', '--optimize', default=False, action='store_true', help='optimize: inline small functions, hoist loop invariants, keep Main-only globals in locals, split large Main, peephole-optimize msil')
+    parser.add_argument('--all-errors', default=False, action='store_true', help='report all semantic errors, not only the first')
+    parser.add_argument('--watch', default=False, action='store_true', help='rebuild src.msil incrementally on every change')
+    parser.add_argument('--run', default=False, action='store_true', help='run the program in-process (without msil and .NET)')
+    parser.add_argument('--engine', choices=('closure', 'vm', 'python', 'msil'), default='closure', help='engine for --run: closure-compiled tree, register bytecode vm, python code object or generated msil in the stack-machine simulator')
+    parser.add_argument('--profile', default=False, action='store_true', help='with --engine msil: print executed msil instruction counts per method and per source row to stderr')
+    parser.add_argument('--stats', default=False, action='store_true', help='print generated msil size statistics (instructions, labels, locals, runtime calls per method) instead of msil')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='processes for checking and generating functions (0 - all cpus)')
     args = parser.parse_args()
+    if args.profile and not (args.run and args.engine == 'msil'):
+        parser.error('--profile requires --run --engine msil')
+
+    if args.watch:
+        incremental.watch(args.src, os.path.splitext(args.src)[0] + '.msil')
+        return
 
     with open(args.src, mode='r') as f:
         prog = f.read()
     
     prog1 = my_parser.parse(prog)
+    if args.run or args.stats:
+        args.msil_only = True  # в выводе должен быть только вывод программы (или статистика)
     if not args.msil_only:
         print(prog1)
         print(*prog1.tree, sep=os.linesep)
     try:
 
         scope = my_semantic_baza.prepare_global_scope()
-        prog1.semantic_check(scope)
+        if args.all_errors:
+            scope.diagnostics = []
+        if args.jobs == 1:
+            prog1.semantic_check(scope)
+        else:
+            parallel_check.semantic_check(prog1, scope, args.jobs or None)
     except my_semantic_baza.SemanticException as e:
         print('Ошибка: {}'.format(e.message), file=sys.stderr)
         exit(2)
+    if scope.diagnostics:
+        for e in scope.diagnostics:
+            print('Ошибка: {}'.format(e.message), file=sys.stderr)
+        exit(2)
     if not args.msil_only:
         print(*prog1.tree, sep=os.linesep)
     if not args.msil_only:
         print(" ")
         print("msil:")
-    gen = code_gen.CodeGenerator()
-    gen.msil_gen_program(prog1)
-    print(*gen.code, sep=os.linesep)
+    if args.optimize:
+        inline.inline_calls(prog1)
+        licm.hoist_invariants(prog1)
+        promote.promote_globals(prog1)
+        split_main.split_main(prog1)
+    if args.run:
+        try:
+            if args.engine == 'msil':
+                profile = msil_sim.run(prog1, optimize=args.optimize, workers=args.jobs or None)
+                if args.profile:
+                    profile.report(sys.stderr)
+            else:
+                {'closure': closure_exec, 'vm': register_vm, 'python': py_backend}[args.engine].run(prog1)
+        except closure_exec.ExecutionError as e:
+            print('Ошибка выполнения: {}'.format(e.message), file=sys.stderr)
+            exit(3)
+        return
+    if args.stats:
+        code_stats.program_stats(prog1, args.optimize).report(sys.stdout)
+        return
+    if args.jobs == 1:
+        gen = code_gen.CodeGenerator(sys.stdout, args.optimize)
+        gen.msil_gen_program(prog1)
+    else:
+        parallel_gen.msil_gen_program(prog1, sys.stdout, args.optimize, args.jobs or None)
 
 
 def main():
@@ -59,10 +118,9 @@ def main():
         exit(2)
     print(" ")
     print("msil:")
-    gen = code_gen.CodeGenerator()
+    gen = code_gen.CodeGenerator(sys.stdout)
     gen.msil_gen_program(prog1)
-    print(*gen.code, sep=os.linesep)
 
 
 if __name__ == "__main__":
-    main()
+    main1()
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Any, Optional, Union, Tuple, Callable, List
+from typing import Any, Optional, Union, Tuple, Callable, List, Set, Iterator
 from contextlib import suppress
 
 from my_semantic_baza import TYPE_CONVERTIBILITY, \
@@ -40,8 +40,13 @@ class AstNode(ABC):
             r += ', ' + str(self.node_ident)
         return self.to_str() + (' => ' + r if r else '') # в конце через : добавляется тип или идентификатор
 
-    def semantic_error(self, message: str):
-            raise SemanticException(message, self.row)
+    def semantic_error(self, message: str, scope: Optional[IdentScope] = None):
+        """Ошибка семантического анализа
+        :param scope: если передана и включен режим сбора диагностик, ошибка запоминается, а проверка продолжается
+        """
+        e = SemanticException(message, self.row)
+        if scope is None or not scope.report(e):
+            raise e
 
     @property
     def tree(self):
@@ -89,12 +94,14 @@ class LiteralNode(ValueNode):
         return f'{self.literal}'
 
 
-def type_convert(expr: ValueNode, type_: TypeDesc, except_self: Optional[AstNode] = None, comment: Optional[str] = None) -> ValueNode:
+def type_convert(expr: ValueNode, type_: TypeDesc, except_self: Optional[AstNode] = None, comment: Optional[str] = None,
+                 scope: Optional[IdentScope] = None) -> ValueNode:
     """Метод преобразования ExprNode узла AST-дерева к другому типу
     :param expr: узел AST-дерева
     :param type_: требуемый тип
     :param except_self: узел, о которого будет исключение
     :param comment: комментарий
+    :param scope: область видимости (для режима сбора диагностик, см. AstNode.semantic_error)
     :return: узел AST-дерева c операцией преобразования
     """
 
@@ -102,6 +109,8 @@ def type_convert(expr: ValueNode, type_: TypeDesc, except_self: Optional[AstNode
         except_self.semantic_error('Тип выражения не определен')
     if expr.node_type == type_: # если типы одни и те же
         return expr
+    if expr.node_type.is_error or type_.is_error: # об ошибке уже сообщили
+        return expr
     # если типы простые и все четко конвертируется
     if expr.node_type.is_simple and type_.is_simple and \
             expr.node_type.base_type in TYPE_CONVERTIBILITY and type_.base_type in TYPE_CONVERTIBILITY[expr.node_type.base_type]:
@@ -109,7 +118,8 @@ def type_convert(expr: ValueNode, type_: TypeDesc, except_self: Optional[AstNode
     else:
         (except_self if except_self else expr).semantic_error('Тип {0}{2} не конвертируется в {1}'.format(
             expr.node_type, type_, ' ({})'.format(comment) if comment else ''
-        ))
+        ), scope)
+        return expr
 
 
 class IdentNode(ValueNode):
@@ -120,7 +130,9 @@ class IdentNode(ValueNode):
     def semantic_check(self, scope: IdentScope):
         ident = scope.get_ident(self.name) # ищем данное объявление в местной области видимости
         if ident is None:
-            self.semantic_error('Идентификатор ' + str(self.name) + ' не найден')
+            self.semantic_error('Идентификатор ' + str(self.name) + ' не найден', scope)
+            # чтобы не сообщать об ошибке при каждом следующем использовании
+            ident = scope.idents[self.name] = IdentDesc(self.name, TypeDesc.ERROR)
         self.node_type = ident.type # в качестве типа узла присваиваем тип идентификатора
         self.node_ident = ident     # и сам идентификатор
 
@@ -145,6 +157,9 @@ class BinOpNode(ValueNode):
         # проверяем каждый аргумент
         self.arg1.semantic_check(scope)
         self.arg2.semantic_check(scope)
+        if self.arg1.node_type.is_error or self.arg2.node_type.is_error: # об ошибке уже сообщили
+            self.node_type = TypeDesc.ERROR
+            return
 
         if self.arg1.node_type.is_simple or self.arg2.node_type.is_simple: # если один из аргументов представляет собой простой тип
             compatibility = BIN_OP_TYPE_COMPATIBILITY[self.op] # находим типы, которые между собой могут взаимодействовать
@@ -170,7 +185,8 @@ class BinOpNode(ValueNode):
 
         self.semantic_error("Оператор {} не применим к типам ({}, {})".format(
             self.op, self.arg1.node_type, self.arg2.node_type
-        ))
+        ), scope)
+        self.node_type = TypeDesc.ERROR
 
 
     def __str__(self)->str:
@@ -213,7 +229,8 @@ class DeclTypeNode(IdentNode):
 
     def semantic_check(self, scope: IdentScope):
         if self.type is None:
-            self.semantic_error('Неизвестный ' + str(self.name) + ' тип')
+            self.semantic_error('Неизвестный ' + str(self.name) + ' тип', scope)
+            self.type = TypeDesc.ERROR
         self.node_type = self.type
 
     def to_str_full(self):
@@ -253,7 +270,7 @@ class AssignNode(StatementNode):
     def semantic_check(self, scope: IdentScope):
         self.var.semantic_check(scope)
         self.val.semantic_check(scope)
-        self.val = type_convert(self.val, self.var.node_type, self, 'присваиваемое значение')
+        self.val = type_convert(self.val, self.var.node_type, self, 'присваиваемое значение', scope)
         self.node_type = self.var.node_type
 
 
@@ -266,6 +283,7 @@ class StatementListNode(StatementNode):
         super().__init__(row=row, **props)
         self.exprs = exprs
         self.program = False
+        self.var_decls: Optional[List['DeclNode']] = None  # глобальные переменные (только у программы)
 
     @property
     def childs(self) -> Tuple[AstNode]:
@@ -275,7 +293,16 @@ class StatementListNode(StatementNode):
         if not self.program:
             scope = IdentScope(scope)
         for stmt in self.exprs:
-            stmt.semantic_check(scope)
+            try:
+                stmt.semantic_check(scope)
+            except SemanticException as e:
+                # в режиме сбора диагностик переходим к следующему оператору
+                if not scope.report(e):
+                    raise
+        if not self.program:
+            scope.release_locals()
+        else:
+            self.var_decls = scope.var_decls
         self.node_type = TypeDesc.VOID
 
 
@@ -299,7 +326,7 @@ class IfOpNode(StatementNode):
 
     def semantic_check(self, scope: IdentScope):
         self.cond.semantic_check(scope)
-        self.cond = type_convert(self.cond, TypeDesc.INT, None, 'условие') # приводим к int, так как у нас в обычном С нет булевского типа
+        self.cond = type_convert(self.cond, TypeDesc.INT, None, 'условие', scope) # приводим к int, так как у нас в обычном С нет булевского типа
         self.thenStmts.semantic_check(IdentScope(scope))
         if self.elseStmts:
             self.elseStmts.semantic_check(IdentScope(scope))
@@ -321,7 +348,7 @@ class WhileOpNode(StatementNode):
 
     def semantic_check(self, scope: IdentScope):
         self.cond.semantic_check(scope)
-        self.cond = type_convert(self.cond, TypeDesc.INT, None, 'условие') # приводим к int, так как у нас в обычном С нет булевского типа
+        self.cond = type_convert(self.cond, TypeDesc.INT, None, 'условие', scope) # приводим к int, так как у нас в обычном С нет булевского типа
         self.stmts.semantic_check(IdentScope(scope))
         self.node_type = TypeDesc.VOID
 
@@ -348,9 +375,10 @@ class ForOpNode(StatementNode):
         if self.cond == EMPTY_STMT:
             self.cond = LiteralNode('1')
         self.cond.semantic_check(scope) # проверяем условие
-        self.cond = type_convert(self.cond, TypeDesc.INT, None, 'условие') # приводим к int, так как у нас в обычном С нет булевского типа
+        self.cond = type_convert(self.cond, TypeDesc.INT, None, 'условие', scope) # приводим к int, так как у нас в обычном С нет булевского типа
         self.stmt.semantic_check(scope) # проверяем выражения в заголовке цикла
         self.body.semantic_check(IdentScope(scope))
+        scope.release_locals()
         self.node_type = TypeDesc.VOID
 
     def __str__(self) -> str:
@@ -376,8 +404,9 @@ class DeclNode(StatementNode):
         self.decl_type.semantic_check(scope)
         try:
             scope.add_ident(IdentDesc(self.ident.name, self.decl_type.type))
+            scope.add_var_decl(self)
         except SemanticException as e:
-            self.semantic_error(e.message)
+            self.semantic_error(e.message, scope)
         self.ident.semantic_check(scope)
         if self.init_value != None:
             self.init_value.semantic_check(scope)
@@ -410,18 +439,20 @@ class ArrNode(StatementNode):
         self.arr_type.semantic_check(scope)
         self.node_type = self.arr_type.node_type
         if not type(self.length.value) is int:
-            self.semantic_error("Длина массива {} имеет некорректный тип".format(self.name.name))
-        if self.length.value <= 0:
-            self.semantic_error("Длина массива {} не может быть отрицательным или нулевым значением".format(self.name.name))
-        if self.length.value < len(self.elements):
-            self.semantic_error("Слишком большое количество начальных значений для массива {}".format(self.name.name))
+            self.semantic_error("Длина массива {} имеет некорректный тип".format(self.name.name), scope)
+        elif self.length.value <= 0:
+            self.semantic_error("Длина массива {} не может быть отрицательным или нулевым значением".format(self.name.name),
+                                scope)
+        elif self.length.value < len(self.elements):
+            self.semantic_error("Слишком большое количество начальных значений для массива {}".format(self.name.name),
+                                scope)
         for element in self.elements:
             element.semantic_check(scope)
             # придумать проверку на типизацию
         try:
             scope.add_ident(IdentDesc(self.name.name, self.arr_type.type))
         except SemanticException as e:
-            self.semantic_error(e.message)
+            self.semantic_error(e.message, scope)
         self.name.semantic_check(scope)
 
 
@@ -445,11 +476,16 @@ class ArrItemNode(ValueNode):
     def semantic_check(self, scope: IdentScope):
         arr = scope.get_ident(self.ident.name)
         if arr is None:
-            self.semantic_error('Массив {} не найден'.format(self.ident.name))
-        if not type(self.index.value) is int:
-            self.semantic_error("Индекс массива {} имеет некорректный тип".format(self.ident.name))
-        if self.index.value < 0:
-            self.semantic_error("Индекс массива {} не может быть отрицательным значением".format(self.ident.name))
+            self.semantic_error('Массив {} не найден'.format(self.ident.name), scope)
+            self.node_type = TypeDesc.ERROR
+            return
+        self.ident.node_type, self.ident.node_ident = arr.type, arr
+        # индекс - любое целое выражение (например, переменная цикла)
+        self.index.semantic_check(scope)
+        if self.index.node_type != TypeDesc.INT and not self.index.node_type.is_error:
+            self.semantic_error("Индекс массива {} имеет некорректный тип".format(self.ident.name), scope)
+        if isinstance(self.index, LiteralNode) and self.index.value < 0:
+            self.semantic_error("Индекс массива {} не может быть отрицательным значением".format(self.ident.name), scope)
         self.node_type = arr.type
 
 
@@ -464,8 +500,14 @@ class DeclListNode(AstNode):
 
     def semantic_check(self, scope: IdentScope):
         for param in self.params:
-            param.semantic_check(scope)
-            param.ident.node_ident = scope.add_ident(IdentDesc(param.ident.name, param.decl_type.type, ScopeType.PARAM))
+            # не через param.semantic_check: параметр не должен занимать слот локальной переменной
+            param.decl_type.semantic_check(scope)
+            try:
+                scope.add_ident(IdentDesc(param.ident.name, param.decl_type.type, ScopeType.PARAM))
+            except SemanticException as e:
+                param.semantic_error(e.message, scope)
+            param.ident.semantic_check(scope)
+            param.node_type = TypeDesc.VOID
         self.node_type = TypeDesc.VOID
 
     def __str__(self)->str:
@@ -479,6 +521,8 @@ class FuncDeclNode(StatementNode):
         self.name = name
         self.params = params
         self.body = body
+        self.deps: Optional[Set[str]] = None
+        self.var_decls: Optional[List[DeclNode]] = None  # локальные переменные (заполняется при проверке тела)
 
     @property
     def childs(self) -> Tuple['AstNode', ...]:
@@ -488,12 +532,21 @@ class FuncDeclNode(StatementNode):
             return (self.func_type, self.name, self.params, self.body)
 
     def semantic_check(self, scope: IdentScope):
+        self.semantic_check_body(self.semantic_check_signature(scope))
+
+    def semantic_check_signature(self, scope: IdentScope) -> IdentScope:
+        """Первая фаза проверки: сигнатура функции и ее регистрация в глобальной области
+        :param scope: область видимости, в которой объявлена функция
+        :return: область видимости тела функции (с параметрами)
+        """
         if scope.curr_func:
-            self.semantic_error("Объявление функции ({}) внутри другой функции не поддерживается".format(self.name.name))
+            self.semantic_error("Объявление функции ({}) внутри другой функции не поддерживается".format(self.name.name),
+                                scope)
         parent_scope = scope
         self.func_type.semantic_check(scope) # проверяем возвращаемый тип
         scope = IdentScope(scope)
         scope.func = EMPTY_IDENT  # делаем так, что текущая функция не входит в другую функцию
+        scope.deps = set()
         self.params.semantic_check(scope)
 
 
@@ -509,8 +562,15 @@ class FuncDeclNode(StatementNode):
         try:
             self.name.node_ident = parent_scope.curr_global.add_ident(func_ident)
         except SemanticException as e:
-            self.name.semantic_error("Повторное объявление функции {}".format(self.name.name))
+            self.name.semantic_error("Повторное объявление функции {}".format(self.name.name), scope)
+        return scope
+
+    def semantic_check_body(self, scope: IdentScope):
+        """Вторая фаза проверки: тело функции в области, полученной из semantic_check_signature
+        """
         self.body.semantic_check(scope)
+        self.deps = scope.deps # глобальные имена (переменные и функции), от которых зависит функция
+        self.var_decls = scope.var_decls
         self.node_type = TypeDesc.VOID
 
 
@@ -552,13 +612,18 @@ class FuncCallNode(StatementNode):
     def semantic_check(self, scope: IdentScope):
         func = scope.get_ident(self.name.name) # получаем объект идентификатора функции
         if func is None:
-            self.semantic_error('Функция {} не найдена'.format(self.name.name))
-        if not func.type.func: # если данный идентификатор не функция 
-            self.semantic_error('Идентификатор {} не является функцией'.format(func.name))
-        if len(func.type.params) != len(self.params.params):
+            self.semantic_error('Функция {} не найдена'.format(self.name.name), scope)
+        elif not func.type.func and not func.type.is_error: # если данный идентификатор не функция 
+            self.semantic_error('Идентификатор {} не является функцией'.format(func.name), scope)
+        elif func.type.func and len(func.type.params) != len(self.params.params):
             self.semantic_error('Кол-во аргументов {} не совпадает (ожидалось {}, передано {})'.format(
-                func.name, len(func.type.params), len(self.params)
-            ))
+                func.name, len(func.type.params), len(self.params.params)
+            ), scope)
+        if func is None or not func.type.func or len(func.type.params) != len(self.params.params):
+            # сюда попадаем только в режиме сбора диагностик: проверяем аргументы и помечаем вызов как ошибочный
+            self.params.semantic_check(scope)
+            self.node_type = TypeDesc.ERROR
+            return
         params = []
         error = False
         decl_params_str = fact_params_str = ''
@@ -579,12 +644,12 @@ class FuncCallNode(StatementNode):
             self.semantic_error('Фактические типы ({1}) аргументов функции {0} не совпадают с формальными ({2})\
                                             и не приводимы'.format(
                 func.name, fact_params_str, decl_params_str
-            ))
+            ), scope)
         else:
             self.params.params = params
-            self.name.node_type = func.type
-            self.name.node_ident = func
-            self.node_type = func.type.return_type
+        self.name.node_type = func.type
+        self.name.node_ident = func
+        self.node_type = func.type.return_type
     
     def __str__(self) -> str:
         return str(self.name)
@@ -603,13 +668,49 @@ class ReturnOpNode(StatementNode):
         self.value.semantic_check(IdentScope(scope))
         func_scope = scope.curr_func
         if func_scope is None:
-            self.semantic_error('Оператор return применим только к функции')
+            self.semantic_error('Оператор return применим только к функции', scope)
+            self.node_type = TypeDesc.VOID
+            return
         # пытаемся понять, подходит ли возврат к возвращаемому значению функции
-        self.value = type_convert(self.value, func_scope.func.type.return_type, self, 'возвращаемое значение')
+        self.value = type_convert(self.value, func_scope.func.type.return_type, self, 'возвращаемое значение', scope)
         self.node_type = TypeDesc.VOID
 
     def __str__(self) -> str:
         return 'return'
-    
+
+
+class InlineCallNode(ValueNode):
+    """Вызов функции, тело которой подставлено на место вызова (см. inline.py)
+    Аргументы записываются в новые локальные переменные (params), return в теле - переход в конец подстановки
+    """
+    def __init__(self, name: IdentNode, params: Tuple[DeclNode, ...], body: AstNode,
+                 row: Optional[int] = None, **props) -> None:
+        super().__init__(row=row, **props)
+        self.name = name
+        self.params = params
+        self.body = body
+
+    @property
+    def childs(self) -> Tuple[AstNode, ...]:
+        return self.params + (self.body, )
+
+    def __str__(self) -> str:
+        return 'inline {}'.format(self.name)
+
+
 EMPTY_STMT = StatementListNode()
 EMPTY_IDENT = IdentDesc('', TypeDesc.VOID)
+
+
+def iter_nodes(node: AstNode) -> Iterator[AstNode]:
+    """Обход всех узлов поддерева (в том числе не попадающих в childs, например ArrNode.name)"""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        for value in vars(node).values():
+            # проверка через ABC (isinstance(value, AstNode)) заметно медленнее
+            if hasattr(value, 'node_ident'):
+                stack.append(value)
+            elif isinstance(value, (tuple, list)):
+                stack.extend(v for v in value if hasattr(v, 'node_ident'))
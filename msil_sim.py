@@ -0,0 +1,479 @@
+"""Симулятор стековой машины MSIL: выполнение кода CodeGenerator без ilasm и .NET с подсчетом инструкций
+
+Выполняется то подмножество MSIL, которое генерирует code_gen.py (в том числе после peephole.py): загрузка
+констант, локальных переменных, аргументов и статических полей, арифметика, сравнения и переходы, вызовы
+методов Program и CompilerDemo.Runtime (а также System.String::Concat, op_Equality и инициализация массивов
+из блоков .data), массивы. Код - строки gen.code или сами CodeLine из gen.code_lines: у CodeLine известна
+строка исходного кода (CodeLine.row), поэтому выполненные инструкции считаются и по строкам исходника.
+
+Значения в стеке: int32 и uint16 (char) - int, float64 - float, string - str или None, массивы - списки.
+int, записываемый в переменную, поле или элемент массива float64, приводится к float (code_gen не вставляет
+conv.r8 для инициализатора float-переменной и элементов массива, см. closure_exec.py).
+Поведение встроенных функций и арифметики совпадает с closure_exec.py. Вызовы выполняются без рекурсии Python
+(на явном стеке кадров). tail. - только подсказка (CLR тоже может ее не выполнить): кадр вызывающего метода
+остается в стеке, и глубина вызовов ограничена CALL_DEPTH_LIMIT, как в остальных исполнителях.
+"""
+import re
+import struct
+import sys
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, TextIO, Tuple, Union
+
+from closure_exec import CALL_DEPTH_LIMIT, ExecutionError, StackOverflowError, Runtime, divide, remainder, float_str, \
+    int32, compare_str
+import parallel_gen
+from code_gen import CodeGenerator, CodeLine
+from mel_ast import StatementListNode
+
+# Коды операций после разбора (несколько форм одной инструкции MSIL - один код)
+(LDC, LDARG, STARG, LDLOC, STLOC, LDSFLD, STSFLD, ADD, SUB, MUL, DIV, REM, CEQ, CGT, CLT, CONV_R8, CONV_I4,
+ BR, BRTRUE, BRFALSE, BEQ, BNE_UN, BLT, BGE, BGT, BLE, BLT_UN, BGE_UN, BGT_UN, BLE_UN,
+ CALL, TAILCALL, NATIVE, TAIL, RET, DUP, POP, NEWARR, LDELEM, STELEM, STELEM_I2, LDTOKEN,
+ STLOC_R8, STSFLD_R8, STELEM_R8) = range(45)
+
+_SIMPLE = {
+    'add': ADD, 'sub': SUB, 'mul': MUL, 'div': DIV, 'rem': REM, 'ceq': CEQ, 'cgt': CGT, 'clt': CLT,
+    'conv.r8': CONV_R8, 'conv.i4': CONV_I4, 'ret': RET, 'dup': DUP, 'pop': POP, 'tail.': TAIL,
+    'ldelem.i4': LDELEM, 'ldelem.u2': LDELEM, 'ldelem.r8': LDELEM, 'ldelem.ref': LDELEM,
+    'stelem.i4': STELEM, 'stelem.i2': STELEM_I2, 'stelem.r8': STELEM_R8, 'stelem.ref': STELEM,
+}
+
+_BRANCHES = {
+    'br': BR, 'brtrue': BRTRUE, 'brfalse': BRFALSE, 'beq': BEQ, 'bne.un': BNE_UN,
+    'blt': BLT, 'bge': BGE, 'bgt': BGT, 'ble': BLE, 'blt.un': BLT_UN, 'bge.un': BGE_UN, 'bgt.un': BGT_UN,
+    'ble.un': BLE_UN,
+}
+
+# Значения по умолчанию по типу MSIL (.locals init, статические поля, элементы newarr)
+_TYPE_DEFAULTS = {'int32': 0, 'uint16': 0, 'bool': 0, 'float64': 0.0}
+
+
+def _concat(*parts) -> str:
+    return ''.join(p or '' for p in parts)
+
+
+def _initialize_array(arr: list, data: bytes) -> None:
+    """RuntimeHelpers::InitializeArray: размер элемента определяется по размеру блока .data"""
+    fmt = {4: '<i', 2: '<H', 8: '<d'}[len(data) // len(arr)]
+    arr[:] = [v for v, in struct.iter_unpack(fmt, data)]
+
+
+# Внешние методы: сигнатура (без типа результата) -> функция от Runtime, возвращающая вызываемый объект
+_NATIVES = {
+    'CompilerDemo.Runtime::input()': lambda rt: rt.input,
+    'CompilerDemo.Runtime::write(string)': lambda rt: rt.write,
+    'CompilerDemo.Runtime::writeline(string)': lambda rt: rt.writeline,
+    'CompilerDemo.Runtime::to_int(string)': lambda rt: rt.to_int,
+    'CompilerDemo.Runtime::to_float(string)': lambda rt: rt.to_float,
+    'CompilerDemo.Runtime::convert(int32)': lambda rt: str,
+    'CompilerDemo.Runtime::convert(float64)': lambda rt: float_str,
+    'CompilerDemo.Runtime::convert(uint16)': lambda rt: chr,
+    'CompilerDemo.Runtime::concat(string, string)': lambda rt: _concat,
+    'CompilerDemo.Runtime::compare(string, string)': lambda rt: compare_str,
+    '[mscorlib]System.String::op_Equality(string, string)': lambda rt: lambda a, b: int(a == b),
+    '[mscorlib]System.String::op_Inequality(string, string)': lambda rt: lambda a, b: int(a != b),
+    '[mscorlib]System.String::Concat(string, string)': lambda rt: _concat,
+    '[mscorlib]System.String::Concat(string, string, string)': lambda rt: _concat,
+    '[mscorlib]System.String::Concat(string, string, string, string)': lambda rt: _concat,
+    '[mscorlib]System.String::Concat(string[])': lambda rt: lambda parts: _concat(*parts),
+    '[mscorlib]System.Runtime.CompilerServices.RuntimeHelpers::InitializeArray('
+    'class [mscorlib]System.Array, valuetype [mscorlib]System.RuntimeFieldHandle)': lambda rt: _initialize_array,
+}
+
+_LABEL_RE = re.compile(r'(IL_\d+):\s*(.*)$')
+_METHOD_RE = re.compile(r'\.method .*?(\S+) (\w+)\((.*)\)')
+_CALL_RE = re.compile(r'call\s+(\S+)\s+(?:class\s+)?(\S+::\w+)\((.*)\)$')
+
+
+def _count_params(params: str) -> int:
+    return len(params.split(',')) if params.strip() else 0
+
+
+def _default(msil_type: str):
+    return _TYPE_DEFAULTS.get(msil_type)
+
+
+class Method:
+    """Разобранный метод класса Program"""
+
+    def __init__(self, name: str, params: int, returns: bool) -> None:
+        self.name = name
+        self.params = params
+        self.returns = returns
+        self.locals: List = []  # значения локальных переменных после .locals init
+        self.types: List[str] = []  # типы слотов кадра: аргументы, затем локальные переменные
+        self.code: List[Tuple[int, object]] = []  # (код операции, операнд)
+        self.lines: List[str] = []  # текст инструкций (для статистики по инструкциям)
+        self.rows: List[Optional[int]] = []
+        self.counts: List[int] = []  # сколько раз выполнена каждая инструкция
+
+
+class Profile:
+    """Кол-во выполненных инструкций: всего, по методам, по строкам исходного кода и по инструкциям"""
+
+    def __init__(self, methods: List[Method]) -> None:
+        self.methods: Dict[str, int] = {}
+        self.rows: Dict[Optional[int], int] = Counter()
+        self.instructions: Dict[str, int] = Counter()
+        for method in methods:
+            self.methods[method.name] = sum(method.counts)
+            for line, row, count in zip(method.lines, method.rows, method.counts):
+                if count:
+                    self.rows[row] += count
+                    self.instructions[line.split(' ', 1)[0]] += count
+        self.total = sum(self.methods.values())
+
+    def report(self, out: Optional[TextIO] = None, top: int = 10) -> None:
+        out = out or sys.stdout
+        print(f'Выполнено инструкций: {self.total}', file=out)
+        print('По методам:', file=out)
+        for name, count in sorted(self.methods.items(), key=lambda item: -item[1]):
+            if count:
+                print(f'  {name:<24} {count:>12}', file=out)
+        print(f'По строкам (первые {top}):', file=out)
+        for row, count in sorted(self.rows.items(), key=lambda item: -item[1])[:top]:
+            print(f'  {"строка " + str(row) if row else "-":<24} {count:>12}', file=out)
+        print(f'По инструкциям (первые {top}):', file=out)
+        for instr, count in self.instructions.most_common(top):
+            print(f'  {instr:<24} {count:>12}', file=out)
+
+
+class Assembly:
+    """Разобранный код программы: методы, статические поля и блоки .data"""
+
+    def __init__(self, lines: Iterable[Union[str, CodeLine]]) -> None:
+        self.methods: Dict[str, Method] = {}
+        self.fields: Dict[str, int] = {}  # имя статического поля -> номер
+        self.field_values: List = []      # значения полей при запуске программы
+        self.data: Dict[str, bytes] = {}  # имя блока .data -> байты
+        self.data_fields: Dict[str, str] = {}  # поле __data... -> имя блока .data
+        self.natives: List[str] = []      # сигнатуры внешних методов (операнд NATIVE - номер в списке)
+        self.entry: Optional[Method] = None
+        calls: List[Tuple[Method, int, str]] = []  # вызовы методов Program разрешаются после разбора всех методов
+        self.parse(lines, calls)
+        for method, i, name in calls:
+            if name not in self.methods:
+                raise ExecutionError('Метод {} не найден'.format(name), method.rows[i])
+            op, _ = method.code[i]
+            method.code[i] = (op, self.methods[name])
+        if self.entry is None:
+            raise ExecutionError('Нет метода с .entrypoint')
+
+    def field(self, name: str, msil_type: Optional[str] = None) -> int:
+        if name not in self.fields:
+            self.fields[name] = len(self.field_values)
+            self.field_values.append(_default(msil_type))
+        return self.fields[name]
+
+    def parse(self, lines: Iterable[Union[str, CodeLine]], calls: List[Tuple[Method, int, str]]) -> None:
+        method: Optional[Method] = None
+        method_depth = depth = 0
+        labels: Dict[str, int] = {}
+        jumps: List[Tuple[int, str]] = []
+        for line in lines:
+            row = getattr(line, 'row', None)
+            text = str(line).strip()
+            match = _LABEL_RE.match(text)
+            if match:
+                labels[match.group(1)] = len(method.code)
+                text = match.group(2)
+            if not text:
+                continue
+            instr, _, operand = text.partition(' ')
+            operand = operand.strip()
+
+            if text == '{':
+                depth += 1
+            elif text == '}':
+                depth -= 1
+                if method is not None and depth == method_depth:
+                    for i, label in jumps:
+                        op, _ = method.code[i]
+                        method.code[i] = (op, labels[label])
+                    method.counts = [0] * len(method.code)
+                    method = None
+            elif instr == '.method':
+                name_match = _METHOD_RE.match(text)
+                params = name_match.group(3)
+                method = Method(name_match.group(2), _count_params(params), name_match.group(1) != 'void')
+                method.types = [p.strip().rsplit(' ', 1)[0] for p in params.split(',')] if method.params else []
+                self.methods[method.name] = method
+                method_depth, labels, jumps = depth, {}, []
+            elif instr == '.entrypoint':
+                self.entry = method
+            elif instr == '.locals':
+                types = [t.strip().rsplit(' ', 1)[0] for t in text[text.index('(') + 1:text.rindex(')')].split(',')]
+                method.locals = [_default(t) for t in types]
+                method.types += types
+            elif instr == '.field':
+                parts = text.split()
+                if 'at' in parts:
+                    self.data_fields[parts[-3]] = parts[-1]
+                else:
+                    self.field(parts[-1], parts[-2])
+            elif instr == '.data':
+                name, _, data = text[len('.data'):].partition('=')
+                data = data[data.index('(') + 1:data.rindex(')')]
+                self.data[name.strip()] = bytes.fromhex(data)
+            elif instr.startswith('.'):
+                pass  # .assembly, .class, .pack, .size
+            else:
+                if method is None:
+                    raise ExecutionError('Инструкция вне метода: {}'.format(text), row)
+                method.code.append(self.instruction(method, instr, operand, text, row, calls, jumps))
+                method.lines.append(text)
+                method.rows.append(row)
+
+    def instruction(self, method: Method, instr: str, operand: str, text: str, row: Optional[int],
+                    calls: List[Tuple[Method, int, str]], jumps: List[Tuple[int, str]]) -> Tuple[int, object]:
+        index = len(method.code)
+        if instr in _SIMPLE:
+            return _SIMPLE[instr], None
+        if instr in _BRANCHES:
+            jumps.append((index, operand))
+            return _BRANCHES[instr], None
+        if instr in ('ldc.i4', 'ldc.i4.s'):
+            return LDC, int(operand)
+        if instr == 'ldc.i4.m1':
+            return LDC, -1
+        if instr.startswith('ldc.i4.'):
+            return LDC, int(instr[len('ldc.i4.'):])
+        if instr == 'ldc.r8':
+            return LDC, float(operand)
+        if instr == 'ldstr':
+            return LDC, text[text.index('"') + 1:text.rindex('"')]
+        if instr == 'ldnull':
+            return LDC, None
+        # аргументы и локальные переменные лежат в одном кадре: сначала аргументы
+        if instr in ('ldarg', 'starg', 'ldloc', 'stloc'):
+            slot = int(operand) + (method.params if instr.endswith('loc') else 0)
+            if instr.startswith('ld'):
+                return LDARG if instr == 'ldarg' else LDLOC, slot
+            if method.types[slot] == 'float64':
+                return STLOC_R8, slot
+            return STARG if instr == 'starg' else STLOC, slot
+        if instr in ('ldsfld', 'stsfld'):
+            msil_type, name = operand.rsplit(' ', 1)
+            field = self.field(name.split('::')[-1], msil_type)
+            if instr == 'ldsfld':
+                return LDSFLD, field
+            return STSFLD_R8 if msil_type == 'float64' else STSFLD, field
+        if instr == 'newarr':
+            return NEWARR, _default(operand)
+        if instr == 'ldtoken':
+            return LDTOKEN, operand.rsplit('::', 1)[-1]
+        if instr == 'call':
+            match = _CALL_RE.match(text)
+            if match is None:
+                raise ExecutionError('Неверный вызов: {}'.format(text), row)
+            returns, target, params = match.groups()
+            owner, name = target.split('::')
+            if owner == 'Program':
+                calls.append((method, index, name))
+                tail = index > 0 and method.code[index - 1][0] == TAIL
+                return TAILCALL if tail else CALL, None
+            signature = '{}({})'.format(target, params)
+            if signature not in _NATIVES:
+                raise ExecutionError('Неизвестный метод {}'.format(signature), row)
+            if signature not in self.natives:
+                self.natives.append(signature)
+            return NATIVE, (self.natives.index(signature), _count_params(params), returns != 'void')
+        raise ExecutionError('Неизвестная инструкция {}'.format(text), row)
+
+    def run(self, stdin: Optional[TextIO] = None, stdout: Optional[TextIO] = None) -> Profile:
+        """Выполнить программу (счетчики инструкций обнуляются перед запуском)
+        :raise ExecutionError: ошибка во время выполнения (вывод до ошибки записывается в stdout)
+        """
+        for method in self.methods.values():
+            method.counts = [0] * len(method.code)
+        runtime = Runtime(stdin, stdout)
+        try:
+            self.execute(runtime)
+        finally:
+            runtime.flush()
+        return Profile(list(self.methods.values()))
+
+    def execute(self, runtime: Runtime) -> None:
+        natives = [_NATIVES[signature](runtime) for signature in self.natives]
+        fields = list(self.field_values)
+        data = {name: self.data[block] for name, block in self.data_fields.items()}
+        stack: List = []
+        push, pop = stack.append, stack.pop
+        calls: List[tuple] = []  # кадры вызывающих методов: (метод, pc, кадр, дно стека)
+        method = self.entry
+        code, counts, frame, base, pc = method.code, method.counts, list(method.locals), 0, 0
+        op = i = None
+        try:
+            while True:
+                op, arg = code[pc]
+                counts[pc] += 1
+                pc += 1
+                if op == LDLOC or op == LDARG:
+                    push(frame[arg])
+                elif op == LDC:
+                    push(arg)
+                elif op == STLOC or op == STARG:
+                    frame[arg] = pop()
+                elif op == LDSFLD:
+                    push(fields[arg])
+                elif op == STSFLD:
+                    fields[arg] = pop()
+                elif op == ADD or op == SUB or op == MUL:
+                    b = pop()
+                    a = pop()
+                    v = a + b if op == ADD else a - b if op == SUB else a * b
+                    if type(v) is int and not -0x80000000 <= v <= 0x7FFFFFFF:
+                        v = int32(v)
+                    push(v)
+                elif op >= BR and op <= BLE_UN:
+                    if op == BR:
+                        pc = arg
+                    elif op == BRTRUE or op == BRFALSE:
+                        if (pop() not in (0, None)) == (op == BRTRUE):
+                            pc = arg
+                    else:
+                        b = pop()
+                        a = pop()
+                        if op == BEQ:
+                            jump = a == b
+                        elif op == BNE_UN:
+                            jump = a != b
+                        elif op == BLT:
+                            jump = a < b
+                        elif op == BGE:
+                            jump = a >= b
+                        elif op == BGT:
+                            jump = a > b
+                        elif op == BLE:
+                            jump = a <= b
+                        # .un: переход и при сравнении с NaN
+                        elif op == BLT_UN:
+                            jump = not a >= b
+                        elif op == BGE_UN:
+                            jump = not a < b
+                        elif op == BGT_UN:
+                            jump = not a <= b
+                        else:
+                            jump = not a > b
+                        if jump:
+                            pc = arg
+                elif op == CEQ or op == CGT or op == CLT:
+                    b = pop()
+                    a = pop()
+                    push(int(a == b if op == CEQ else a > b if op == CGT else a < b))
+                elif op == LDELEM:
+                    i = pop()
+                    arr = pop()
+                    if i < 0:
+                        raise IndexError(i)
+                    push(arr[i])
+                elif op == STELEM or op == STELEM_I2 or op == STELEM_R8:
+                    v = pop()
+                    i = pop()
+                    arr = pop()
+                    if i < 0:
+                        raise IndexError(i)
+                    arr[i] = v if op == STELEM else v & 0xFFFF if op == STELEM_I2 else float(v)
+                elif op == STLOC_R8:
+                    frame[arg] = float(pop())
+                elif op == STSFLD_R8:
+                    fields[arg] = float(pop())
+                elif op == CALL or op == TAILCALL:
+                    if len(calls) >= CALL_DEPTH_LIMIT:
+                        raise StackOverflowError()
+                    calls.append((method, pc, frame, base))
+                    method = arg
+                    base = len(stack) - method.params
+                    if base < 0:
+                        raise IndexError()
+                    frame = stack[base:] + method.locals
+                    del stack[base:]
+                    code, counts, pc = method.code, method.counts, 0
+                elif op == RET:
+                    if not calls:
+                        return
+                    if method.returns:
+                        v = pop()
+                        del stack[base:]
+                        push(v)
+                    else:
+                        del stack[base:]
+                    method, pc, frame, base = calls.pop()
+                    code, counts = method.code, method.counts
+                elif op == NATIVE:
+                    native, argc, returns = arg
+                    if len(stack) - base < argc:
+                        raise IndexError()
+                    if argc:
+                        args = stack[-argc:]
+                        del stack[-argc:]
+                        v = natives[native](*args)
+                    else:
+                        v = natives[native]()
+                    if returns:
+                        push(v)
+                elif op == DIV:
+                    b = pop()
+                    push(divide(pop(), b))
+                elif op == REM:
+                    b = pop()
+                    push(remainder(pop(), b))
+                elif op == CONV_R8:
+                    push(float(pop()))
+                elif op == CONV_I4:
+                    push(int32(int(pop())))
+                elif op == DUP:
+                    push(stack[-1])
+                elif op == POP:
+                    pop()
+                elif op == NEWARR:
+                    size = pop()
+                    if size < 0:
+                        raise ExecutionError('Отрицательный размер массива {}'.format(size))
+                    push([arg] * size)
+                elif op == LDTOKEN:
+                    push(data[arg])
+                elif op == TAIL:
+                    pass
+        except StackOverflowError:
+            raise
+        except ExecutionError as e:
+            if e.row is None and method.rows[pc - 1]:
+                raise ExecutionError(e.message, method.rows[pc - 1])
+            raise
+        except IndexError:
+            if op in (LDELEM, STELEM, STELEM_I2, STELEM_R8):
+                raise ExecutionError('Индекс {} вне границ массива'.format(i), method.rows[pc - 1])
+            raise ExecutionError('Недостаточно значений в стеке для {}'.format(method.lines[pc - 1]),
+                                 method.rows[pc - 1])
+        except TypeError:
+            if op in (LDELEM, STELEM, STELEM_I2, STELEM_R8):
+                raise ExecutionError('Массив не создан', method.rows[pc - 1])
+            # код, который не прошел бы проверку CLR (например, uint16 вместо string в вызове)
+            raise ExecutionError('Неверные типы значений в стеке для {}'.format(method.lines[pc - 1]),
+                                 method.rows[pc - 1])
+
+
+def load(lines: Iterable[Union[str, CodeLine]]) -> Assembly:
+    """Разобрать MSIL-код (строки gen.code или gen.code_lines)"""
+    return Assembly(lines)
+
+
+def compile_program(prog: StatementListNode, optimize: bool = False, workers: Optional[int] = 1) -> Assembly:
+    """Сгенерировать MSIL для проверенной программы (с optimize - с peephole-оптимизацией) и разобрать его
+    :param workers: процессов для генерации функций (см. parallel_gen.py; None - по числу процессоров)
+    """
+    if workers == 1:
+        gen = CodeGenerator(None, optimize)
+        gen.msil_gen_program(prog)
+    else:
+        gen = parallel_gen.msil_gen_program(prog, None, optimize, workers)
+    return load(gen.code_lines)
+
+
+def run(prog: StatementListNode, stdin: Optional[TextIO] = None, stdout: Optional[TextIO] = None,
+        optimize: bool = False, workers: Optional[int] = 1) -> Profile:
+    """Сгенерировать MSIL для проверенной программы и выполнить его
+    :return: кол-во выполненных инструкций
+    """
+    return compile_program(prog, optimize, workers).run(stdin, stdout)
@@ -142,7 +142,9 @@ def _parser():
     for_op = for_header + op_body
 
     # Выражение
+    # return - первым: иначе "return f(x);" и "return x;" разбираются как объявления переменной типа return
     statement << (
+            return_op + SEMICOLON |
             func_decl |
             arr | 
             decl |
@@ -150,8 +152,7 @@ def _parser():
             for_op |
             while_op |
             assign |
-            func_call |
-            return_op + SEMICOLON)
+            func_call)
 
     # Список выражений 
     statement_list << plt.ZeroOrMore(statement + plt.Optional(SEMICOLON))
@@ -172,7 +173,7 @@ def _parser():
                     secondNode = tocs[i + 1]
                     if not isinstance(secondNode, AstNode):
                         secondNode = bin_op_parse_action(s, loc, secondNode)
-                    node = BinOpNode(BinOp(tocs[i]), node, secondNode)
+                    node = BinOpNode(BinOp(tocs[i]), node, secondNode, row=plt.lineno(loc, s))
                 return node
             parser.setParseAction(bin_op_parse_action)
         else:
@@ -181,7 +182,7 @@ def _parser():
                 cls = eval(cls)
                 if not inspect.isabstract(cls):
                     def parse_action(s, loc, tocs):
-                        return cls(*tocs)
+                        return cls(*tocs, row=plt.lineno(loc, s))
                     parser.setParseAction(parse_action)
 
     for var_name, value in locals().copy().items():
@@ -1,4 +1,4 @@
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 from enum import Enum
 from binop import BinOp
 
@@ -40,6 +40,7 @@ class TypeDesc:
     FLOAT: 'TypeDesc'
     STR: 'TypeDesc'
     CHAR: 'TypeDesc'
+    ERROR: 'TypeDesc'  # тип выражения с ошибкой (в режиме сбора диагностик), совместим с любым типом
 
     def __init__(self, base_type_: Optional[BaseType] = None,
                  return_type: Optional['TypeDesc'] = None, params: Optional[Tuple['TypeDesc']] = None) -> None:
@@ -57,6 +58,10 @@ class TypeDesc:
         # Если такого не существует, то это обычный тип данных (например, переменная)
         return not self.func
 
+    @property
+    def is_error(self) -> bool:
+        return self.base_type is None and not self.func
+
     def __eq__(self, other: 'TypeDesc'):
         """
         Сравнение типов данных(простых и функциональных)
@@ -75,6 +80,16 @@ class TypeDesc:
                     return False
             return True
 
+    def __reduce__(self):
+        """
+        При передаче между процессами простые типы восстанавливаются в те же объекты (TypeDesc.INT и т.д.)
+        """
+        if self.is_error:
+            return getattr, (TypeDesc, 'ERROR')
+        if self.is_simple:
+            return TypeDesc.from_base_type, (self.base_type,)
+        return TypeDesc, (self.base_type, self.return_type, self.params)
+
     @staticmethod
     def from_base_type(base_type_: BaseType) -> 'TypeDesc':
         """
@@ -97,6 +112,8 @@ class TypeDesc:
         """
         Получить строку из объекта типа (либо просто тип, либо тип_возврата(параметр,...)
         """
+        if self.is_error:
+            return 'error'
         if not self.func:
             return str(self.base_type)
         else:
@@ -112,6 +129,7 @@ class TypeDesc:
 
 for base_type in BaseType: # для каждого объявления типа в TypeDesc устанавливаем сам объект TypeDesc
     setattr(TypeDesc, base_type.name, TypeDesc(base_type))
+TypeDesc.ERROR = TypeDesc()
 
 
 class ScopeType(Enum):
@@ -138,6 +156,7 @@ class IdentDesc:
         self.scope = scope
         self.index = index
         self.built_in = False # отвечает за то, встроенная функция в язык или нет
+        self.reused = False   # локальная переменная заняла слот переменной из уже закрытого блока
 
     def __str__(self) -> str:
         # тип , область , (built_in)?
@@ -155,6 +174,10 @@ class IdentScope:
         self.parent = parent                    # родительская область
         self.var_index = 0                      # индекс объявленных переменных
         self.param_index = 0                    # индекс каких-то параметров
+        self.diagnostics: Optional[List['SemanticException']] = None  # ошибки в режиме сбора диагностик (только у глобальной)
+        self.deps: Optional[Set[str]] = None    # имена, которые функция ищет за своими пределами (только у области функции)
+        self.free_locals: Dict[BaseType, List[int]] = {}  # освободившиеся слоты локальных переменных (только у области функции)
+        self.var_decls: List[Any] = []          # объявления переменных (DeclNode) (только у области функции и глобальной)
 
     @property
     def is_global(self) -> bool:
@@ -177,6 +200,16 @@ class IdentScope:
             curr = curr.parent
         return curr
 
+    def report(self, e: 'SemanticException') -> bool:
+        """Запомнить ошибку, если включен режим сбора диагностик (diagnostics у глобальной области)
+        :return: False, если режим выключен и ошибку надо выбросить
+        """
+        diagnostics = self.curr_global.diagnostics
+        if diagnostics is None:
+            return False
+        diagnostics.append(e)
+        return True
+
     def add_ident(self, ident: IdentDesc) -> IdentDesc:
         """Добавить идентификатор в текущую область видимости"""
         func_scope = self.curr_func
@@ -207,6 +240,10 @@ class IdentScope:
             if ident.scope == ScopeType.PARAM:
                 ident.index = func_scope.param_index # устанавливаем identу текущий индекс параметра функции
                 func_scope.param_index += 1
+            elif ident.scope == ScopeType.LOCAL and func_scope.free_locals.get(ident.type.base_type):
+                # слот переменной того же типа из закрытого блока (их время жизни не пересекается)
+                ident.index = func_scope.free_locals[ident.type.base_type].pop()
+                ident.reused = True
             else:
                 # Ставим скоуп функцию или глобальную
                 ident_scope = func_scope if func_scope else global_scope 
@@ -217,17 +254,35 @@ class IdentScope:
         self.idents[ident.name] = ident
         return ident
 
+    def add_var_decl(self, decl: Any) -> None:
+        """Запомнить объявление переменной (DeclNode) в области функции или в глобальной области"""
+        (self.curr_func or self.curr_global).var_decls.append(decl)
+
+    def release_locals(self) -> None:
+        """Конец блока: слоты его локальных переменных могут занять переменные следующих блоков"""
+        func_scope = self.curr_func
+        if not func_scope or func_scope is self:
+            return
+        for ident in self.idents.values():
+            if ident.scope == ScopeType.LOCAL and ident.type.is_simple and not ident.type.is_error:
+                func_scope.free_locals.setdefault(ident.type.base_type, []).append(ident.index)
+
     def get_ident(self, name: str) -> Optional[IdentDesc]:
         """
         Получить объект идентификатора по его имени из стека
         """
         scope = self
         ident = None
+        deps = None
         while scope:
             ident = scope.idents.get(name)
             if ident:
                 break
+            if scope.deps is not None: # выходим за пределы функции - запоминаем зависимость (даже если имя не найдется)
+                deps = scope.deps
             scope = scope.parent
+        if deps is not None:
+            deps.add(name)
         return ident
 
 
@@ -251,6 +306,7 @@ class SemanticException(Exception):
         if row:
             message += " (строка: {})".format(row)
         self.message = message
+        self.row = row
 
 
 TYPE_CONVERTIBILITY = {
@@ -0,0 +1,147 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+from my_semantic_baza import IdentDesc, IdentScope, ScopeType, SemanticException, TypeDesc
+from mel_ast import FuncDeclNode, StatementListNode, iter_nodes
+
+
+# Элементы глобальной области видимости, переданные в процесс-обработчик (заполняется в _init_worker)
+_global_items: List[Tuple[str, IdentDesc]] = []
+# Включен ли режим сбора диагностик
+_collect = False
+
+
+def _init_worker(global_items: List[Tuple[str, IdentDesc]], collect: bool) -> None:
+    global _global_items, _collect
+    _global_items = global_items
+    _collect = collect
+
+
+def check_func_body(func: FuncDeclNode, global_items: List[Tuple[str, IdentDesc]], visible: int,
+                    collect: bool = False) -> Tuple[Optional[FuncDeclNode], List[SemanticException]]:
+    """Проверка тела функции, сигнатура которой уже зарегистрирована (см. check_globals)
+    :param func: узел функции
+    :param global_items: элементы глобальной области видимости после первой фазы
+    :param visible: кол-во глобальных идентификаторов, видимых функции (ее собственный идентификатор - следующий)
+    :param collect: режим сбора диагностик
+    :return: (проверенный узел (None при ошибке вне режима сбора диагностик), ошибки)
+    """
+    # глобальная область ровно в том виде, в каком ее видела бы функция при последовательной проверке:
+    # словарь идентификаторов упорядочен по объявлению, поэтому достаточно взять его начало
+    scope = IdentScope()
+    scope.idents = dict(islice(global_items, visible))
+    # ошибки сигнатуры уже выданы в первой фазе (без режима сбора диагностик их там не было), повторно не выдаем
+    scope.diagnostics = []
+    try:
+        func_scope = func.semantic_check_signature(scope)
+        scope.diagnostics = [] if collect else None
+        # функция зарегистрирована в первой фазе (ее идентификатор - следующий после видимых), используем тот же
+        # идентификатор; иначе (например, повторное объявление) тело проверяется, как при последовательной
+        # проверке, с незарегистрированным идентификатором из semantic_check_signature
+        if visible < len(global_items) and global_items[visible][0] == func.name.name:
+            func_scope.func = func.name.node_ident = scope.idents[func.name.name] = global_items[visible][1]
+        func.semantic_check_body(func_scope)
+    except SemanticException as e:
+        if not scope.report(e):
+            return None, [e]
+    return func, scope.diagnostics or []
+
+
+def _check_body(task: Tuple[int, FuncDeclNode, int]) -> Tuple[int, Optional[FuncDeclNode], List[SemanticException]]:
+    """Проверка одной функции в процессе-обработчике
+    :param task: (номер оператора в программе, узел функции, кол-во видимых глобальных идентификаторов)
+    :return: (номер оператора, результат check_func_body)
+    """
+    index, func, visible = task
+    return (index, ) + check_func_body(func, _global_items, visible, _collect)
+
+
+def merge_idents(func: FuncDeclNode, global_idents: Dict[str, IdentDesc]) -> None:
+    """Глобальные идентификаторы в поддереве, проверенном отдельно (в процессе-обработчике или в прошлой сборке),
+    заменяем на текущие из global_idents (по имени)"""
+    for node in iter_nodes(func):
+        ident = node.node_ident
+        if ident is not None and ident.scope == ScopeType.GLOBAL and ident.name in global_idents:
+            node.node_ident = global_idents[ident.name]
+
+
+def check_globals(prog: StatementListNode, scope: IdentScope) \
+        -> Tuple[List[Tuple[int, FuncDeclNode, int]], Dict[int, int], Optional[SemanticException]]:
+    """Первая фаза: последовательная проверка глобальных операторов и регистрация сигнатур функций
+    :return: (функции для второй фазы - (номер оператора, узел, кол-во видимых глобальных идентификаторов),
+              позиции в scope.diagnostics, куда встанут ошибки из тел функций (номер оператора -> позиция),
+              ошибка, на которой проверка остановилась)
+    """
+    tasks: List[Tuple[int, FuncDeclNode, int]] = []
+    error: Optional[SemanticException] = None
+    diagnostics = scope.diagnostics
+    positions: Dict[int, int] = {}
+    for i, stmt in enumerate(prog.exprs):
+        try:
+            if isinstance(stmt, FuncDeclNode):
+                visible = len(scope.idents)
+                stmt.semantic_check_signature(scope)
+                tasks.append((i, stmt, visible))
+            else:
+                stmt.semantic_check(scope)
+        except SemanticException as e:
+            if not scope.report(e):
+                # ошибки в телах предшествующих функций при последовательной проверке возникли бы раньше
+                error = e
+                break
+        if diagnostics is not None:
+            positions[i] = len(diagnostics)
+    prog.var_decls = scope.var_decls
+    prog.node_type = TypeDesc.VOID
+    return tasks, positions, error
+
+
+def semantic_check(prog: StatementListNode, scope: IdentScope, workers: Optional[int] = None,
+                   min_funcs: int = 2) -> None:
+    """Двухфазная семантическая проверка программы
+    Сначала последовательно проверяются глобальные операторы и сигнатуры функций (они регистрируются
+    в глобальной области), затем тела функций проверяются параллельно в пуле процессов.
+    Результат (аннотированное дерево и первая по тексту программы ошибка, либо список scope.diagnostics
+    в режиме сбора диагностик) совпадает с prog.semantic_check(scope).
+    :param prog: программа (корневой StatementListNode)
+    :param scope: глобальная область видимости (см. prepare_global_scope)
+    :param workers: кол-во процессов (None - по числу процессоров)
+    :param min_funcs: при меньшем кол-ве функций пул не запускается
+    """
+    diagnostics = scope.diagnostics
+    tasks, positions, error = check_globals(prog, scope)
+
+    # вторая фаза
+    global_items = list(scope.idents.items())
+    pooled = not (len(tasks) < min_funcs or workers == 1)
+    if not pooled:
+        results = [(index, ) + check_func_body(func, global_items, visible, diagnostics is not None)
+                   for index, func, visible in tasks]
+    else:
+        executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(global_items, diagnostics is not None))
+        chunksize = max(1, len(tasks) // ((workers or os.cpu_count() or 1) * 4))
+        with executor:
+            results = list(executor.map(_check_body, tasks, chunksize=chunksize))
+
+    exprs = list(prog.exprs)
+    merged: List[SemanticException] = []
+    prev = 0
+    for index, func, errors in results:
+        if diagnostics is None:
+            if errors:
+                raise errors[0]
+        else:
+            merged.extend(diagnostics[prev:positions[index]])
+            merged.extend(errors)
+            prev = positions[index]
+        if pooled:
+            merge_idents(func, scope.idents)
+        exprs[index] = func
+    prog.exprs = tuple(exprs)
+    if diagnostics is not None:
+        merged.extend(diagnostics[prev:])
+        diagnostics[:] = merged
+    if error is not None:
+        raise error
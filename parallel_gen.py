@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, TextIO, Tuple
+
+from code_gen import CodeGenerator, CodeLabel, CodeLine
+from mel_ast import FuncDeclNode, StatementListNode
+
+
+# Строка кода для передачи между процессами: (code, params, номер метки строки или None,
+# позиции params, в которых вместо метки записан ее номер, строка исходного кода CodeLine.row)
+PackedLine = Tuple[str, tuple, Optional[int], Tuple[int, ...], Optional[int]]
+
+# Функции программы в процессах-обработчиках (при запуске через fork наследуются от родителя, иначе
+# передаются один раз при запуске обработчика)
+_funcs: List[FuncDeclNode] = []
+
+
+def _init_worker(funcs: List[FuncDeclNode]) -> None:
+    global _funcs
+    _funcs = funcs
+
+
+def _pack(code_lines: List[CodeLine]) -> List[PackedLine]:
+    """Упаковка строк в кортежи: объекты CodeLine/CodeLabel передаются через pickle в разы медленнее"""
+    packed = []
+    for cl in code_lines:
+        label_pos = tuple(i for i, p in enumerate(cl.params) if isinstance(p, CodeLabel))
+        params = tuple(p.index for p in cl.params) if label_pos else cl.params
+        packed.append((cl.code, params, cl.label.index if cl.label else None, label_pos, cl.row))
+    return packed
+
+
+def _unpack(packed: List[PackedLine]) -> List[CodeLine]:
+    """Восстановление строк (метки нумеруются в пределах метода, поэтому номер однозначно задает метку)"""
+    labels: Dict[int, CodeLabel] = {}
+
+    def label(index: int) -> CodeLabel:
+        if index not in labels:
+            labels[index] = CodeLabel(index)
+        return labels[index]
+
+    code_lines = []
+    for code, params, label_index, label_pos, row in packed:
+        if label_pos:
+            params = tuple(label(p) if i in label_pos else p for i, p in enumerate(params))
+        code_lines.append(CodeLine(code, *params, label=label(label_index) if label_index is not None else None,
+                                   row=row))
+    return code_lines
+
+
+def _gen_func(func: FuncDeclNode) -> List[CodeLine]:
+    """Генерация кода одной функции (без оптимизации: она выполняется при сборке,
+    как и при последовательной генерации)"""
+    gen = CodeGenerator()
+    gen.depth = 1  # функции находятся внутри класса Program
+    gen.msil_gen(func)
+    return gen.code_lines
+
+
+def _gen_func_packed(index: int) -> List[PackedLine]:
+    """Генерация кода функции _funcs[index] в процессе-обработчике"""
+    return _pack(_gen_func(_funcs[index]))
+
+
+class _PooledCodeGenerator(CodeGenerator):
+    """Генератор, подставляющий вместо функций код, сгенерированный в пуле процессов
+    (метки нумеруются в пределах метода, поэтому код функции не зависит от остальной программы)"""
+
+    def __init__(self, funcs_code: Dict[int, List[CodeLine]], out: Optional[TextIO] = None,
+                 optimize: bool = False) -> None:
+        super().__init__(out, optimize)
+        self.funcs_code = funcs_code
+
+    def msil_gen_func(self, func: FuncDeclNode) -> None:
+        # строки проходят тот же путь, что и в add: вывод в поток или накопление (и оптимизация в конце метода)
+        code_lines = self.funcs_code[id(func)]
+        if self.out is not None and not self.optimize:
+            for cl in code_lines:
+                self.out.write(str(cl))
+                self.out.write('\n')
+        else:
+            self.code_lines.extend(code_lines)
+            if self.out is not None:
+                self.flush()
+
+
+def msil_gen_program(prog: StatementListNode, out: Optional[TextIO] = None, optimize: bool = False,
+                     workers: Optional[int] = None, min_funcs: int = 2) -> CodeGenerator:
+    """Генерация программы, в которой функции генерируются параллельно в пуле процессов
+    Результат (code_lines или текст в out) совпадает с CodeGenerator(out, optimize).msil_gen_program(prog).
+    :param workers: кол-во процессов (None - по числу процессоров)
+    :param min_funcs: при меньшем кол-ве функций пул не запускается
+    :return: генератор (code_lines заполнен, если out не задан)
+    """
+    global _funcs
+    funcs = [stmt for stmt in prog.exprs if isinstance(stmt, FuncDeclNode)]
+    if len(funcs) < min_funcs or workers == 1:
+        results = [_gen_func(func) for func in funcs]
+    else:
+        if multiprocessing.get_start_method() == 'fork':
+            # обработчики запускаются при первой отправке задачи и получают дерево без сериализации
+            _funcs = funcs
+            executor = ProcessPoolExecutor(workers)
+        else:
+            executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(funcs, ))
+        chunksize = max(1, len(funcs) // ((workers or os.cpu_count() or 1) * 4))
+        try:
+            with executor:
+                results = [_unpack(packed) for packed in
+                           executor.map(_gen_func_packed, range(len(funcs)), chunksize=chunksize)]
+        finally:
+            _funcs = []
+    gen = _PooledCodeGenerator({id(func): code_lines for func, code_lines in zip(funcs, results)}, out, optimize)
+    gen.msil_gen_program(prog)
+    return gen
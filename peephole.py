@@ -0,0 +1,228 @@
+"""Peephole-оптимизация MSIL-кода (списка CodeLine из CodeGenerator)
+
+Строки меняются на месте (code, params, label), лишние - выбрасываются из списка.
+Правила (применяются, пока что-то меняется):
+    ldc.i4 N                    -> ldc.i4.N / ldc.i4.m1 / ldc.i4.s N
+    ldc.i4.0; ceq; brfalse L    -> brtrue L   (и brtrue -> brfalse)
+    br L, если L - следующая метка -> удаляется
+    stloc x; ldloc x, если x больше нигде не читается -> удаляется (значение остается в стеке)
+    метка на пустой строке      -> переносится на следующую инструкцию или сливается с ее меткой
+    пустая строка с меткой, на которую нет переходов -> удаляется
+    метка инструкции, на которую нет переходов (например, после удаления br) -> удаляется
+"""
+from typing import Dict, List, Optional, Set
+
+
+def _instr(line) -> str:
+    """Инструкция строки (без отступа и операндов, которые записаны в самой строке)"""
+    code = line.code.lstrip()
+    return code.split(' ', 1)[0] if code else ''
+
+
+def _operand(line) -> Optional[str]:
+    """Первый операнд строки: из params или из текста после инструкции"""
+    if line.params:
+        return str(line.params[0])
+    parts = line.code.split(None, 1)
+    return parts[1] if len(parts) > 1 else None
+
+
+def _indent(line) -> str:
+    return line.code[:len(line.code) - len(line.code.lstrip())]
+
+
+def _is_label(value) -> bool:
+    return type(value).__name__ == 'CodeLabel'
+
+
+def _ldc_value(line) -> Optional[int]:
+    """Значение, которое загружает ldc.i4 в любой форме, иначе None"""
+    instr = _instr(line)
+    if instr == 'ldc.i4' or instr == 'ldc.i4.s':
+        try:
+            return int(_operand(line))
+        except (TypeError, ValueError):
+            return None
+    if instr.startswith('ldc.i4.'):
+        suffix = instr[len('ldc.i4.'):]
+        if suffix == 'm1' or suffix == 'M1':
+            return -1
+        if suffix.isdigit():
+            return int(suffix)
+    return None
+
+
+def _set_ldc(line, value: int) -> None:
+    """Записать в строку самую короткую форму загрузки константы"""
+    indent = _indent(line)
+    if value == -1:
+        line.code, line.params = indent + 'ldc.i4.m1', ()
+    elif 0 <= value <= 8:
+        line.code, line.params = indent + 'ldc.i4.' + str(value), ()
+    elif -128 <= value <= 127:
+        line.code, line.params = indent + 'ldc.i4.s', (value, )
+    else:
+        line.code, line.params = indent + 'ldc.i4', (value, )
+
+
+_INVERSE_BRANCH = {'brfalse': 'brtrue', 'brtrue': 'brfalse'}
+
+
+def _is_empty(line) -> bool:
+    return not line.code.strip() and not line.params
+
+
+def _is_instruction(line) -> bool:
+    instr = _instr(line)
+    return bool(instr) and instr[0] not in '.{}'
+
+
+class _Peephole:
+    def __init__(self, lines: List) -> None:
+        self.lines = lines
+        self.alias: Dict[object, object] = {}  # метка -> метка, которой она заменена
+
+    def resolve(self, label):
+        while label in self.alias:
+            label = self.alias[label]
+        return label
+
+    def referenced(self) -> Set[object]:
+        refs = set()
+        for line in self.lines:
+            for p in line.params:
+                if _is_label(p):
+                    refs.add(self.resolve(p))
+        return refs
+
+    def read_locals(self) -> Dict[str, int]:
+        """Сколько раз читается каждая локальная переменная (в пределах всего списка - по методам отдельно)"""
+        counts: Dict[str, int] = {}
+        method = 0
+        for line in self.lines:
+            instr = _instr(line)
+            if instr == '.method':
+                method += 1
+            elif instr in ('ldloc', 'ldloca'):
+                key = '{}:{}'.format(method, _operand(line))
+                counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def step(self) -> bool:
+        lines = self.lines
+        refs = self.referenced()
+        loc_reads = self.read_locals()
+        out = []
+        changed = False
+        method = 0
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            instr = _instr(line)
+            if instr == '.method':
+                method += 1
+
+            # метка, на которую больше нет переходов
+            if line.label and _is_instruction(line) and self.resolve(line.label) not in refs:
+                line.label = None
+                changed = True
+
+            # ldc.i4 N -> короткая форма
+            value = _ldc_value(line)
+            if value is not None:
+                before = (line.code, line.params)
+                _set_ldc(line, value)
+                changed |= before != (line.code, line.params)
+
+            # ldc.i4.0; ceq; brfalse/brtrue L -> brtrue/brfalse L
+            if value == 0 and i + 2 < len(lines):
+                ceq, branch = lines[i + 1], lines[i + 2]
+                if _instr(ceq) == 'ceq' and not ceq.label and not branch.label and _instr(branch) in _INVERSE_BRANCH:
+                    branch.code = _indent(branch) + _INVERSE_BRANCH[_instr(branch)]
+                    branch.label = line.label
+                    out.append(branch)
+                    i += 3
+                    changed = True
+                    continue
+
+            # br на метку, которая стоит сразу за переходом
+            if instr == 'br' and _is_label(line.params[0]):
+                target = self.resolve(line.params[0])
+                j = i + 1
+                follows = False
+                while j < len(lines):
+                    if lines[j].label and self.resolve(lines[j].label) is target:
+                        follows = True
+                        break
+                    if not _is_empty(lines[j]):
+                        break
+                    j += 1
+                if follows:
+                    if line.label:
+                        # метку самого перехода переносим на пустую строку
+                        line.code, line.params = '', ()
+                        out.append(line)
+                    i += 1
+                    changed = True
+                    continue
+
+            # stloc x; ldloc x, если x больше нигде не читается
+            if instr == 'stloc' and i + 1 < len(lines):
+                load = lines[i + 1]
+                if _instr(load) == 'ldloc' and not load.label and _operand(load) == _operand(line) \
+                        and loc_reads.get('{}:{}'.format(method, _operand(line))) == 1:
+                    if line.label:
+                        line.code, line.params = '', ()
+                        out.append(line)
+                    i += 2
+                    changed = True
+                    continue
+
+            # пустые строки с метками
+            if _is_empty(line) and line.label:
+                label = self.resolve(line.label)
+                if label not in refs:
+                    i += 1
+                    changed = True
+                    continue
+                if i + 1 < len(lines):
+                    nxt = lines[i + 1]
+                    if nxt.label:
+                        if _is_empty(nxt) or _is_instruction(nxt):
+                            self.alias[self.resolve(nxt.label)] = label
+                            nxt.label = label
+                            i += 1
+                            changed = True
+                            continue
+                    elif _is_instruction(nxt):
+                        nxt.label = label
+                        i += 1
+                        changed = True
+                        continue
+
+            out.append(line)
+            i += 1
+
+        # переходы на замененные метки
+        for line in out:
+            if line.label:
+                line.label = self.resolve(line.label)
+            if any(_is_label(p) for p in line.params):
+                line.params = tuple(self.resolve(p) if _is_label(p) else p for p in line.params)
+        self.lines = out
+        return changed
+
+
+def optimize(lines: List) -> List:
+    """Оптимизировать список CodeLine (строки изменяются на месте)
+    :return: новый список строк
+    """
+    peephole = _Peephole(list(lines))
+    while peephole.step():
+        pass
+    return peephole.lines
+
+
+def instruction_count(lines) -> int:
+    """Кол-во инструкций (без директив, скобок и пустых строк с метками)"""
+    return sum(1 for line in lines if _is_instruction(line))
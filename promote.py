@@ -0,0 +1,42 @@
+"""Перевод глобальных переменных, которые используются только в Main, в локальные переменные Main
+
+Глобальная переменная генерируется как статическое поле класса Program (ldsfld/stsfld), хотя часто
+(например, счетчики циклов программы верхнего уровня) к ней обращается только код Main. Если ни одна функция
+не ссылается на переменную, ее IdentDesc получает область LOCAL и новый индекс среди локальных переменных Main:
+все узлы дерева ссылаются на один IdentDesc, поэтому кодогенератор сразу выдает ldloc/stloc.
+Слоты не переиспользуются, и .locals init, как и поле, обнуляет переменную один раз - при запуске программы.
+"""
+from typing import Set
+
+from mel_ast import FuncDeclNode, StatementListNode, iter_nodes
+from my_semantic_baza import IdentDesc, ScopeType
+
+
+def func_globals(prog: StatementListNode) -> Set[IdentDesc]:
+    """Глобальные имена, на которые ссылается хотя бы одна функция"""
+    used: Set[IdentDesc] = set()
+    for stmt in prog.exprs:
+        if isinstance(stmt, FuncDeclNode):
+            for node in iter_nodes(stmt.body):
+                ident = node.node_ident
+                if ident is not None and ident.scope == ScopeType.GLOBAL:
+                    used.add(ident)
+    return used
+
+
+def promote_globals(prog: StatementListNode) -> int:
+    """Сделать локальными переменными Main глобальные переменные, которые не используются в функциях
+    (дерево изменяется на месте)
+    :return: кол-во переведенных переменных
+    """
+    used = func_globals(prog)
+    next_index = max((decl.ident.node_ident.index + 1 for decl in prog.var_decls
+                      if decl.ident.node_ident.scope == ScopeType.LOCAL), default=0)
+    promoted = 0
+    for decl in prog.var_decls:
+        ident = decl.ident.node_ident
+        if ident.scope == ScopeType.GLOBAL and ident not in used:
+            ident.scope, ident.index = ScopeType.LOCAL, next_index
+            next_index += 1
+            promoted += 1
+    return promoted
@@ -0,0 +1,442 @@
+"""Трансляция проверенного дерева в модуль Python (ast.Module), который компилируется compile() и выполняется
+CPython без собственного интерпретатора
+
+Имена - как в MSIL: функции - f_{имя}, параметры - _p{index}, локальные переменные - _v{index}, глобальные
+переменные - переменные модуля _gv{index}, массивы - переменные модуля _arr_{имя}. Код верхнего уровня - функция
+_main (локальные переменные Python быстрее переменных модуля). Семантика - как у closure_exec.py и MSIL:
+    - int - 32 бита (операции +, -, * записываются с переносом по модулю 2**32 прямо в выражении),
+      деление и остаток - closure_exec.divide/remainder;
+    - TypeConvertNode - float(), str(), float_str() (как Convert.ToString(double)), chr();
+    - && и || - and/or (сокращенное вычисление), сравнения в условиях не превращаются в 0/1;
+    - локальные переменные обнуляются при входе в функцию, как .locals init;
+    - хвостовой вызов функцией самой себя - цикл while True: новые значения параметров и continue, а внутри
+      цикла программы - флаг _tail и break, после цикла - проверка флага (break из объемлющего цикла
+      или continue цикла while True);
+    - глубина вызовов считается в списке _depth (пролог каждой функции f_...), больше CALL_DEPTH_LIMIT -
+      StackOverflowError.
+Подстановки InlineCallNode (после -O) снова записываются вызовом исходной функции (через _inline, который не
+увеличивает глубину вызовов): в выражении Python нельзя разместить операторы ее тела. Номер строки каждого оператора Python - строка исходного кода (для ошибок).
+"""
+import ast
+import sys
+from typing import Dict, List, Optional, Set, TextIO
+
+from closure_exec import DEFAULTS, CALL_DEPTH_LIMIT, RECURSION_LIMIT, ExecutionError, StackOverflowError, Runtime, \
+    divide, remainder, float_str, int32, compare_str
+from mel_ast import AstNode, LiteralNode, IdentNode, BinOpNode, TypeConvertNode, FuncCallNode, AssignNode, DeclNode, \
+    ArrNode, ArrItemNode, StatementListNode, IfOpNode, WhileOpNode, ForOpNode, ReturnOpNode, FuncDeclNode, \
+    InlineCallNode, iter_nodes
+from my_semantic_baza import BaseType, BinOp, IdentDesc, ScopeType
+
+FILENAME = '<mel>'
+BUILT_INS = ('input', 'write', 'writeline', 'to_int', 'to_float')
+
+_COMPARE_OPS = {
+    BinOp.EQ: ast.Eq, BinOp.NE: ast.NotEq, BinOp.LT: ast.Lt, BinOp.LE: ast.LtE, BinOp.GT: ast.Gt, BinOp.GE: ast.GtE,
+}
+_ARITHMETIC_OPS = {BinOp.ADD: ast.Add, BinOp.SUB: ast.Sub, BinOp.MUL: ast.Mult}
+
+
+def _negative_index(index: int, name: str):
+    raise ExecutionError('Индекс {} вне границ массива {}'.format(index, name))
+
+
+def _overflow():
+    raise StackOverflowError()
+
+
+def _name(id_: str, store: bool = False) -> ast.Name:
+    return ast.Name(id_, ast.Store() if store else ast.Load())
+
+
+def _const(value) -> ast.expr:
+    if isinstance(value, (int, float)) and value < 0:
+        return ast.UnaryOp(ast.USub(), ast.Constant(-value))
+    return ast.Constant(value)
+
+
+def _call(func: str, *args: ast.expr) -> ast.Call:
+    return ast.Call(_name(func), list(args), [])
+
+
+def _wrap_int32(expr: ast.expr) -> ast.expr:
+    """(expr + 2**31 & 2**32 - 1) - 2**31"""
+    return ast.BinOp(ast.BinOp(ast.BinOp(expr, ast.Add(), ast.Constant(0x80000000)), ast.BitAnd(),
+                               ast.Constant(0xFFFFFFFF)), ast.Sub(), ast.Constant(0x80000000))
+
+
+def _locate(node: ast.AST, row: int) -> None:
+    """Номера строк для всех узлов: строка ближайшего оператора (ast.fix_missing_locations в разы медленнее)"""
+    if 'lineno' in node._attributes:
+        if hasattr(node, 'lineno'):
+            row = node.lineno
+        else:
+            node.lineno = node.end_lineno = row
+        node.col_offset = node.end_col_offset = 0
+    for field in node._fields:
+        value = getattr(node, field, None)
+        if type(value) is list:
+            for item in value:
+                if isinstance(item, ast.AST):
+                    _locate(item, row)
+        elif isinstance(value, ast.AST):
+            _locate(value, row)
+
+
+def _count_depth(code: List[ast.stmt]) -> List[ast.stmt]:
+    """if _depth[0] >= CALL_DEPTH_LIMIT: _overflow()
+    _depth[0] += 1
+    try: code
+    finally: _depth[0] -= 1
+    """
+    def depth(store: bool = False) -> ast.Subscript:
+        return ast.Subscript(_name('_depth'), ast.Constant(0), ast.Store() if store else ast.Load())
+    return [
+        ast.If(ast.Compare(depth(), [ast.GtE()], [ast.Constant(CALL_DEPTH_LIMIT)]), [ast.Expr(_call('_overflow'))], []),
+        ast.AugAssign(depth(True), ast.Add(), ast.Constant(1)),
+        ast.Try(code or [ast.Pass()], [], [], [ast.AugAssign(depth(True), ast.Sub(), ast.Constant(1))]),
+    ]
+
+
+def _tail_calls(func: FuncDeclNode) -> List[ReturnOpNode]:
+    return [node for node in iter_nodes(func.body) if isinstance(node, ReturnOpNode)
+            and isinstance(node.value, FuncCallNode) and node.value.name.name == func.name.name]
+
+
+class _Translator:
+    def __init__(self) -> None:
+        # переменные модуля (собираются при трансляции)
+        self.globals: Dict[int, IdentDesc] = {}
+        self.arrays: Set[str] = set()
+        self.assigned: Set[str] = set()  # переменные модуля, которые присваивает транслируемая функция
+        self.func: Optional[FuncDeclNode] = None
+        self.func_loop = False
+        self.tail_loops: Set[int] = set()  # циклы программы (id узла), внутри которых есть хвостовой вызов
+        self.loop_depth = 0  # вложенность циклов программы в транслируемом операторе
+        self.temps = 0
+
+    def var(self, ident: IdentDesc, store: bool = False) -> ast.Name:
+        if ident.scope == ScopeType.GLOBAL:
+            self.globals[ident.index] = ident
+            name = '_gv{}'.format(ident.index)
+            if store:
+                self.assigned.add(name)
+            return _name(name, store)
+        if ident.scope == ScopeType.PARAM:
+            return _name('_p{}'.format(ident.index), store)
+        return _name('_v{}'.format(ident.index), store)
+
+    # Выражения
+    def expr(self, node: AstNode) -> ast.expr:
+        if isinstance(node, LiteralNode):
+            value = node.value
+            if node.node_type.base_type == BaseType.INT:
+                value = int32(value)
+            elif node.node_type.base_type == BaseType.FLOAT:
+                value = float(value)
+            return _const(value)
+        if isinstance(node, IdentNode):
+            return self.var(node.node_ident)
+        if isinstance(node, BinOpNode):
+            return self.bin_op(node)
+        if isinstance(node, TypeConvertNode):
+            return self.convert(node)
+        if isinstance(node, ArrItemNode):
+            return ast.Subscript(self.array(node.ident.name), self.index(node), ast.Load())
+        if isinstance(node, FuncCallNode):
+            return self.call(node.name.name, node.name.node_ident.built_in, node.params.params)
+        if isinstance(node, InlineCallNode):
+            return _call('_inline', _name('f_' + node.name.name),
+                         *(self.expr(param.init_value) for param in node.params))
+        raise ExecutionError('Неподдерживаемое выражение {}'.format(type(node).__name__), node.row)
+
+    def bin_op(self, node: BinOpNode, wrap: bool = True) -> ast.expr:
+        """:param wrap: приводить результат int к 32 битам (в цепочке +, -, * достаточно привести только итог)"""
+        op = node.op
+        if op in (BinOp.AND, BinOp.OR) or op in _COMPARE_OPS:
+            return ast.IfExp(self.cond(node), ast.Constant(1), ast.Constant(0))
+        base_type = node.node_type.base_type
+        if base_type == BaseType.INT and op in _ARITHMETIC_OPS:
+            expr = ast.BinOp(self.int_operand(node.arg1), _ARITHMETIC_OPS[op](), self.int_operand(node.arg2))
+            return _wrap_int32(expr) if wrap else expr
+        a, b = self.expr(node.arg1), self.expr(node.arg2)
+        if base_type == BaseType.STR:
+            return ast.BinOp(self.str_operand(node.arg1, a), ast.Add(), self.str_operand(node.arg2, b))
+        if op == BinOp.DIV:
+            return _call('_div', a, b)
+        if op == BinOp.MOD:
+            return _call('_rem', a, b)
+        return ast.BinOp(a, _ARITHMETIC_OPS[op](), b)
+
+    def int_operand(self, node: AstNode) -> ast.expr:
+        if isinstance(node, BinOpNode) and node.op in _ARITHMETIC_OPS and node.node_type.base_type == BaseType.INT:
+            return self.bin_op(node, False)
+        return self.expr(node)
+
+    @staticmethod
+    def str_operand(node: AstNode, expr: ast.expr) -> ast.expr:
+        """Операнд конкатенации: null - пустая строка (литералы, символы и результаты операций - не null)"""
+        if isinstance(node, (LiteralNode, TypeConvertNode, BinOpNode)) or node.node_type.base_type == BaseType.CHAR:
+            return expr
+        return ast.BoolOp(ast.Or(), [expr, ast.Constant('')])
+
+    def cond(self, node: AstNode) -> ast.expr:
+        """Условие (значение, истинность которого совпадает с условием программы)"""
+        if isinstance(node, BinOpNode) and node.op in (BinOp.AND, BinOp.OR):
+            return ast.BoolOp(ast.And() if node.op == BinOp.AND else ast.Or(), [self.cond(node.arg1),
+                                                                                 self.cond(node.arg2)])
+        if isinstance(node, BinOpNode) and node.op in _COMPARE_OPS:
+            a, b = self.expr(node.arg1), self.expr(node.arg2)
+            if node.arg1.node_type.base_type == BaseType.STR and node.op not in (BinOp.EQ, BinOp.NE):
+                a, b = _call('_cmps', a, b), ast.Constant(0)
+            return ast.Compare(a, [_COMPARE_OPS[node.op]()], [b])
+        return self.expr(node)
+
+    def convert(self, node: TypeConvertNode) -> ast.expr:
+        expr = self.expr(node.expr)
+        src, dst = node.expr.node_type.base_type, node.node_type.base_type
+        if dst == BaseType.FLOAT and src == BaseType.INT:
+            return _call('float', expr)
+        if dst == BaseType.STR and src == BaseType.INT:
+            return _call('str', expr)
+        if dst == BaseType.STR and src == BaseType.FLOAT:
+            return _call('_fstr', expr)
+        if dst == BaseType.CHAR and src == BaseType.INT:
+            return _call('chr', ast.BinOp(expr, ast.BitAnd(), ast.Constant(0xFFFF)))
+        return expr
+
+    def array(self, name: str, store: bool = False) -> ast.Name:
+        self.arrays.add(name)
+        if store:
+            self.assigned.add('_arr_' + name)
+        return _name('_arr_' + name, store)
+
+    def index(self, node: ArrItemNode) -> ast.expr:
+        index = node.index
+        if isinstance(index, LiteralNode) and index.value >= 0:
+            return self.expr(index)
+        if isinstance(index, IdentNode):
+            name = self.expr(index)
+            return ast.IfExp(ast.Compare(name, [ast.GtE()], [ast.Constant(0)]), name,
+                             _call('_negative_index', name, ast.Constant(node.ident.name)))
+        # отрицательный индекс в Python - элемент с конца, поэтому проверяется отдельно: _i if (_i := index) >= 0 else
+        self.temps += 1
+        temp = '_i{}'.format(self.temps)
+        return ast.IfExp(ast.Compare(ast.NamedExpr(_name(temp, True), self.expr(index)), [ast.GtE()], [ast.Constant(0)]),
+                         _name(temp), _call('_negative_index', _name(temp), ast.Constant(node.ident.name)))
+
+    def call(self, name: str, built_in: bool, params) -> ast.expr:
+        return _call(('_rt_' if built_in else 'f_') + name, *(self.expr(param) for param in params))
+
+    # Операторы
+    def stmts(self, node: AstNode) -> List[ast.stmt]:
+        if isinstance(node, StatementListNode):
+            result = []
+            for expr in node.exprs:
+                if not isinstance(expr, FuncDeclNode):
+                    result.extend(self.stmts(expr))
+                if isinstance(expr, ReturnOpNode):
+                    break  # дальше код недостижим
+            return result
+        stmts = self.stmt(node)
+        for stmt in stmts:
+            stmt.lineno = stmt.end_lineno = node.row or 1
+        return stmts
+
+    def block(self, node: AstNode) -> List[ast.stmt]:
+        return self.stmts(node) or [ast.Pass()]
+
+    def stmt(self, node: AstNode) -> List[ast.stmt]:
+        if isinstance(node, AssignNode):
+            var = node.var
+            if isinstance(var, ArrItemNode):
+                target = ast.Subscript(self.array(var.ident.name), self.index(var), ast.Store())
+            else:
+                target = self.var(var.node_ident, True)
+            return [ast.Assign([target], self.expr(node.val))]
+        if isinstance(node, DeclNode):
+            return self.decl(node)
+        if isinstance(node, ArrNode):
+            default = DEFAULTS.get(node.node_type.base_type)
+            elements = []
+            for element in node.elements:
+                value = self.expr(element)
+                if node.node_type.base_type == BaseType.FLOAT and element.node_type.base_type == BaseType.INT:
+                    value = _call('float', value)
+                elements.append(value)
+            value = ast.List(elements, ast.Load())
+            rest = node.length.value - len(elements)
+            if rest:
+                value = ast.BinOp(value, ast.Add(), ast.BinOp(ast.List([_const(default)], ast.Load()), ast.Mult(),
+                                                              ast.Constant(rest)))
+            return [ast.Assign([self.array(node.name.name, True)], value)]
+        if isinstance(node, IfOpNode):
+            orelse = self.block(node.elseStmts) if node.elseStmts is not None else []
+            return [ast.If(self.cond(node.cond), self.block(node.thenStmts), orelse)]
+        if isinstance(node, WhileOpNode):
+            self.loop_depth += 1
+            loop = ast.While(self.cond(node.cond), self.block(node.stmts), [])
+            self.loop_depth -= 1
+            return [loop] + self.tail_check(node)
+        if isinstance(node, ForOpNode):
+            init = self.stmts(node.decl)
+            self.loop_depth += 1
+            loop = ast.While(self.cond(node.cond), self.stmts(node.body) + self.stmts(node.stmt) or [ast.Pass()], [])
+            self.loop_depth -= 1
+            return init + [loop] + self.tail_check(node)
+        if isinstance(node, ReturnOpNode):
+            value = node.value
+            if self.func_loop and isinstance(value, FuncCallNode) and value.name.name == self.func.name.name:
+                # новые значения параметров (все аргументы вычисляются до присваивания) и повтор тела
+                params = [self.var(param.ident.node_ident, True) for param in self.func.params.params]
+                args = [self.expr(param) for param in value.params.params]
+                if self.loop_depth:
+                    # continue относился бы к циклу программы: выходим из него, флаг проверяется после цикла
+                    stmts = [ast.Assign([_name('_tail', True)], ast.Constant(True)), ast.Break()]
+                else:
+                    stmts = [ast.Continue()]
+                if params:
+                    stmts.insert(0, ast.Assign([ast.Tuple(params, ast.Store())], ast.Tuple(args, ast.Load())))
+                return stmts
+            return [ast.Return(self.expr(value))]
+        if isinstance(node, FuncDeclNode):
+            return []
+        return [ast.Expr(self.expr(node))]
+
+    def tail_check(self, loop: AstNode) -> List[ast.stmt]:
+        """Проверка флага _tail после цикла программы, в котором есть хвостовой вызов"""
+        if id(loop) not in self.tail_loops:
+            return []
+        if self.loop_depth:
+            return [ast.If(_name('_tail'), [ast.Break()], [])]
+        return [ast.If(_name('_tail'), [ast.Assign([_name('_tail', True)], ast.Constant(False)), ast.Continue()], [])]
+
+    def decl(self, node: DeclNode) -> List[ast.stmt]:
+        ident = node.ident.node_ident
+        if node.init_value is None:
+            # слот мог остаться занятым значением переменной из прошлого блока (или прошлого повтора тела функции)
+            if ident.scope == ScopeType.LOCAL and (ident.reused or self.func_loop):
+                return [ast.Assign([self.var(ident, True)], _const(DEFAULTS.get(ident.type.base_type)))]
+            return []
+        value = self.expr(node.init_value)
+        if ident.type.base_type == BaseType.FLOAT and node.init_value.node_type.base_type == BaseType.INT:
+            value = _call('float', value)
+        return [ast.Assign([self.var(ident, True)], value)]
+
+    # Функции
+    def function(self, name: str, params: List[str], var_decls: List[DeclNode], body: AstNode) -> ast.FunctionDef:
+        stmts: List[ast.stmt] = []
+        self.temps = 0
+        self.assigned = set()
+        code = self.stmts(body)
+        if self.assigned:
+            stmts.append(ast.Global(sorted(self.assigned)))
+        # .locals init
+        locals_: Dict[int, object] = {}
+        for decl in var_decls or ():
+            ident = decl.ident.node_ident
+            if ident.scope == ScopeType.LOCAL:
+                locals_[ident.index] = DEFAULTS.get(ident.type.base_type)
+        for index, value in sorted(locals_.items()):
+            stmts.append(ast.Assign([_name('_v{}'.format(index), True)], _const(value)))
+        if self.func_loop:
+            code = [ast.While(ast.Constant(True), code + [ast.Return(ast.Constant(None))], [])]
+            if self.tail_loops:
+                code.insert(0, ast.Assign([_name('_tail', True)], ast.Constant(False)))
+        if name != '_main':
+            code = _count_depth(code)
+        stmts.extend(code)
+        args = ast.arguments([], [ast.arg(p) for p in params], None, [], [], None, [])
+        return ast.FunctionDef(name, args, stmts or [ast.Pass()], [], None, lineno=1, end_lineno=1)
+
+    def module(self, prog: StatementListNode) -> ast.Module:
+        body: List[ast.stmt] = []
+        for func in prog.exprs:
+            if isinstance(func, FuncDeclNode):
+                tail_calls = {id(ret) for ret in _tail_calls(func)}
+                self.func, self.func_loop = func, bool(tail_calls)
+                self.tail_loops = {id(loop) for loop in iter_nodes(func.body) if isinstance(loop, (WhileOpNode, ForOpNode))
+                                   and any(id(node) in tail_calls for node in iter_nodes(loop))}
+                params = ['_p{}'.format(param.ident.node_ident.index) for param in func.params.params]
+                body.append(self.function('f_' + func.name.name, params, func.var_decls, func.body))
+        self.func, self.func_loop, self.tail_loops = None, False, set()
+        body.append(self.function('_main', [], prog.var_decls, prog))
+        init: List[ast.stmt] = []
+        for index, ident in sorted(self.globals.items()):
+            init.append(ast.Assign([_name('_gv{}'.format(index), True)], _const(DEFAULTS.get(ident.type.base_type))))
+        for name in sorted(self.arrays):
+            init.append(ast.Assign([_name('_arr_' + name, True)], ast.Constant(None)))
+        module = ast.Module(init + body, [])
+        _locate(module, 1)
+        return module
+
+
+class CompiledProgram:
+    """Программа, скомпилированная в код Python (можно выполнять многократно, но не одновременно)"""
+
+    def __init__(self, prog: StatementListNode) -> None:
+        self.module = _Translator().module(prog)
+        self.code = compile(self.module, FILENAME, 'exec')
+
+    def source(self) -> str:
+        """Текст модуля (для отладки)"""
+        return ast.unparse(self.module)
+
+    def run(self, stdin: Optional[TextIO] = None, stdout: Optional[TextIO] = None) -> None:
+        """Выполнить программу
+        :raise ExecutionError: ошибка во время выполнения (вывод до ошибки записывается в stdout)
+        """
+        runtime = Runtime(stdin, stdout)
+        depth = [0]
+
+        def inline(func, *args):
+            # подставленная функция выполняется в кадре вызывающей (как в других исполнителях)
+            depth[0] -= 1
+            result = func(*args)
+            depth[0] += 1
+            return result
+        namespace = {
+            '_div': divide, '_rem': remainder, '_fstr': float_str, '_cmps': compare_str,
+            '_negative_index': _negative_index, '_overflow': _overflow, '_depth': depth, '_inline': inline,
+        }
+        for name in BUILT_INS:
+            namespace['_rt_' + name] = getattr(runtime, name)
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, RECURSION_LIMIT))
+        try:
+            exec(self.code, namespace)
+            namespace['_main']()
+        except StackOverflowError:
+            raise
+        except ExecutionError as e:
+            raise e if e.row else ExecutionError(e.message, _row(e))
+        except RecursionError:
+            raise StackOverflowError()
+        except IndexError as e:
+            raise ExecutionError('Индекс вне границ массива', _row(e))
+        except TypeError as e:
+            # обращение к массиву, объявление которого еще не выполнено (_arr_... = None)
+            raise ExecutionError('Массив не создан ({})'.format(e), _row(e))
+        finally:
+            sys.setrecursionlimit(limit)
+            runtime.flush()
+
+
+def _row(e: BaseException) -> Optional[int]:
+    """Строка исходного кода, в которой возникло исключение (последний кадр скомпилированного модуля)"""
+    row, tb = None, e.__traceback__
+    while tb is not None:
+        if tb.tb_frame.f_code.co_filename == FILENAME:
+            row = tb.tb_lineno
+        tb = tb.tb_next
+    return row
+
+
+def compile_program(prog: StatementListNode) -> CompiledProgram:
+    """Скомпилировать проверенную программу в код Python"""
+    return CompiledProgram(prog)
+
+
+def run(prog: StatementListNode, stdin: Optional[TextIO] = None, stdout: Optional[TextIO] = None) -> None:
+    """Скомпилировать и выполнить проверенную программу"""
+    compile_program(prog).run(stdin, stdout)
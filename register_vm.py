@@ -0,0 +1,668 @@
+"""Регистровая виртуальная машина: проверенное дерево компилируется в байт-код и выполняется без .NET
+
+Байт-код всей программы - один array('i'), каждая инструкция занимает 4 числа: код операции и три операнда
+(a - как правило, регистр результата). Регистры - слоты кадра метода: параметры, локальные переменные
+(как в .locals), затем временные значения. Глобальные переменные - отдельный список (индекс = IdentDesc.index),
+массивы - список по номерам имен (как статические поля, массивы хранятся по имени). Строки, float и значения
+по умолчанию лежат в пуле констант, int (32 бита) записываются прямо в операнд. Литералы выражений - регистры
+констант в конце кадра (заполняются вместе с остальными слотами из шаблона кадра и не требуют инструкций загрузки).
+Адреса переходов - номера инструкций.
+
+Кадры функций выделяются заранее: для каждой функции хранится пул кадров по глубине рекурсии, при вызове кадр
+заполняется копированием шаблона (значения по умолчанию), а вызовы выполняются без рекурсии Python - на явном
+стеке возвратов. Поведение совпадает с closure_exec.py (и с MSIL): хвостовой вызов функцией самой себя - переход
+в начало тела, && и || вычисляются сокращенно.
+"""
+from array import array
+from typing import Dict, List, Optional, TextIO, Tuple
+
+from closure_exec import CALL_DEPTH_LIMIT, DEFAULTS, ExecutionError, StackOverflowError, Runtime, divide, remainder, \
+    float_str, int32, compare_str
+from mel_ast import AstNode, LiteralNode, IdentNode, BinOpNode, TypeConvertNode, FuncCallNode, AssignNode, DeclNode, \
+    ArrNode, ArrItemNode, StatementListNode, IfOpNode, WhileOpNode, ForOpNode, ReturnOpNode, FuncDeclNode, \
+    InlineCallNode, iter_nodes
+from my_semantic_baza import BaseType, BinOp, IdentDesc, ScopeType
+
+# Коды операций (формат: операция a b c)
+OPCODES = (
+    'mov',      # r[a] = r[b]
+    'ldi',      # r[a] = b (int)
+    'ldc',      # r[a] = consts[b]
+    'ldg',      # r[a] = g[b]
+    'stg',      # g[a] = r[b]
+    'add',      # r[a] = r[b] + r[c] (int, по модулю 2**32)
+    'sub',
+    'mul',
+    'div',      # int и float (см. closure_exec.divide)
+    'rem',
+    'fadd',     # r[a] = r[b] + r[c] (float)
+    'fsub',
+    'fmul',
+    'concat',   # r[a] = r[b] + r[c] (строки, null - пустая строка)
+    'eq',       # r[a] = 1 if r[b] == r[c] else 0
+    'ne',
+    'lt',
+    'le',
+    'gt',
+    'ge',
+    'scmp',     # r[a] = -1, 0 или 1 (посимвольное сравнение строк, null меньше любой строки)
+    'i2f',      # r[a] = float(r[b])
+    'i2s',      # r[a] = str(r[b])
+    'f2s',
+    'i2c',
+    'jmp',      # pc = a (номер инструкции)
+    'jz',       # if not r[b]: pc = a
+    'jnz',
+    'beq',      # if r[b] == r[c]: pc = a
+    'bne',
+    'blt',
+    'ble',
+    'bgt',
+    'bge',
+    'call',     # r[a] = функция b(r[c], r[c + 1], ...)
+    'callb',    # r[a] = встроенная функция b(r[c]) (c = -1 - без аргумента)
+    'ret',      # возврат r[a]
+    'retv',     # возврат из void-функции
+    'newarr',   # arrays[a] = массив длины b из consts[c]
+    'ldelem',   # r[a] = arrays[b][r[c]]
+    'stelem',   # arrays[a][r[b]] = r[c]
+)
+(MOV, LDI, LDC, LDG, STG, ADD, SUB, MUL, DIV, REM, FADD, FSUB, FMUL, CONCAT, EQ, NE, LT, LE, GT, GE, SCMP,
+ I2F, I2S, F2S, I2C, JMP, JZ, JNZ, BEQ, BNE, BLT, BLE, BGT, BGE, CALL, CALLB, RET, RETV, NEWARR, LDELEM,
+ STELEM) = range(len(OPCODES))
+
+BUILT_INS = ('input', 'write', 'writeline', 'to_int', 'to_float')
+
+_COMPARE_OPS = {BinOp.EQ: EQ, BinOp.NE: NE, BinOp.LT: LT, BinOp.LE: LE, BinOp.GT: GT, BinOp.GE: GE}
+# условный переход по сравнению: (переход, если сравнение истинно; переход, если ложно)
+_COMPARE_BRANCHES = {
+    BinOp.EQ: (BEQ, BNE),
+    BinOp.NE: (BNE, BEQ),
+    BinOp.LT: (BLT, BGE),
+    BinOp.LE: (BLE, BGT),
+    BinOp.GT: (BGT, BLE),
+    BinOp.GE: (BGE, BLT),
+}
+# Позиции операндов-регистров (a, b, c) в инструкциях каждой операции
+_REGISTER_OPERANDS = {
+    MOV: (1, 2), LDI: (1, ), LDC: (1, ), LDG: (1, ), STG: (2, ), I2F: (1, 2), I2S: (1, 2), F2S: (1, 2), I2C: (1, 2),
+    JMP: (), JZ: (2, ), JNZ: (2, ), CALL: (1, 3), CALLB: (1, 3), RET: (1, ), RETV: (), NEWARR: (),
+    LDELEM: (1, 3), STELEM: (2, 3),
+}
+for _op in (ADD, SUB, MUL, DIV, REM, FADD, FSUB, FMUL, CONCAT, EQ, NE, LT, LE, GT, GE, SCMP):
+    _REGISTER_OPERANDS[_op] = (1, 2, 3)
+for _op in (BEQ, BNE, BLT, BLE, BGT, BGE):
+    _REGISTER_OPERANDS[_op] = (2, 3)
+# Регистры констант при компиляции метода нумеруются от CONST_REGISTER (после метода - переносятся в конец кадра)
+CONST_REGISTER = 1 << 24
+
+_INT_OPS = {BinOp.ADD: ADD, BinOp.SUB: SUB, BinOp.MUL: MUL, BinOp.DIV: DIV, BinOp.MOD: REM}
+_FLOAT_OPS = {BinOp.ADD: FADD, BinOp.SUB: FSUB, BinOp.MUL: FMUL, BinOp.DIV: DIV, BinOp.MOD: REM}
+
+
+class Function:
+    """Функция байт-кода: точка входа, кол-во параметров и шаблон кадра"""
+
+    def __init__(self, name: str, params: int) -> None:
+        self.name = name
+        self.params = params
+        self.entry = 0
+        self.template: List = []
+        self.frames: List[List] = []  # кадры по глубине рекурсии
+        self.depth = 0
+
+
+class Program:
+    """Скомпилированная программа: байт-код, пул констант и функции (functions[0] - Main)"""
+
+    def __init__(self) -> None:
+        self.code = array('i')
+        self.rows = array('i')  # строка исходного кода каждой инструкции (для сообщений об ошибках)
+        self.consts: List = []
+        self.functions: List[Function] = []
+        self.globals: List = []
+        self.arrays: List[str] = []  # имена массивов по номерам
+        self._decoded: Optional[List[Tuple[int, int, int, int]]] = None
+
+    def decoded(self) -> List[Tuple[int, int, int, int]]:
+        """Инструкции в виде кортежей (для цикла выполнения: распаковка кортежа быстрее, чем 4 обращения к array)"""
+        if self._decoded is None or len(self._decoded) * 4 != len(self.code):
+            code = self.code
+            self._decoded = [(code[i], code[i + 1], code[i + 2], code[i + 3]) for i in range(0, len(code), 4)]
+        return self._decoded
+
+    def disassemble(self) -> List[str]:
+        """Текст байт-кода: по строке на инструкцию (метки - начала функций)"""
+        entries = {func.entry: func.name for func in self.functions}
+        lines = []
+        for pc, (op, a, b, c) in enumerate(self.decoded()):
+            if pc in entries:
+                lines.append('{}:'.format(entries[pc]))
+            lines.append('{:6} {:8} {} {} {}'.format(pc, OPCODES[op], a, b, c))
+        return lines
+
+
+class _Compiler:
+    def __init__(self, prog: StatementListNode) -> None:
+        self.program = Program()
+        self.const_index: Dict[tuple, int] = {}
+        self.array_index: Dict[str, int] = {}
+        self.function_index: Dict[str, int] = {}
+        self.func: Optional[FuncDeclNode] = None
+        self.func_loop = False
+        self.inline_exits: List[Tuple[int, List[int]]] = []  # (регистр результата, переходы в конец подстановки)
+        for decl in prog.var_decls or ():
+            ident = decl.ident.node_ident
+            if ident.scope == ScopeType.GLOBAL:
+                self.global_slot(ident)
+
+    def emit(self, op: int, a: int = 0, b: int = 0, c: int = 0, row: Optional[int] = None) -> int:
+        """:return: номер инструкции"""
+        pc = len(self.program.rows)
+        self.program.code.extend((op, a, b, c))
+        self.program.rows.append(row or 0)
+        return pc
+
+    def patch(self, pc: int, target: int) -> None:
+        self.program.code[pc * 4 + 1] = target
+
+    @property
+    def pc(self) -> int:
+        return len(self.program.rows)
+
+    def const(self, value) -> int:
+        key = type(value).__name__, repr(value)  # 0.0 и -0.0 - разные константы
+        if key not in self.const_index:
+            self.const_index[key] = len(self.program.consts)
+            self.program.consts.append(value)
+        return self.const_index[key]
+
+    def global_slot(self, ident: IdentDesc) -> int:
+        g = self.program.globals
+        while len(g) <= ident.index:
+            g.append(0)
+        g[ident.index] = DEFAULTS.get(ident.type.base_type)
+        return ident.index
+
+    def array(self, name: str) -> int:
+        if name not in self.array_index:
+            self.array_index[name] = len(self.program.arrays)
+            self.program.arrays.append(name)
+        return self.array_index[name]
+
+    def temp(self) -> int:
+        r = self.next_temp
+        self.next_temp += 1
+        self.frame_size = max(self.frame_size, self.next_temp)
+        return r
+
+    def const_register(self, value) -> int:
+        """Регистр константы в кадре текущего метода"""
+        key = type(value).__name__, repr(value)
+        if key not in self.const_registers:
+            self.const_registers[key] = CONST_REGISTER + len(self.const_values)
+            self.const_values.append(value)
+        return self.const_registers[key]
+
+    def load(self, dest: int, value) -> None:
+        if type(value) is int and value == int32(value):
+            self.emit(LDI, dest, value)
+        else:
+            self.emit(LDC, dest, self.const(value))
+
+    # Выражения: результат - номер регистра (target - желательный регистр результата)
+    def expr(self, node: AstNode, target: Optional[int] = None) -> int:
+        if isinstance(node, IdentNode):
+            ident = node.node_ident
+            if ident.scope == ScopeType.GLOBAL:
+                r = self.temp() if target is None else target
+                self.emit(LDG, r, self.global_slot(ident), row=node.row)
+                return r
+            if target is not None:
+                self.emit(MOV, target, self.slot(ident), row=node.row)
+                return target
+            return self.slot(ident)
+        if isinstance(node, LiteralNode):
+            value = node.value
+            if node.node_type.base_type == BaseType.INT:
+                value = int32(value)
+            elif node.node_type.base_type == BaseType.FLOAT:
+                value = float(value)
+            if target is not None:
+                self.load(target, value)
+                return target
+            return self.const_register(value)
+        r = self.temp() if target is None else target
+        if isinstance(node, BinOpNode):
+            self.bin_op(node, r)
+        elif isinstance(node, TypeConvertNode):
+            self.convert(node, r)
+        elif isinstance(node, ArrItemNode):
+            self.emit(LDELEM, r, self.array(node.ident.name), self.expr(node.index), row=node.row)
+        elif isinstance(node, FuncCallNode):
+            self.call(node, r)
+        elif isinstance(node, InlineCallNode):
+            self.inline_call(node, r)
+        else:
+            raise ExecutionError('Неподдерживаемое выражение {}'.format(type(node).__name__), node.row)
+        return r
+
+    def slot(self, ident: IdentDesc) -> int:
+        return ident.index if ident.scope == ScopeType.PARAM else self.params + ident.index
+
+    def bin_op(self, node: BinOpNode, r: int) -> None:
+        op = node.op
+        if op in (BinOp.AND, BinOp.OR):
+            false_jumps = self.cond_jump(node, False)
+            self.emit(LDI, r, 1)
+            end = self.emit(JMP)
+            for pc in false_jumps:
+                self.patch(pc, self.pc)
+            self.emit(LDI, r, 0)
+            self.patch(end, self.pc)
+            return
+        a, b = self.expr(node.arg1), self.expr(node.arg2)
+        if op in _COMPARE_OPS:
+            if node.arg1.node_type.base_type == BaseType.STR and op not in (BinOp.EQ, BinOp.NE):
+                self.emit(SCMP, r, a, b)
+                a, b = r, self.const_register(0)
+            self.emit(_COMPARE_OPS[op], r, a, b)
+            return
+        base_type = node.node_type.base_type
+        if base_type == BaseType.STR:
+            self.emit(CONCAT, r, a, b)
+        elif base_type == BaseType.INT:
+            self.emit(_INT_OPS[op], r, a, b, row=node.row)
+        else:
+            self.emit(_FLOAT_OPS[op], r, a, b, row=node.row)
+
+    def cond_jump(self, cond: AstNode, jump_if: bool) -> List[int]:
+        """Условный переход (адрес перехода заполняется позже)
+        :return: адреса инструкций перехода, которые выполняются, если значение cond равно jump_if
+        """
+        if isinstance(cond, BinOpNode) and cond.op in (BinOp.AND, BinOp.OR):
+            if (cond.op == BinOp.AND) != jump_if:
+                return self.cond_jump(cond.arg1, jump_if) + self.cond_jump(cond.arg2, jump_if)
+            skip = self.cond_jump(cond.arg1, not jump_if)
+            jumps = self.cond_jump(cond.arg2, jump_if)
+            for pc in skip:
+                self.patch(pc, self.pc)
+            return jumps
+        if isinstance(cond, BinOpNode) and cond.op in _COMPARE_BRANCHES:
+            a, b = self.expr(cond.arg1), self.expr(cond.arg2)
+            if cond.arg1.node_type.base_type == BaseType.STR and cond.op not in (BinOp.EQ, BinOp.NE):
+                r = self.temp()
+                self.emit(SCMP, r, a, b)
+                a, b = r, self.const_register(0)
+            elif cond.arg1.node_type.base_type == BaseType.FLOAT and not jump_if \
+                    and cond.op not in (BinOp.EQ, BinOp.NE):
+                # с NaN ложно и a < b, и a >= b: переход по ложному сравнению - по его значению (как .un в MSIL)
+                r = self.temp()
+                self.emit(_COMPARE_OPS[cond.op], r, a, b)
+                return [self.emit(JZ, 0, r)]
+            return [self.emit(_COMPARE_BRANCHES[cond.op][0 if jump_if else 1], 0, a, b)]
+        if isinstance(cond, LiteralNode) and cond.node_type.base_type == BaseType.INT:
+            # условие известно заранее (например, for без условия)
+            return [self.emit(JMP)] if (cond.value != 0) == jump_if else []
+        return [self.emit(JNZ if jump_if else JZ, 0, self.expr(cond))]
+
+    def convert(self, node: TypeConvertNode, r: int) -> None:
+        src, dst = node.expr.node_type.base_type, node.node_type.base_type
+        if dst == BaseType.FLOAT and src == BaseType.INT:
+            self.emit(I2F, r, self.expr(node.expr))
+        elif dst == BaseType.STR and src == BaseType.INT:
+            self.emit(I2S, r, self.expr(node.expr))
+        elif dst == BaseType.STR and src == BaseType.FLOAT:
+            self.emit(F2S, r, self.expr(node.expr))
+        elif dst == BaseType.CHAR and src == BaseType.INT:
+            self.emit(I2C, r, self.expr(node.expr))
+        else:
+            self.expr(node.expr, r)
+
+    def call(self, node: FuncCallNode, r: int) -> None:
+        params = node.params.params
+        if node.name.node_ident.built_in:
+            arg = self.expr(params[0]) if params else -1
+            self.emit(CALLB, r, BUILT_INS.index(node.name.name), arg, row=node.row)
+            return
+        base = self.next_temp
+        args = [self.temp() for _ in params]
+        for param, arg in zip(params, args):
+            self.expr(param, arg)
+        self.emit(CALL, r, self.function_index[node.name.name], base, row=node.row)
+
+    def inline_call(self, node: InlineCallNode, r: int) -> None:
+        for param in node.params:
+            self.stmt(param)
+        self.inline_exits.append((r, []))
+        self.stmt(node.body)
+        _, jumps = self.inline_exits.pop()
+        for pc in jumps:
+            self.patch(pc, self.pc)
+
+    def store(self, ident: IdentDesc, node: AstNode, row: Optional[int]) -> None:
+        """Записать значение выражения node в переменную"""
+        if ident.scope == ScopeType.GLOBAL:
+            self.emit(STG, self.global_slot(ident), self.expr(node), row=row)
+        else:
+            self.expr(node, self.slot(ident))
+
+    # Операторы (временные регистры освобождаются после каждого оператора)
+    def stmt(self, node: AstNode) -> None:
+        mark = self.next_temp
+        if isinstance(node, StatementListNode):
+            for expr in node.exprs:
+                if not isinstance(expr, FuncDeclNode):
+                    self.stmt(expr)
+                if isinstance(expr, ReturnOpNode):
+                    break  # дальше код недостижим
+        elif isinstance(node, AssignNode):
+            self.assign(node)
+        elif isinstance(node, DeclNode):
+            self.decl(node)
+        elif isinstance(node, ArrNode):
+            self.arr(node)
+        elif isinstance(node, IfOpNode):
+            self.if_op(node)
+        elif isinstance(node, WhileOpNode):
+            start = self.pc
+            exits = self.cond_jump(node.cond, False)
+            self.stmt(node.stmts)
+            self.emit(JMP, start)
+            for pc in exits:
+                self.patch(pc, self.pc)
+        elif isinstance(node, ForOpNode):
+            self.stmt(node.decl)
+            start = self.pc
+            exits = self.cond_jump(node.cond, False)
+            self.stmt(node.body)
+            self.stmt(node.stmt)
+            self.emit(JMP, start)
+            for pc in exits:
+                self.patch(pc, self.pc)
+        elif isinstance(node, ReturnOpNode):
+            self.return_op(node)
+        elif not isinstance(node, FuncDeclNode):
+            self.expr(node)  # вызов функции как оператор: значение не используется
+        self.next_temp = mark
+
+    def assign(self, node: AssignNode) -> None:
+        if isinstance(node.var, ArrItemNode):
+            index = self.expr(node.var.index)
+            self.emit(STELEM, self.array(node.var.ident.name), index, self.expr(node.val), row=node.row)
+        else:
+            self.store(node.var.node_ident, node.val, node.row)
+
+    def decl(self, node: DeclNode) -> None:
+        ident = node.ident.node_ident
+        if node.init_value is None:
+            # слот мог остаться занятым значением переменной из прошлого блока (или прошлого повтора тела функции)
+            if ident.scope == ScopeType.LOCAL and (ident.reused or self.func_loop):
+                self.load(self.slot(ident), DEFAULTS.get(ident.type.base_type))
+            return
+        if ident.type.base_type == BaseType.FLOAT and node.init_value.node_type.base_type == BaseType.INT:
+            value = self.expr(node.init_value)
+            if ident.scope == ScopeType.GLOBAL:
+                r = self.temp()
+                self.emit(I2F, r, value)
+                self.emit(STG, self.global_slot(ident), r)
+            else:
+                self.emit(I2F, self.slot(ident), value)
+            return
+        self.store(ident, node.init_value, node.row)
+
+    def arr(self, node: ArrNode) -> None:
+        arr, base_type = self.array(node.name.name), node.node_type.base_type
+        self.emit(NEWARR, arr, node.length.value, self.const(DEFAULTS.get(base_type)), row=node.row)
+        index = self.temp()
+        for i, element in enumerate(node.elements):
+            r = self.expr(element)
+            if base_type == BaseType.FLOAT and element.node_type.base_type == BaseType.INT:
+                value, r = r, self.temp()
+                self.emit(I2F, r, value)
+            self.emit(LDI, index, i)
+            self.emit(STELEM, arr, index, r, row=node.row)
+
+    def if_op(self, node: IfOpNode) -> None:
+        else_jumps = self.cond_jump(node.cond, False)
+        self.stmt(node.thenStmts)
+        if node.elseStmts is None:
+            for pc in else_jumps:
+                self.patch(pc, self.pc)
+            return
+        end = self.emit(JMP)
+        for pc in else_jumps:
+            self.patch(pc, self.pc)
+        self.stmt(node.elseStmts)
+        self.patch(end, self.pc)
+
+    def return_op(self, node: ReturnOpNode) -> None:
+        value = node.value
+        if self.inline_exits:
+            r, jumps = self.inline_exits[-1]
+            self.expr(value, r)
+            jumps.append(self.emit(JMP))
+            return
+        if self.func_loop and isinstance(value, FuncCallNode) and value.name.name == self.func.name.name:
+            # рекурсия в return - новые значения параметров и переход в начало тела
+            # (все аргументы вычисляются до присваивания, т.к. могут зависеть от старых значений)
+            args = [self.temp() for _ in value.params.params]
+            for param, arg in zip(value.params.params, args):
+                self.expr(param, arg)
+            for index, arg in enumerate(args):
+                self.emit(MOV, index, arg)
+            self.emit(JMP, self.body_start)
+            return
+        self.emit(RET, self.expr(value))
+
+    # Методы
+    def method(self, function: Function, var_decls: List[DeclNode], body: AstNode) -> None:
+        slots: Dict[int, object] = {}
+        for decl in var_decls or ():
+            ident = decl.ident.node_ident
+            if ident.scope == ScopeType.LOCAL:
+                slots[ident.index] = DEFAULTS.get(ident.type.base_type)
+        self.params = function.params
+        self.locals = max(slots, default=-1) + 1
+        self.next_temp = self.frame_size = self.params + self.locals
+        self.const_registers: Dict[tuple, int] = {}
+        self.const_values: List = []
+        function.entry = self.body_start = self.pc
+        self.stmt(body)
+        self.emit(RETV)
+        # регистры констант - после временных
+        code = self.program.code
+        for pc in range(function.entry * 4, len(code), 4):
+            for pos in _REGISTER_OPERANDS[code[pc]]:
+                if code[pc + pos] >= CONST_REGISTER:
+                    code[pc + pos] += self.frame_size - CONST_REGISTER
+        function.template = [0] * self.params + [slots.get(i, 0) for i in range(self.locals)] \
+            + [0] * (self.frame_size - self.params - self.locals) + self.const_values
+
+    def compile(self, prog: StatementListNode) -> Program:
+        funcs = [stmt for stmt in prog.exprs if isinstance(stmt, FuncDeclNode)]
+        main = Function('Main', 0)
+        self.program.functions.append(main)
+        for func in funcs:
+            self.function_index[func.name.name] = len(self.program.functions)
+            self.program.functions.append(Function(func.name.name, len(func.params.params)))
+        self.method(main, prog.var_decls, prog)
+        for func in funcs:
+            self.func = func
+            self.func_loop = any(isinstance(node, ReturnOpNode) and isinstance(node.value, FuncCallNode)
+                                 and node.value.name.name == func.name.name for node in iter_nodes(func.body))
+            self.method(self.program.functions[self.function_index[func.name.name]], func.var_decls, func.body)
+        self.func, self.func_loop = None, False
+        return self.program
+
+
+def compile_program(prog: StatementListNode) -> Program:
+    """Скомпилировать проверенную программу в байт-код"""
+    return _Compiler(prog).compile(prog)
+
+
+def _frame(function: Function) -> List:
+    """Кадр для очередного вызова функции (из пула кадров, заполненный значениями по умолчанию)"""
+    if function.depth < len(function.frames):
+        frame = function.frames[function.depth]
+        frame[:] = function.template
+    else:
+        frame = function.template[:]
+        function.frames.append(frame)
+    function.depth += 1
+    return frame
+
+
+def execute(program: Program, stdin: Optional[TextIO] = None, stdout: Optional[TextIO] = None) -> None:
+    """Выполнить программу
+    :raise ExecutionError: ошибка во время выполнения (вывод до ошибки записывается в stdout)
+    """
+    runtime = Runtime(stdin, stdout)
+    built_ins = [getattr(runtime, name) for name in BUILT_INS]
+    code, consts, functions = program.decoded(), program.consts, program.functions
+    g = list(program.globals)
+    arrays: List[Optional[list]] = [None] * len(program.arrays)
+    for function in functions:
+        function.depth = 0
+    main = functions[0]
+    r = _frame(main)
+    function = main
+    stack = []  # (адрес возврата, кадр, регистр результата, функция) вызывающих методов
+    pc = main.entry
+    op = k = 0
+    try:
+        while True:
+            op, a, b, c = code[pc]
+            pc += 1
+            # операции упорядочены по частоте (проверки идут цепочкой)
+            if op == ADD:
+                v = r[b] + r[c]
+                r[a] = v if -0x80000000 <= v <= 0x7FFFFFFF else (v + 0x80000000 & 0xFFFFFFFF) - 0x80000000
+            elif op == LDG:
+                r[a] = g[b]
+            elif op == STG:
+                g[a] = r[b]
+            elif op == JMP:
+                pc = a
+            elif op == BGE:
+                if r[b] >= r[c]:
+                    pc = a
+            elif op == BLT:
+                if r[b] < r[c]:
+                    pc = a
+            elif op == BLE:
+                if r[b] <= r[c]:
+                    pc = a
+            elif op == SUB:
+                v = r[b] - r[c]
+                r[a] = v if -0x80000000 <= v <= 0x7FFFFFFF else (v + 0x80000000 & 0xFFFFFFFF) - 0x80000000
+            elif op == LDELEM:
+                k = r[c]
+                if k < 0:
+                    raise IndexError
+                r[a] = arrays[b][k]
+            elif op == STELEM:
+                k = r[b]
+                if k < 0:
+                    raise IndexError
+                arrays[a][k] = r[c]
+            elif op == MOV:
+                r[a] = r[b]
+            elif op == BEQ:
+                if r[b] == r[c]:
+                    pc = a
+            elif op == BNE:
+                if r[b] != r[c]:
+                    pc = a
+            elif op == BGT:
+                if r[b] > r[c]:
+                    pc = a
+            elif op == MUL:
+                v = r[b] * r[c]
+                r[a] = v if -0x80000000 <= v <= 0x7FFFFFFF else (v + 0x80000000 & 0xFFFFFFFF) - 0x80000000
+            elif op == CONCAT:
+                r[a] = (r[b] or '') + (r[c] or '')
+            elif op == JZ:
+                if not r[b]:
+                    pc = a
+            elif op == JNZ:
+                if r[b]:
+                    pc = a
+            elif op == CALL:
+                if len(stack) >= CALL_DEPTH_LIMIT:
+                    raise StackOverflowError()
+                callee = functions[b]
+                frame = _frame(callee)
+                frame[:callee.params] = r[c:c + callee.params]
+                stack.append((pc, r, a, function))
+                r, function, pc = frame, callee, callee.entry
+            elif op == RET or op == RETV:
+                value = r[a] if op == RET else None
+                function.depth -= 1
+                if not stack:
+                    break
+                pc, r, dest, function = stack.pop()
+                r[dest] = value
+            elif op == LDI:
+                r[a] = b
+            elif op == LDC:
+                r[a] = consts[b]
+            elif op == DIV:
+                r[a] = divide(r[b], r[c])
+            elif op == REM:
+                r[a] = remainder(r[b], r[c])
+            elif op == FADD:
+                r[a] = r[b] + r[c]
+            elif op == FSUB:
+                r[a] = r[b] - r[c]
+            elif op == FMUL:
+                r[a] = r[b] * r[c]
+            elif op == I2S:
+                r[a] = str(r[b])
+            elif op == CALLB:
+                r[a] = built_ins[b]() if c < 0 else built_ins[b](r[c])
+            elif op == EQ:
+                r[a] = 1 if r[b] == r[c] else 0
+            elif op == NE:
+                r[a] = 1 if r[b] != r[c] else 0
+            elif op == LT:
+                r[a] = 1 if r[b] < r[c] else 0
+            elif op == LE:
+                r[a] = 1 if r[b] <= r[c] else 0
+            elif op == GT:
+                r[a] = 1 if r[b] > r[c] else 0
+            elif op == GE:
+                r[a] = 1 if r[b] >= r[c] else 0
+            elif op == SCMP:
+                r[a] = compare_str(r[b], r[c])
+            elif op == I2F:
+                r[a] = float(r[b])
+            elif op == F2S:
+                r[a] = float_str(r[b])
+            elif op == I2C:
+                r[a] = chr(r[b] & 0xFFFF)
+            elif op == NEWARR:
+                arrays[a] = [consts[c]] * b
+            else:
+                raise ExecutionError('Неизвестная операция {}'.format(op))
+    except StackOverflowError:
+        raise
+    except ExecutionError as e:
+        if e.row is None and program.rows[pc - 1]:
+            raise ExecutionError(e.message, program.rows[pc - 1])
+        raise
+    except IndexError:
+        raise ExecutionError('Индекс {} вне границ массива {}'.format(k, program.arrays[b if op == LDELEM else a]),
+                             program.rows[pc - 1] or None)
+    except TypeError:
+        if op in (LDELEM, STELEM):
+            raise ExecutionError('Массив {} не создан'.format(program.arrays[b if op == LDELEM else a]),
+                                 program.rows[pc - 1] or None)
+        raise
+    finally:
+        runtime.flush()
+
+
+def run(prog: StatementListNode, stdin: Optional[TextIO] = None, stdout: Optional[TextIO] = None) -> None:
+    """Скомпилировать и выполнить проверенную программу"""
+    execute(compile_program(prog), stdin, stdout)
@@ -1,39 +1,51 @@
 using System;
+using System.Globalization;
 
 
 namespace CompilerDemo {
 
+  // Встроенные функции языка - ровно те методы, которые вызывает code_gen.py (поведение - как у
+  // closure_exec.Runtime и msil_sim.py). Числа форматируются и разбираются без учета культуры
   class Runtime {
-    public static string read() {
+    static readonly NumberFormatInfo Format = CreateFormat();
+
+    static NumberFormatInfo CreateFormat() {
+      NumberFormatInfo format = (NumberFormatInfo) NumberFormatInfo.InvariantInfo.Clone();
+      format.PositiveInfinitySymbol = "∞";
+      format.NegativeInfinitySymbol = "-∞";
+      return format;
+    }
+
+    public static string input() {
       return Console.ReadLine();
     }
 
-    public static void print(string p0) {
+    public static void write(string p0) {
       Console.Write(p0);
     }
 
-    public static void println(string p0) {
+    public static void writeline(string p0) {
       Console.WriteLine(p0);
     }
 
     public static int to_int(string p0) {
-      return Convert.ToInt32(p0);
+      return p0 == null ? 0 : int.Parse(p0, NumberStyles.Integer, Format);
     }
 
     public static double to_float(string p0) {
-      return Convert.ToDouble(p0);
+      return p0 == null ? 0.0 : double.Parse(p0, NumberStyles.Float, Format);
     }
 
     public static string convert(int v) {
-      return Convert.ToString(v);
+      return v.ToString(Format);
     }
 
     public static string convert(double v) {
-      return Convert.ToString(v);
+      return v.ToString("R", Format);
     }
 
-    public static string convert(bool v) {
-      return Convert.ToString(v);
+    public static string convert(ushort v) {
+      return ((char) v).ToString();
     }
 
     public static string concat(string a, string b) {
@@ -41,7 +53,7 @@ namespace CompilerDemo {
     }
 
     public static int compare(string a, string b) {
-      return a.CompareTo(b);
+      return Math.Sign(string.CompareOrdinal(a, b));
     }
   }
 }
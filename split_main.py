@@ -0,0 +1,113 @@
+"""Разбиение большого Main на вспомогательные методы ограниченного размера
+
+Весь код верхнего уровня генерируется в один метод Main, и у сгенерированных программ он бывает огромным
+(время JIT-компиляции растет быстрее размера метода). Операторы верхнего уровня по порядку собираются
+в части не больше max_size узлов (оператор больше max_size занимает часть целиком), каждая часть становится
+функцией void _main{N}() без параметров, а Main только вызывает их по очереди.
+
+Глобальные переменные - статические поля, поэтому их значения переходят из части в часть. Локальные переменные
+Main (переведенные в локальные глобальные переменные, вынесенные инварианты, переменные подстановок) становятся
+локальными переменными части, если используются только в ней, иначе - снова статическими полями.
+Программа с return на верхнем уровне не разбивается (return должен завершать Main, а не часть).
+"""
+from typing import Dict, List
+
+from mel_ast import AstNode, IdentNode, DeclTypeNode, DeclListNode, ValueListNode, FuncCallNode, FuncDeclNode, \
+    StatementListNode, ReturnOpNode, DeclNode, InlineCallNode, iter_nodes
+from my_semantic_baza import IdentDesc, ScopeType, TypeDesc
+
+# Максимальный размер части Main (кол-во узлов дерева, примерно соответствует кол-ву инструкций)
+MAIN_CHUNK_SIZE = 2000
+
+
+def _chunks(stmts: List[AstNode], max_size: int) -> List[List[AstNode]]:
+    chunks: List[List[AstNode]] = []
+    size = max_size
+    for stmt in stmts:
+        stmt_size = sum(1 for _ in iter_nodes(stmt))
+        if size + stmt_size > max_size:
+            chunks.append([])
+            size = 0
+        chunks[-1].append(stmt)
+        size += stmt_size
+    return chunks
+
+
+def _has_return(stmt: AstNode) -> bool:
+    """Есть ли в операторе return (кроме return подставленных функций)"""
+    nodes = list(iter_nodes(stmt))
+    inlined = {id(n) for node in nodes if isinstance(node, InlineCallNode) for n in iter_nodes(node.body)}
+    return any(isinstance(node, ReturnOpNode) and id(node) not in inlined for node in nodes)
+
+
+def _helper_name(n: int, names) -> str:
+    name = '_main{}'.format(n)
+    while name in names:
+        name = '_' + name
+    return name
+
+
+def split_main(prog: StatementListNode, max_size: int = MAIN_CHUNK_SIZE) -> int:
+    """Разбить код верхнего уровня на вспомогательные методы (дерево изменяется на месте)
+    :return: кол-во вспомогательных методов (0 - Main не разбит)
+    """
+    funcs = [stmt for stmt in prog.exprs if isinstance(stmt, FuncDeclNode)]
+    stmts = [stmt for stmt in prog.exprs if not isinstance(stmt, FuncDeclNode)]
+    if any(_has_return(stmt) for stmt in stmts):
+        return 0
+    chunks = _chunks(stmts, max_size)
+    if len(chunks) < 2:
+        return 0
+
+    # в каких частях используются локальные переменные Main
+    chunk_locals: List[Dict[IdentDesc, None]] = []  # словари как упорядоченные множества
+    users: Dict[IdentDesc, int] = {}
+    for chunk in chunks:
+        idents = {}
+        for stmt in chunk:
+            for node in iter_nodes(stmt):
+                ident = node.node_ident
+                if ident is not None and ident.scope == ScopeType.LOCAL:
+                    idents[ident] = None
+        for ident in idents:
+            users[ident] = users.get(ident, 0) + 1
+        chunk_locals.append(idents)
+
+    decls: Dict[IdentDesc, DeclNode] = {}
+    for decl in prog.var_decls:
+        decls.setdefault(decl.ident.node_ident, decl)
+    next_global = max((decl.ident.node_ident.index + 1 for decl in prog.var_decls
+                       if decl.ident.node_ident.scope == ScopeType.GLOBAL), default=0)
+    for decl in decls.values():
+        ident = decl.ident.node_ident
+        if ident.scope == ScopeType.LOCAL and users.get(ident, 0) > 1:
+            ident.scope, ident.index = ScopeType.GLOBAL, next_global
+            next_global += 1
+
+    names = {func.name.name for func in funcs}
+    helpers, calls = [], []
+    for n, (chunk, idents) in enumerate(zip(chunks, chunk_locals)):
+        name = _helper_name(n, names)
+        func_ident = IdentDesc(name, TypeDesc(None, TypeDesc.VOID, ()))
+        var_decls = []
+        for ident in idents:
+            if ident.scope == ScopeType.LOCAL:
+                ident.index = len(var_decls)
+                var_decls.append(decls[ident])
+
+        func_type = DeclTypeNode('void')
+        func_type.node_type = TypeDesc.VOID
+        helper = FuncDeclNode(func_type, IdentNode(name), DeclListNode(), StatementListNode(*chunk), row=chunk[0].row)
+        helper.name.node_type, helper.name.node_ident = func_ident.type, func_ident
+        helper.body.node_type = helper.node_type = TypeDesc.VOID
+        helper.var_decls = var_decls
+        helpers.append(helper)
+
+        call = FuncCallNode(IdentNode(name), ValueListNode(), row=chunk[0].row)
+        call.name.node_type, call.name.node_ident = func_ident.type, func_ident
+        call.node_type = TypeDesc.VOID
+        calls.append(call)
+
+    prog.exprs = tuple(funcs + helpers + calls)
+    prog.var_decls = [decl for decl in prog.var_decls if decl.ident.node_ident.scope == ScopeType.GLOBAL]
+    return len(helpers)
@@ -20,14 +20,22 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-import inspect
-
 __all__ = ['on', 'when']
 
 
+# (module, qualified name) -> Dispatcher created by @on; @when finds its dispatcher
+# here instead of looking at the caller's frame locals
+_dispatchers = {}
+
+
+def _key(fn):
+    return fn.__module__, fn.__qualname__
+
+
 def on(param_name):
     def f(fn):
         dispatcher = Dispatcher(param_name, fn)
+        _dispatchers[_key(fn)] = dispatcher
         return dispatcher
 
     return f
@@ -35,15 +43,24 @@ def on(param_name):
 
 def when(param_type):
     def f(fn):
-        frame = inspect.currentframe().f_back
-        func_name = fn.func_name if 'func_name' in dir(fn) else fn.__name__
-        dispatcher = frame.f_locals[func_name]
-        if not isinstance(dispatcher, Dispatcher):
-            dispatcher = dispatcher.dispatcher
+        try:
+            dispatcher = _dispatchers[_key(fn)]
+        except KeyError:
+            raise LookupError('no @on dispatcher for {}.{}'.format(*_key(fn))) from None
         dispatcher.add_target(param_type, fn)
 
+        # one hop: the cache lookup is inlined here instead of going through Dispatcher.__call__
+        cache = dispatcher.cache
+        resolve = dispatcher.resolve
+        param_index = dispatcher.param_index
+
         def ff(*args, **kw):
-            return dispatcher(*args, **kw)
+            typ = args[param_index].__class__
+            try:
+                target = cache[typ]
+            except KeyError:
+                target = resolve(typ)
+            return target(*args, **kw)
 
         ff.dispatcher = dispatcher
         return ff
@@ -51,32 +68,38 @@ def when(param_type):
     return f
 
 
+def _no_target(*args, **kw):
+    return None
+
+
 class Dispatcher(object):
     def __init__(self, param_name, fn):
-        frame = inspect.currentframe().f_back.f_back
-        top_level = frame.f_locals == frame.f_globals
-        self.param_index = self.__argspec(fn).args.index(param_name)
+        code = fn.__code__
+        self.param_index = code.co_varnames[:code.co_argcount].index(param_name)
         self.param_name = param_name
         self.targets = {}
+        # class -> target resolved through the class MRO (shared with the `when` wrappers, never rebound)
+        self.cache = {}
 
     def __call__(self, *args, **kw):
         typ = args[self.param_index].__class__
-        d = self.targets.get(typ)
-        if d is not None:
-            return d(*args, **kw)
+        try:
+            target = self.cache[typ]
+        except KeyError:
+            target = self.resolve(typ)
+        return target(*args, **kw)
+
+    def resolve(self, typ):
+        """Find the target for the nearest class in typ's MRO and cache it."""
+        for base in typ.__mro__:
+            target = self.targets.get(base)
+            if target is not None:
+                break
         else:
-            issub = issubclass
-            t = self.targets
-            ks = iter(t)
-            return [t[k](*args, **kw) for k in ks if issub(typ, k)]
+            target = _no_target
+        self.cache[typ] = target
+        return target
 
     def add_target(self, typ, target):
         self.targets[typ] = target
-
-    @staticmethod
-    def __argspec(fn):
-        # Support for Python 3 type hints requires inspect.getfullargspec
-        if hasattr(inspect, 'getfullargspec'):
-            return inspect.getfullargspec(fn)
-        else:
-            return inspect.getargspec(fn)
+        self.cache.clear()